@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+from functools import partial
+import time
+import uuid
 import pandas as pd
 import streamlit as st
-from macrocoach_v2.settings import APP_TITLE, APP_ICON, configure_matplotlib_fonts, DB_PATH
-from macrocoach_v2.data.db import init_db, ensure_intake_table
-from macrocoach_v2.ui.sidebar import render_sidebar
+from macrocoach_v2.settings import APP_TITLE, APP_ICON, SHOW_TIMINGS
+from macrocoach_v2.data.db import init_db
+from macrocoach_v2.data.athletes import db_path
+from macrocoach_v2.data.journal import set_session
+from macrocoach_v2.data.backup import start_backup_job
+from macrocoach_v2.ui.sidebar import render_athlete_selector, render_sidebar
 from macrocoach_v2.ui.tabs_plan import render_tab_plan
 from macrocoach_v2.ui.tabs_intake import render_tab_intake
 from macrocoach_v2.ui.tabs_manual import render_tab_manual
@@ -23,20 +29,28 @@ def _init_session_defaults():
     ss.setdefault('t2_perf', 0.0)
 
 def main():
+    t0 = time.perf_counter()
     st.set_page_config(page_title=APP_TITLE, page_icon=APP_ICON, layout='wide')
-    configure_matplotlib_fonts()
     pd.set_option('future.no_silent_downcasting', True)
     st.title(APP_TITLE)
-    init_db(); ensure_intake_table(); _init_session_defaults()
+    # 先选定运动员（决定本次重跑的库文件），再做任何数据库访问；撤销/重做按浏览器会话分栈
+    render_athlete_selector()
+    set_session(st.session_state.setdefault('journal_session', uuid.uuid4().hex[:12]))
+    init_db(); start_backup_job(); _init_session_defaults()
     side = render_sidebar()
-    T1, T5, T2, T3, T6, T4 = st.tabs(['📅 今日计划', '🍽️ 实时摄入', '📝 手动录入（日常指标）', '📈 报告与曲线（交互）', '📆 周期调度', '📤 导入/导出'])
-    with T1: render_tab_plan(side)
-    with T5: render_tab_intake(side)
-    with T2: render_tab_manual(side)
-    with T3: render_tab_report(side)
-    with T6: render_tab_scheduler(side)
-    with T4: render_tab_import_export(DB_PATH)
+    # 仅执行当前页面：切页/提交表单时其它页面的查询与作图不会重跑
+    pages = [
+        st.Page(partial(render_tab_plan, side), title='今日计划', icon='📅', url_path='plan', default=True),
+        st.Page(partial(render_tab_intake, side), title='实时摄入', icon='🍽️', url_path='intake'),
+        st.Page(partial(render_tab_manual, side), title='手动录入（日常指标）', icon='📝', url_path='manual'),
+        st.Page(partial(render_tab_report, side), title='报告与曲线（交互）', icon='📈', url_path='report'),
+        st.Page(partial(render_tab_scheduler, side), title='周期调度', icon='📆', url_path='scheduler'),
+        st.Page(partial(render_tab_import_export, db_path()), title='导入/导出', icon='📤', url_path='import-export'),
+    ]
+    st.navigation(pages, position='top').run()
     st.caption('提示：若按 1% BW/week 调速，但因 EA 守门而不变，说明当日运动+FFM 要求的最低摄入更高——已在“🧮 代谢/负荷”区域列出对比。')
+    if SHOW_TIMINGS:
+        st.caption(f'⏱ 本次渲染 {(time.perf_counter() - t0) * 1000:.0f} ms')
 
 if __name__ == '__main__':
     main()
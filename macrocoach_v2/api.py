@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from .settings import API_HOST, API_PORT, API_WORKERS, INTAKE_QUEUE_ROWS, INTAKE_QUEUE_MS
+from .data.athletes import DEFAULT_ATHLETE, athlete_exists, athlete_paths, use_athlete
+from .data.journal import set_session
+
+# 本地 HTTP API（asyncio + 标准库，HTTP/1.1 keep-alive，JSON 进出）：python -m macrocoach_v2.api serve
+# 事件循环只做解析与调度；SQLite 读放进有上限的线程池。摄入写入进写后队列（data/intake_queue.py）组提交：
+# 响应在所在批次提交后返回（之后的读取能看到本次写入）。
+# 运动员由查询参数 athlete= 或请求头 X-Athlete 指定，缺省为默认运动员；须是已有的运动员（见 list_athletes），API 不新建；
+# 撤销/重做的会话由 session= 或 X-Session 指定，缺省为 'api'（各客户端应各用一个会话，互不撤销对方的写入）。
+MEAL_TAGS = ('早餐', '午餐', '晚餐', '加餐', '训练前', '训练后', '其他')
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+_MAX_BODY = 1 << 20
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _in_athlete(athlete: str, fn: Callable, *args, **kw):
+    # 线程池中执行：线程不继承事件循环侧的 ContextVar，这里显式切换到请求的运动员
+    from .data.db import init_db
+    with use_athlete(athlete):
+        init_db()
+        return fn(*args, **kw)
+
+def _num(body: Dict[str, Any], k: str, default: float = 0.0, lo: float = 0.0, hi: float = 1e5) -> float:
+    v = body.get(k, default)
+    try:
+        v = float(v if v is not None else default)
+    except (TypeError, ValueError):
+        raise HttpError(400, f'{k} 需为数字')
+    if not lo <= v <= hi:
+        raise HttpError(400, f'{k} 超出范围 [{lo:g}, {hi:g}]')
+    return v
+
+def _day(v: Optional[str]) -> str:
+    if not v:
+        return date.today().isoformat()
+    try:
+        return date.fromisoformat(str(v)).isoformat()
+    except ValueError:
+        raise HttpError(400, f'日期格式应为 YYYY-MM-DD：{v}')
+
+def _intake_row(body: Dict[str, Any]) -> Tuple[str, str, float, float, float, float, str]:
+    if not isinstance(body, dict):
+        raise HttpError(400, '每条摄入记录需为 JSON 对象')
+    tag = str(body.get('meal_tag') or '其他')
+    if tag not in MEAL_TAGS:
+        raise HttpError(400, f'meal_tag 取值：{"/".join(MEAL_TAGS)}')
+    p, f, c = _num(body, 'protein_g'), _num(body, 'fat_g'), _num(body, 'carb_g')
+    # 未给 kcal 时按宏量换算，与录入页一致
+    kcal = _num(body, 'kcal', p*4 + f*9 + c*4)
+    return (_day(body.get('date')), tag, kcal, p, f, c, str(body.get('note') or '')[:500])
+
+# —— 同步处理函数：在线程池中、已切换到请求的运动员后执行 ——
+def _targets(d: str) -> Optional[Dict[str, Any]]:
+    from .data.db import df_from_sql
+    df = df_from_sql('SELECT * FROM daily_targets WHERE date = ?', (d,))
+    return None if len(df) == 0 else {k: (None if v != v else v) for k, v in df.iloc[0].to_dict().items()}
+
+def _predict() -> Dict[str, Any]:
+    from .data.db import load_history_state
+    from .services.planner import predict_next_day
+    state = load_history_state()
+    return {'as_of': state.last_date, **predict_next_day(None, state)}
+
+def _plan(body: Dict[str, Any]) -> Dict[str, Any]:
+    # 与“今日计划”相同的输入；资料取运动员目录下的 profile.json，可被请求体中同名字段覆盖。save=true 时写入日指标与日目标
+    from .domain.models import ActivityBlock
+    from .data.db import transaction, upsert_metrics, upsert_targets, load_history_state
+    from .services.planner import plan_day
+    from .services.profile import load_profile, user_profile, pid_config
+    from .services.tdee import tdee_factor_for
+    d = _day(body.get('date'))
+    cfg = load_profile()
+    profile, activities = body.get('profile') or {}, body.get('activities') or []
+    if not isinstance(profile, dict):
+        raise HttpError(400, 'profile 需为 JSON 对象')
+    if not isinstance(activities, list) or not all(isinstance(a, dict) for a in activities):
+        raise HttpError(400, 'activities 需为对象数组')
+    cfg.update({k: v for k, v in profile.items() if k in cfg})
+    acts = []
+    for a in activities:
+        if a.get('name') not in ('badminton', 'strength', 'cardio') or a.get('intensity') not in ('low', 'moderate', 'high'):
+            raise HttpError(400, 'activities 项需为 {name: badminton/strength/cardio, minutes, intensity: low/moderate/high}')
+        if _num(a, 'minutes', 0.0, 0.0, 1440.0) > 0:
+            acts.append(ActivityBlock(a['name'], float(a['minutes']), a['intensity']))
+    weight = _num(body, 'weight', 0.0, 0.0, 400.0)
+    steps = int(_num(body, 'steps', float(cfg['steps']), 0.0, 200000.0))
+    fatigue, sleep_h, perf = int(_num(body, 'fatigue', 4, 1, 10)), _num(body, 'sleep_h', 7.5, 0, 24), _num(body, 'perf_pct', 0.0, -100, 100)
+    tdee = tdee_factor_for(d) if cfg['adaptive_tdee'] else None
+    current_w = weight if weight > 0 else float(cfg['weight_kg'])
+    res = plan_day(
+        user_profile(cfg), acts, steps if steps > 0 else None, bool(cfg['auto_mode']),
+        current_w * float(cfg['loss_rate_pct']) / 100.0, pid_config(cfg),
+        fatigue, sleep_h, perf, bool(body.get('apply_suggestions')), None, weight if weight > 0 else None,
+        protein_basis=str(cfg['protein_basis']), protein_per_kg_ffm=float(cfg['protein_per_kg_ffm']),
+        ea_min=float(cfg['ea_min']), ea_pref=float(cfg['ea_pref']),
+        training_day_carb_bump_g_per_kg=float(cfg['training_bump']), training_load_threshold=float(cfg['training_threshold']),
+        hist_state=load_history_state(), tdee_factor=tdee['factor'] if tdee else None,
+    )
+    if body.get('save'):
+        with transaction():
+            upsert_metrics(d, {
+                'weight': current_w, 'steps': steps, 'exercise_min': sum(a.minutes for a in acts),
+                'sleep_h': sleep_h, 'fatigue': fatigue, 'perf_pct': perf,
+                'avg_hr': None, 'max_hr': None, 'load_index': float(res['load_index']),
+            })
+            upsert_targets(d, {k: res[k] for k in ['target_kcal','protein_g','fat_g','carb_g','bmr','pal','tdee_used','tdee_formula','deficit','ea']},
+                           notes='；'.join(str(x) for x in res['notes']), ea_guard_applied=1 if res['ea'] < float(cfg['ea_min']) else 0,
+                           day_type='deficit' if res['deficit'] > 0 else 'maintain', source='plan')
+    return {'date': d, 'saved': bool(body.get('save')), **res}
+
+class ApiServer:
+    def __init__(self, workers: int = API_WORKERS, batch_rows: int = INTAKE_QUEUE_ROWS, batch_ms: float = INTAKE_QUEUE_MS):
+        from .data.intake_queue import IntakeQueue
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix='macrocoach-api')
+        self.queue = IntakeQueue(batch_rows, batch_ms)
+        self.requests = 0
+        self.routes: Dict[Tuple[str, str], Callable] = {
+            ('GET', '/health'): self.health,
+            ('POST', '/intake'): self.add_intake,
+            ('GET', '/intake/sums'): self.intake_sums,
+            ('GET', '/targets'): self.targets,
+            ('POST', '/plan'): self.plan,
+            ('GET', '/predict'): self.predict,
+            ('POST', '/undo'): self.undo,
+            ('POST', '/redo'): self.redo,
+        }
+
+    async def _call(self, athlete: str, fn: Callable, *args) -> Any:
+        # 带上当前上下文（请求的会话）进线程池
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.pool, ctx.run, partial(_in_athlete, athlete, fn, *args))
+
+    async def health(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        return {'ok': True, 'requests': self.requests, 'intake_batches': self.queue.stats()}
+
+    async def add_intake(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        # 单条对象或对象数组；返回新记录 id
+        rows = [_intake_row(b) for b in (body if isinstance(body, list) else [body])]
+        if not rows:
+            raise HttpError(400, '没有摄入记录')
+        futs = [self.queue.put(*row, athlete=athlete) for row in rows]
+        ids = await asyncio.gather(*[asyncio.wrap_future(f) for f in futs])
+        return {'ids': ids} if isinstance(body, list) else {'id': ids[0]}
+
+    async def intake_sums(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        from .data.db import intake_sums
+        d = _day(q.get('date'))
+        return {'date': d, **await self._call(athlete, intake_sums, d)}
+
+    async def targets(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        d = _day(q.get('date'))
+        row = await self._call(athlete, _targets, d)
+        if row is None:
+            raise HttpError(404, f'{d} 尚无日目标')
+        return row
+
+    async def plan(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        if not isinstance(body, dict):
+            raise HttpError(400, '请求体需为 JSON 对象')
+        return await self._call(athlete, _plan, body)
+
+    async def predict(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        return await self._call(athlete, _predict)
+
+    async def _step(self, athlete: str, redo: bool) -> Dict[str, Any]:
+        from .data.db import undo, redo as redo_
+        # 先等本运动员已入队的摄入落库，撤销记录才完整
+        await self._call(athlete, self.queue.flush)
+        res = await self._call(athlete, redo_ if redo else undo)
+        if res is None:
+            raise HttpError(404, '没有可重做的操作' if redo else '没有可撤销的操作')
+        return res
+
+    async def undo(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        return await self._step(athlete, False)
+
+    async def redo(self, athlete: str, q: Dict[str, str], body: Any) -> Dict[str, Any]:
+        return await self._step(athlete, True)
+
+    async def dispatch(self, method: str, target: str, headers: Dict[str, str], raw: bytes) -> Tuple[int, Any]:
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            known = any(path == url.path for _, path in self.routes)
+            return (405 if known else 404), {'error': f'{method} {url.path} 不存在'}
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        athlete = q.pop('athlete', None) or headers.get('x-athlete') or DEFAULT_ATHLETE
+        # 每个连接是一个 asyncio 任务（独立的上下文）：按请求设置会话，摄入入队与线程池调用都会带上
+        set_session((q.pop('session', None) or headers.get('x-session') or 'api')[:64])
+        try:
+            try:
+                athlete_paths(athlete)
+            except ValueError as e:
+                raise HttpError(400, str(e))
+            if not athlete_exists(athlete):
+                raise HttpError(404, f'运动员不存在：{athlete}')
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                raise HttpError(400, '请求体不是合法 JSON')
+            return 200, await handler(athlete, q, body)
+        except HttpError as e:
+            return e.status, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f'{type(e).__name__}: {e}'}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(':') for l in lines[1:] if ':' in l)}
+                # 长度非法或超限时无法定位下一个请求的起点：回错误后关闭连接
+                try:
+                    n = int(headers.get('content-length') or 0)
+                except ValueError:
+                    n = -1
+                if n < 0:
+                    status, payload, raw = 400, {'error': 'Content-Length 需为非负整数'}, None
+                elif n > _MAX_BODY:
+                    status, payload, raw = 413, {'error': f'请求体过大（上限 {_MAX_BODY} 字节）'}, None
+                else:
+                    raw = await reader.readexactly(n) if n else b''
+                    self.requests += 1
+                    status, payload = await self.dispatch(method.upper(), target, headers, raw)
+                keep = raw is not None and version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+                writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                             f'Content-Length: {len(data)}\r\nConnection: {"keep-alive" if keep else "close"}\r\n\r\n'.encode('latin-1') + data)
+                await writer.drain()
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = API_HOST, port: int = API_PORT, ready: Optional[Callable[[int], None]] = None) -> None:
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        if ready:
+            ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.queue.close()
+            self.pool.shutdown(wait=True)
+
+# —— 本地压测：若干 keep-alive 连接并发 POST /intake，最后核对当日汇总 ——
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                   body: Optional[Dict[str, Any]] = None) -> Tuple[int, Any]:
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8') if body is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    n = next(int(l.partition(':')[2]) for l in head if l.lower().startswith('content-length'))
+    return int(head[0].split(' ')[1]), json.loads(await reader.readexactly(n))
+
+async def load_test(host: str, port: int, requests: int, concurrency: int, athlete: str = '') -> Dict[str, Any]:
+    d = date.today().isoformat()
+    suffix = f'?athlete={athlete}' if athlete else ''
+    reader, writer = await asyncio.open_connection(host, port)
+    _, before = await _request(reader, writer, 'GET', f'/intake/sums?date={d}' + (f'&athlete={athlete}' if athlete else ''))
+    lat: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client() -> None:
+        nonlocal errors
+        r, w = await asyncio.open_connection(host, port)
+        try:
+            for _ in counter:
+                t = time.perf_counter()
+                status, _ = await _request(r, w, 'POST', '/intake' + suffix,
+                                           {'date': d, 'meal_tag': '加餐', 'kcal': 1, 'protein_g': 0, 'fat_g': 0, 'carb_g': 0, 'note': 'loadtest'})
+                lat.append(time.perf_counter() - t)
+                errors += status != 200
+        finally:
+            w.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(max(1, concurrency))])
+    elapsed = time.perf_counter() - t0
+    _, after = await _request(reader, writer, 'GET', f'/intake/sums?date={d}' + (f'&athlete={athlete}' if athlete else ''))
+    _, health = await _request(reader, writer, 'GET', '/health')
+    writer.close()
+    lat.sort()
+    pct = lambda p: round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000.0, 2) if lat else None
+    return {'requests': len(lat), 'concurrency': concurrency, 'seconds': round(elapsed, 3), 'rps': round(len(lat) / elapsed, 1),
+            'p50_ms': pct(0.50), 'p99_ms': pct(0.99), 'errors': errors,
+            'kcal_added': round(after['kcal'] - before['kcal'], 3), 'intake_batches': health['intake_batches']}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _spawn_server(port: int, workdir: str, args: argparse.Namespace) -> subprocess.Popen:
+    # 压测默认打到临时库上，不触碰真实数据
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, MACRO_COACH_DB_PATH=os.path.join(workdir, 'loadtest.db'), MACRO_COACH_ATHLETES_DIR='',
+               MACRO_COACH_BACKUP_INTERVAL_MIN='0', PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    cmd = [sys.executable, '-m', 'macrocoach_v2.api', 'serve', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(args.workers), '--batch-rows', str(args.batch_rows), '--batch-ms', str(args.batch_ms)]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError(proc.stderr.read().decode('utf-8', 'replace'))
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError('压测服务未能启动')
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog='python -m macrocoach_v2.api', description='MacroCoach 本地 HTTP API')
+    sub = p.add_subparsers(dest='cmd', required=True)
+    for name in ('serve', 'loadtest'):
+        sp = sub.add_parser(name)
+        sp.add_argument('--workers', type=int, default=API_WORKERS, help='SQLite 线程池大小')
+        sp.add_argument('--batch-rows', type=int, default=INTAKE_QUEUE_ROWS, help='每批最多摄入行数')
+        sp.add_argument('--batch-ms', type=float, default=INTAKE_QUEUE_MS, help='攒批等待毫秒')
+        if name == 'serve':
+            sp.add_argument('--host', default=API_HOST)
+            sp.add_argument('--port', type=int, default=API_PORT)
+        else:
+            sp.add_argument('--requests', type=int, default=20000)
+            sp.add_argument('--concurrency', type=int, default=64)
+            sp.add_argument('--url', default=None, help='压测已运行的服务（host:port）；缺省启动一个临时库上的服务')
+            sp.add_argument('--athlete', default='', help='配合 --url 使用')
+    args = p.parse_args(argv)
+    if args.cmd == 'serve':
+        server = ApiServer(args.workers, args.batch_rows, args.batch_ms)
+        try:
+            asyncio.run(server.serve(args.host, args.port, lambda port: print(f'listening on http://{args.host}:{port}', flush=True)))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.url:
+        host, _, port = args.url.replace('http://', '').rstrip('/').rpartition(':')
+        res = asyncio.run(load_test(host or '127.0.0.1', int(port), args.requests, args.concurrency, args.athlete))
+    else:
+        with tempfile.TemporaryDirectory(prefix='macrocoach-loadtest-') as workdir:
+            port = _free_port()
+            proc = _spawn_server(port, workdir, args)
+            try:
+                res = asyncio.run(load_test('127.0.0.1', port, args.requests, args.concurrency))
+            finally:
+                proc.terminate(); proc.wait()
+    print(json.dumps(res, ensure_ascii=False))
+    return 1 if res['errors'] or abs(res['kcal_added'] - res['requests']) > 1e-6 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
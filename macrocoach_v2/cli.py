@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+from .data.athletes import DEFAULT_ATHLETE, athlete_exists, athlete_paths, list_athletes, use_athlete
+from .data.journal import use_session
+from .services.profile import PROFILE_FILE, load_profile, user_profile, pid_config, macros
+
+# 无界面批处理入口：python -m macrocoach_v2.cli <命令> [--athlete 名字 ... | --all-athletes] [--workers N]
+# 只依赖 domain / services / data（不导入 Streamlit）；重模块在子命令内部按需导入，保持冷启动小。
+# 每位运动员一个任务，多位运动员时分给进程池（各自的库文件，写入互不加锁）；结果逐行输出 JSON。
+
+# —— 各子命令：在 use_athlete 内执行，返回可 JSON 序列化的结果 ——
+def job_rollups(name: str, opts: Dict[str, object]) -> Dict[str, object]:
+    from .data.db import verify_intake_daily, rebuild_intake_daily, rebuild_history_state
+    from .services.tdee import update_tdee_estimates
+    today = date.fromisoformat(opts['today'])
+    drift = len(verify_intake_daily())
+    rebuilt = rebuild_intake_daily() if drift or opts.get('rebuild') else None
+    state = rebuild_history_state()
+    return {'intake_daily_drift': drift, 'intake_daily_rebuilt': rebuilt,
+            'tdee_days_added': update_tdee_estimates(today), 'metrics_last_date': state.last_date}
+
+def job_schedule(name: str, opts: Dict[str, object]) -> Dict[str, object]:
+    from .services.schedule import ScheduleJob, schedule_many, athlete_writer
+    cfg = load_profile(name, opts.get('profile'))
+    protein_g, fat_g = macros(cfg)
+    start = date.fromisoformat(opts['start']) if opts.get('start') else date.fromisoformat(opts['today'])
+    job = ScheduleJob(name, user_profile(cfg), protein_g, fat_g, float(cfg['deficit']), float(cfg['baseline_pal']))
+    written = schedule_many([job], start, int(opts['days']), str(opts['mode']), opts.get('cycle'), tuple(opts.get('diet_break') or (0, 0)),
+                            writer=athlete_writer(str(opts['mode']), bool(opts.get('overwrite'))))
+    return {'start': start.isoformat(), 'days': int(opts['days']), 'written': written.get(name, 0)}
+
+def job_plan(name: str, opts: Dict[str, object]) -> Dict[str, object]:
+    # 按已存的日指标重放“今日计划”并写入（source=backfill），即无需点击界面的计划生成
+    from .services.backfill import replay_targets, diff_targets, write_targets
+    cfg = load_profile(name, opts.get('profile'))
+    today = date.fromisoformat(opts['today'])
+    start = date.fromisoformat(opts['start']) if opts.get('start') else today - timedelta(days=1)
+    end = date.fromisoformat(opts['end']) if opts.get('end') else today
+    new = replay_targets(
+        user_profile(cfg), start, end, float(cfg['loss_rate_pct']), bool(cfg['auto_mode']),
+        pid_config(cfg),
+        protein_basis=str(cfg['protein_basis']), protein_per_kg_ffm=float(cfg['protein_per_kg_ffm']),
+        ea_min=float(cfg['ea_min']), ea_pref=float(cfg['ea_pref']),
+        training_day_carb_bump_g_per_kg=float(cfg['training_bump']), training_load_threshold=float(cfg['training_threshold']),
+        adaptive_tdee=bool(cfg['adaptive_tdee']),
+    )
+    changed = len(diff_targets(new)) if len(new) else 0
+    written = write_targets(new) if len(new) and not opts.get('dry_run') else 0
+    return {'start': start.isoformat(), 'end': end.isoformat(), 'days': len(new), 'changed': changed, 'written': written}
+
+def job_predict(name: str, opts: Dict[str, object]) -> Dict[str, object]:
+    from .data.db import load_history_state
+    from .services.planner import predict_next_day
+    from .services.tdee import tdee_factor_for
+    today = date.fromisoformat(opts['today'])
+    state = load_history_state()
+    tdee = tdee_factor_for(today.isoformat(), today)
+    return {'as_of': state.last_date, **predict_next_day(None, state), 'tdee_factor': tdee['factor'] if tdee else None}
+
+def job_nightly(name: str, opts: Dict[str, object]) -> Dict[str, object]:
+    return {'rollups': job_rollups(name, opts), 'plan': job_plan(name, opts),
+            'schedule': job_schedule(name, opts), 'predict': job_predict(name, opts)}
+
+JOBS = {'rollups': job_rollups, 'schedule': job_schedule, 'plan': job_plan, 'predict': job_predict, 'nightly': job_nightly}
+
+def _run_one(args: Tuple[str, str, Dict[str, object]]) -> Dict[str, object]:
+    cmd, name, opts = args
+    t0 = time.perf_counter()
+    try:
+        from .data.db import init_db
+        # 批处理的写入记在 'cli' 会话名下，不混入界面会话的撤销栈
+        with use_athlete(name), use_session('cli'):
+            init_db()
+            out = {'athlete': name, 'ok': True, **JOBS[cmd](name, opts)}
+    except Exception as e:
+        out = {'athlete': name, 'ok': False, 'error': f'{type(e).__name__}: {e}'}
+    out['ms'] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return out
+
+def run_jobs(cmd: str, athletes: List[str], opts: Dict[str, object], workers: Optional[int] = None) -> List[Dict[str, object]]:
+    # 单人或 workers<=1 时在本进程执行；否则每位运动员一个任务交给进程池，结果按输入顺序返回
+    tasks = [(cmd, a, opts) for a in athletes]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [_run_one(t) for t in tasks]
+    # 先在父进程导入核心模块：fork 出的子进程直接继承，不必各自再导入一遍 pandas/numpy
+    for m in CORE_MODULES:
+        importlib.import_module(m)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(_run_one, tasks))
+
+# —— 导入耗时：每个组合在新的解释器中测量，取中位数 ——
+CORE_MODULES = ['macrocoach_v2.data.db', 'macrocoach_v2.services.planner', 'macrocoach_v2.services.schedule',
+                'macrocoach_v2.services.backfill', 'macrocoach_v2.services.tdee', 'macrocoach_v2.services.analytics']
+UI_MODULES = ['macrocoach_v2.ui.sidebar', 'macrocoach_v2.ui.tabs_plan', 'macrocoach_v2.ui.tabs_intake', 'macrocoach_v2.ui.tabs_manual',
+              'macrocoach_v2.ui.tabs_report', 'macrocoach_v2.ui.tabs_scheduler', 'macrocoach_v2.ui.tabs_import_export']
+
+def _import_ms(modules: List[str]) -> Tuple[float, bool]:
+    code = ('import time, sys, importlib; t = time.perf_counter()\n'
+            f'for m in {modules!r}: importlib.import_module(m)\n'
+            "print((time.perf_counter() - t) * 1000.0, 'streamlit' in sys.modules)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, env=env).stdout.split()
+    return float(out[0]), out[1] == 'True'
+
+def import_times(repeat: int = 5) -> Dict[str, Dict[str, object]]:
+    res = {}
+    for label, mods in (('core', CORE_MODULES), ('core+ui', CORE_MODULES + UI_MODULES)):
+        runs = [_import_ms(mods) for _ in range(max(1, repeat))]
+        ms = sorted(r[0] for r in runs)
+        res[label] = {'median_ms': round(ms[len(ms) // 2], 1), 'min_ms': round(ms[0], 1), 'streamlit_loaded': runs[0][1]}
+    return res
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='python -m macrocoach_v2.cli', description='MacroCoach 无界面批处理（夜间计划/汇总/预测）')
+    sub = p.add_subparsers(dest='cmd', required=True)
+
+    def add_common(sp: argparse.ArgumentParser) -> None:
+        g = sp.add_mutually_exclusive_group()
+        g.add_argument('--athlete', action='append', default=None, help='运动员名称，可重复；缺省为默认运动员')
+        g.add_argument('--all-athletes', action='store_true', help='处理 ATHLETES_DIR 下的全部运动员（含默认）')
+        sp.add_argument('--workers', type=int, default=None, help='进程数；缺省为 CPU 数（不超过运动员数）')
+        sp.add_argument('--today', default=None, help='以该日期为“今天”（YYYY-MM-DD），便于补跑')
+
+    def add_schedule(sp: argparse.ArgumentParser) -> None:
+        sp.add_argument('--days', type=int, default=28)
+        sp.add_argument('--mode', default='5+2', choices=['continuous', '5+2', 'matador_2+2', 'custom'])
+        sp.add_argument('--cycle', type=int, nargs=2, metavar=('ON', 'OFF'), help='mode=custom 时的缺口/维持天数')
+        sp.add_argument('--diet-break', type=int, nargs=2, metavar=('EVERY', 'LEN'), help='每 EVERY 天后插入 LEN 天维持')
+        sp.add_argument('--overwrite', action='store_true', help='覆盖“今日计划”/回算已写入的日期')
+
+    def add_plan(sp: argparse.ArgumentParser) -> None:
+        sp.add_argument('--end', default=None, help='重放结束日期；缺省为今天')
+        sp.add_argument('--dry-run', action='store_true', help='只统计变化，不写入')
+
+    for cmd, help_ in (('rollups', '校验/重建 intake_daily，推进 TDEE 估计与日指标状态'),
+                       ('schedule', '预生成未来 N 天日目标'),
+                       ('plan', '按已存日指标重放“今日计划”并写入（缺省：昨天与今天）'),
+                       ('predict', '计算次日训练/赤字建议'),
+                       ('nightly', '依次执行 rollups、plan、schedule、predict')):
+        sp = sub.add_parser(cmd, help=help_)
+        add_common(sp)
+        sp.add_argument('--profile', default=None, help=f'资料 JSON；缺省为运动员目录下的 {PROFILE_FILE}')
+        if cmd in ('schedule', 'plan'):
+            sp.add_argument('--start', default=None, help='开始日期；schedule 缺省为今天，plan 缺省为昨天')
+        if cmd in ('schedule', 'nightly'):
+            add_schedule(sp)
+        if cmd in ('plan', 'nightly'):
+            add_plan(sp)
+        if cmd == 'rollups':
+            sp.add_argument('--rebuild', action='store_true', help='无漂移也重建 intake_daily')
+
+    sub.add_parser('athletes', help='列出运动员')
+    it = sub.add_parser('import-time', help='测量核心包与含界面层的导入耗时')
+    it.add_argument('--repeat', type=int, default=5)
+    return p
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.cmd == 'athletes':
+        for name in list_athletes():
+            print(json.dumps({'athlete': name, 'db': athlete_paths(name).db}, ensure_ascii=False))
+        return 0
+    if args.cmd == 'import-time':
+        print(json.dumps(import_times(args.repeat), ensure_ascii=False))
+        return 0
+    athletes = list_athletes() if args.all_athletes else (args.athlete or [DEFAULT_ATHLETE])
+    unknown = [a for a in athletes if not athlete_exists(a)]
+    if unknown:
+        parser.error(f'运动员不存在：{", ".join(unknown)}（先在界面中新建；athletes 子命令列出已有运动员）')
+    opts = {k: v for k, v in vars(args).items() if k not in ('cmd', 'athlete', 'all_athletes', 'workers')}
+    opts['today'] = opts.get('today') or date.today().isoformat()
+    t0 = time.perf_counter()
+    results = run_jobs(args.cmd, athletes, opts, args.workers)
+    for r in results:
+        print(json.dumps(r, ensure_ascii=False, default=str))
+    failed = sum(not r['ok'] for r in results)
+    print(json.dumps({'athletes': len(results), 'failed': failed, 'ms': round((time.perf_counter() - t0) * 1000.0, 1)}), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
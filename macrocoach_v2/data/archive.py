@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import glob
+import os
+import sqlite3
+import time
+import pandas as pd
+from ..settings import ARCHIVE_HORIZON_DAYS
+from .athletes import archive_dir
+from .cache import query_cache
+from .db import df_from_sql, transaction, archive_watermark, read_conn, _mark_dirty
+
+# 冷存储：按月分区的 Parquet 文件，<当前运动员的归档目录>/<表>/month=YYYY-MM/part-*.parquet
+# 值为合并视图去重所用的键：同一键热表优先
+ARCHIVE_TABLES: Dict[str, str] = {
+    'intake_logs': 'id',
+    'daily_metrics': 'date',
+}
+
+_ARROW_TYPES = {'REAL': 'float64', 'INTEGER': 'int64', 'TEXT': 'string'}
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def arrow_schema(conn: sqlite3.Connection, table: str):
+    import pyarrow as pa
+    # 以建表类型定义 schema，避免某一块整列为空时推断出不一致的类型
+    cols = conn.execute(f'PRAGMA table_info({table})').fetchall()
+    return pa.schema([(c[1], pa.type_for_alias(_ARROW_TYPES.get(str(c[2]).upper(), 'string'))) for c in cols])
+
+def _partition_files(table: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+    out = []
+    for path in sorted(glob.glob(os.path.join(archive_dir(), table, 'month=*', '*.parquet'))):
+        month = os.path.basename(os.path.dirname(path))[len('month='):]
+        if since and month < since[:7]:
+            continue
+        if until and month > until[:7]:
+            continue
+        out.append(path)
+    return out
+
+def iter_archive(table: str, start: Optional[str] = None, end: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    for path in _partition_files(table, start, end):
+        df = pd.read_parquet(path)
+        if start:
+            df = df[df['date'] >= start]
+        if end:
+            df = df[df['date'] <= end]
+        if len(df) > 0:
+            yield df
+
+def _read_cold(table: str, since: Optional[str]) -> pd.DataFrame:
+    files = _partition_files(table, since)
+    if not files:
+        return pd.DataFrame()
+    # 冷数据只在归档时变化：以文件列表+mtime 为键放进共享查询缓存
+    k = ('archive', os.path.abspath(archive_dir()), table, since, tuple((f, os.path.getmtime(f)) for f in files))
+    df = query_cache.get(k)
+    if df is None:
+        df = pd.concat(list(iter_archive(table, since)) or [pd.DataFrame()], ignore_index=True)
+        query_cache.put(k, df)
+    return df
+
+def read_history(table: str, since: Optional[str] = None) -> pd.DataFrame:
+    # 冷 + 热合并视图，按日期升序；调用方看到的与“全部在 SQLite 中”一致
+    if since:
+        hot = df_from_sql(f'SELECT * FROM {table} WHERE date >= ? ORDER BY date ASC', (since,))
+    else:
+        hot = df_from_sql(f'SELECT * FROM {table} ORDER BY date ASC')
+    if table not in ARCHIVE_TABLES or not parquet_available():
+        return hot
+    cold = _read_cold(table, since)
+    if len(cold) == 0:
+        return hot
+    if since:
+        cold = cold[cold['date'] >= since]
+    if len(hot) == 0:
+        return cold.sort_values('date', kind='stable').reset_index(drop=True)
+    merged = pd.concat([cold.astype(hot.dtypes.to_dict(), errors='ignore'), hot], ignore_index=True)
+    merged = merged.drop_duplicates(subset=[ARCHIVE_TABLES[table]], keep='last')
+    return merged.sort_values('date', kind='stable').reset_index(drop=True)
+
+def _write_partition(df: pd.DataFrame, schema, table: str, month: str) -> Tuple[str, str]:
+    # 只写到 .tmp（读取只认 *.parquet）；返回 (临时文件, 正式路径)，由调用方决定何时发布
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    part_dir = os.path.join(archive_dir(), table, f'month={month}')
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, f'part-{int(time.time() * 1000)}.parquet')
+    tmp = path + '.tmp'
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), tmp, compression='zstd')
+    return tmp, path
+
+def archive_older_than(horizon_days: int = ARCHIVE_HORIZON_DAYS, today: Optional[date] = None) -> Dict[str, int]:
+    # 把早于 (today - horizon) 的行按月写入冷存储并从热表删除；intake_daily 中这些日期的汇总保留
+    if not parquet_available():
+        raise RuntimeError('归档需要安装 pyarrow')
+    cutoff = ((today or date.today()) - timedelta(days=int(horizon_days))).isoformat()
+    moved: Dict[str, int] = {}
+    staged: List[Tuple[str, str]] = []
+    try:
+        _archive_rows(cutoff, moved, staged)
+    except BaseException:
+        # 事务已回滚（行仍在热表）：已写出或已发布的分区文件一并删掉，否则下次归档会把同一批行再写一份
+        for f in [f for pair in staged for f in pair]:
+            if os.path.exists(f):
+                os.remove(f)
+        raise
+    return moved
+
+def _archive_rows(cutoff: str, moved: Dict[str, int], staged: List[Tuple[str, str]]) -> None:
+    with transaction() as conn:
+        # 归档不改变数据本身：删除热表行会经触发器清掉 tdee_estimates，事后原样放回
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS _kept_tdee AS SELECT * FROM tdee_estimates WHERE 0')
+        conn.execute('INSERT INTO _kept_tdee SELECT * FROM tdee_estimates')
+        for table in ARCHIVE_TABLES:
+            schema = arrow_schema(conn, table)
+            months = [r[0] for r in conn.execute(f'SELECT DISTINCT substr(date,1,7) FROM {table} WHERE date < ? ORDER BY 1', (cutoff,))]
+            n = 0
+            for month in months:
+                df = pd.read_sql_query(f'SELECT * FROM {table} WHERE substr(date,1,7)=? AND date < ?', conn, params=(month, cutoff))
+                staged.append(_write_partition(df, schema, table, month))
+                n += len(df)
+            if table == 'intake_logs':
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS _archived_daily AS SELECT * FROM intake_daily WHERE 0')
+                conn.execute('INSERT INTO _archived_daily SELECT * FROM intake_daily WHERE date < ?', (cutoff,))
+            conn.execute(f'DELETE FROM {table} WHERE date < ?', (cutoff,))
+            _mark_dirty(f'DELETE FROM {table}')
+            if table == 'intake_logs':
+                conn.execute('INSERT OR REPLACE INTO intake_daily SELECT * FROM _archived_daily')
+                conn.execute('DELETE FROM _archived_daily')
+                _mark_dirty('INSERT INTO intake_daily')
+            if n > 0 and cutoff > archive_watermark(conn, table):
+                conn.execute('INSERT OR REPLACE INTO archive_meta(table_name, archived_before) VALUES(?,?)', (table, cutoff))
+            moved[table] = n
+        # 撤销记录里的前像可能落在已归档的日期上，恢复会把行写回热表：归档后清空撤销/重做日志
+        if any(moved.values()):
+            conn.execute('DELETE FROM journal')
+            _mark_dirty('DELETE FROM journal')
+        conn.execute('INSERT OR REPLACE INTO tdee_estimates SELECT * FROM _kept_tdee')
+        conn.execute('DELETE FROM _kept_tdee')
+        # 最后一步才发布分区：之后只剩提交，提交失败同样由 archive_older_than 清理
+        for tmp, path in staged:
+            os.replace(tmp, path)
+
+def archive_stats() -> Dict[str, Dict[str, object]]:
+    out: Dict[str, Dict[str, object]] = {}
+    with read_conn() as conn:
+        for table in ARCHIVE_TABLES:
+            files = _partition_files(table)
+            out[table] = {
+                'archived_before': archive_watermark(conn, table) or None,
+                'partitions': len({os.path.dirname(f) for f in files}),
+                'files': len(files),
+                'mb': round(sum(os.path.getsize(f) for f in files) / 2**20, 2),
+            }
+    return out
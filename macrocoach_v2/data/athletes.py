@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+import os
+import re
+import threading
+from ..settings import ATHLETES_DIR, DB_PATH, ARCHIVE_DIR, BACKUP_DIR
+
+# 当前运动员放在 ContextVar 中：data 层的所有函数都按它选择库文件（分片），调用方无需逐个传参。
+# 默认运动员（''）即单库配置 DB_PATH / ARCHIVE_DIR / BACKUP_DIR；其它运动员位于 <ATHLETES_DIR>/<名字>/。
+# 新线程不继承当前值：线程池/后台任务里用 use_athlete() 显式切换。
+DEFAULT_ATHLETE = ''
+_DB_FILE = 'macrocoach.db'
+_NAME_RE = re.compile(r'^[\w][\w\-. ]{0,63}$')
+
+_current: ContextVar[str] = ContextVar('macrocoach_athlete', default=DEFAULT_ATHLETE)
+
+@dataclass(frozen=True)
+class AthletePaths:
+    db: str
+    archive_dir: str
+    backup_dir: str
+
+_paths: Dict[str, AthletePaths] = {}
+_paths_lock = threading.Lock()
+
+def multi_athlete() -> bool:
+    return bool(ATHLETES_DIR)
+
+def valid_athlete(name: str) -> bool:
+    return name == DEFAULT_ATHLETE or bool(_NAME_RE.match(name)) and not name.endswith(('.', ' '))
+
+def athlete_paths(name: Optional[str] = None) -> AthletePaths:
+    name = _current.get() if name is None else name
+    p = _paths.get(name)
+    if p is not None:
+        return p
+    if not valid_athlete(name):
+        raise ValueError(f'运动员名称不合法：{name!r}')
+    if name == DEFAULT_ATHLETE:
+        p = AthletePaths(DB_PATH, ARCHIVE_DIR, BACKUP_DIR)
+    elif not multi_athlete():
+        raise ValueError('未配置 MACRO_COACH_ATHLETES_DIR，只有默认运动员')
+    else:
+        root = os.path.join(ATHLETES_DIR, name)
+        p = AthletePaths(os.path.join(root, _DB_FILE), os.path.join(root, 'archive'), os.path.join(root, 'backups'))
+    with _paths_lock:
+        return _paths.setdefault(name, p)
+
+def athlete_exists(name: str) -> bool:
+    # 只认已有的目录：API/CLI 传入的名字不应顺手建出新分片
+    if name == DEFAULT_ATHLETE:
+        return True
+    return multi_athlete() and valid_athlete(name) and os.path.isdir(os.path.join(ATHLETES_DIR, name))
+
+def create_athlete(name: str) -> AthletePaths:
+    # 新建运动员的唯一入口（界面“新建运动员”）：建目录，库文件在首次 init_db 时创建
+    p = athlete_paths(name)
+    os.makedirs(os.path.dirname(p.db) or '.', exist_ok=True)
+    return p
+
+def current_athlete() -> str:
+    return _current.get()
+
+def set_athlete(name: str) -> None:
+    # Streamlit 每次重跑开头调用：本次脚本运行内的所有读写都指向该运动员
+    athlete_paths(name)
+    _current.set(name)
+
+@contextmanager
+def use_athlete(name: str) -> Iterator[str]:
+    athlete_paths(name)
+    token = _current.set(name)
+    try:
+        yield name
+    finally:
+        _current.reset(token)
+
+def list_athletes() -> List[str]:
+    # 默认运动员在前；其余为 ATHLETES_DIR 下的子目录（按名称排序）
+    out = [DEFAULT_ATHLETE]
+    if multi_athlete() and os.path.isdir(ATHLETES_DIR):
+        out += sorted(n for n in os.listdir(ATHLETES_DIR)
+                      if os.path.isdir(os.path.join(ATHLETES_DIR, n)) and valid_athlete(n) and n != DEFAULT_ATHLETE)
+    return out
+
+def db_path() -> str:
+    return athlete_paths().db
+
+def archive_dir() -> str:
+    return athlete_paths().archive_dir
+
+def backup_dir() -> str:
+    return athlete_paths().backup_dir
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import glob
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from ..settings import (BACKUP_INTERVAL_MIN, BACKUP_COMPRESS, BACKUP_KEEP_DAILY,
+                        BACKUP_KEEP_WEEKLY, BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP_MS, DB_BUSY_TIMEOUT_MS)
+from .db import close_pools, init_db, transaction, write_conn
+from .athletes import db_path, backup_dir, list_athletes, use_athlete
+
+_PREFIX = 'macrocoach-'
+_STAMP = '%Y%m%d-%H%M%S'
+_STATUS_FILE = 'last_backup.json'
+
+def _backup_stamp(path: str) -> Optional[datetime]:
+    name = os.path.basename(path)[len(_PREFIX):len(_PREFIX) + 15]
+    try:
+        return datetime.strptime(name, _STAMP)
+    except ValueError:
+        return None
+
+def list_backups() -> List[str]:
+    files = [p for p in glob.glob(os.path.join(backup_dir(), _PREFIX + '*.db*')) if _backup_stamp(p) and not p.endswith('.tmp')]
+    return sorted(files, key=_backup_stamp, reverse=True)
+
+def last_backup_status() -> Optional[Dict[str, object]]:
+    try:
+        with open(os.path.join(backup_dir(), _STATUS_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _step_pause(status: int, remaining: int, total: int) -> None:
+    # backup() 的 sleep 参数只在某一步返回 BUSY/LOCKED 时生效：每步之后的让步放在进度回调里
+    if remaining > 0 and BACKUP_STEP_SLEEP_MS > 0:
+        time.sleep(BACKUP_STEP_SLEEP_MS / 1000.0)
+
+def _copy_online(dst_path: str) -> None:
+    # 分页拷贝，每步之间 sleep，让写者有机会拿到锁；使用独立只读连接，不占用连接池
+    uri = Path(db_path()).resolve().as_uri() + '?mode=ro'
+    src = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000.0)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=_step_pause, sleep=BACKUP_STEP_SLEEP_MS / 1000.0)
+        dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dst.close(); src.close()
+
+def backup_once(compress: str = BACKUP_COMPRESS, label: str = '') -> Dict[str, object]:
+    os.makedirs(backup_dir(), exist_ok=True)
+    t0 = time.perf_counter()
+    stamp = datetime.now().strftime(_STAMP)
+    raw = os.path.join(backup_dir(), f'{_PREFIX}{stamp}{label}.db')
+    _copy_online(raw + '.tmp')
+    if compress == 'gzip':
+        final = raw + '.gz'
+        with open(raw + '.tmp', 'rb') as fi, gzip.open(final + '.tmp', 'wb', compresslevel=6) as fo:
+            shutil.copyfileobj(fi, fo, 1 << 20)
+        os.remove(raw + '.tmp')
+        os.replace(final + '.tmp', final)
+    else:
+        final = raw
+        os.replace(raw + '.tmp', final)
+    status = {
+        'path': final, 'at': datetime.now().isoformat(timespec='seconds'),
+        'duration_s': round(time.perf_counter() - t0, 2), 'size_mb': round(os.path.getsize(final) / 2**20, 2),
+        'db_size_mb': round(os.path.getsize(db_path()) / 2**20, 2),
+    }
+    status['removed'] = rotate_backups()
+    with open(os.path.join(backup_dir(), _STATUS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False)
+    return status
+
+def rotate_backups(keep_daily: int = BACKUP_KEEP_DAILY, keep_weekly: int = BACKUP_KEEP_WEEKLY) -> int:
+    # 保留最近 N 个自然日各自最新的一份 + 最近 M 个 ISO 周各自最新的一份；pre-restore 备份不参与轮换
+    keep, days, weeks = set(), set(), set()
+    for path in list_backups():
+        if '-pre-restore' in path:
+            continue
+        ts = _backup_stamp(path)
+        day, week = ts.date(), ts.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.add(day); keep.add(path)
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.add(week); keep.add(path)
+    removed = 0
+    for path in list_backups():
+        if path not in keep and '-pre-restore' not in path:
+            os.remove(path); removed += 1
+    return removed
+
+def _unpack(path: str, dst: str) -> None:
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as fi, open(dst, 'wb') as fo:
+            shutil.copyfileobj(fi, fo, 1 << 20)
+    else:
+        shutil.copyfile(path, dst)
+
+def verify_backup(path: str) -> str:
+    tmp = str(db_path()) + '.verify.tmp'
+    _unpack(path, tmp)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            return str(conn.execute('PRAGMA integrity_check').fetchone()[0])
+        finally:
+            conn.close()
+    finally:
+        os.remove(tmp)
+
+def restore_backup(path: str) -> str:
+    # 先解压并做完整性校验，校验通过才恢复当前运动员的库；恢复前把当前库另存一份 pre-restore 备份。
+    # 不替换库文件（正被其它线程/会话/进程使用的连接会继续写已删除的旧文件）：经在线备份 API 把备份整体写进正在用的库，
+    # 其它连接之后的事务直接看到恢复后的内容
+    from .intake_queue import intake_queue
+    db = db_path()
+    tmp = str(db) + '.restore.tmp'
+    _unpack(path, tmp)
+    src = sqlite3.connect(tmp)
+    try:
+        result = str(src.execute('PRAGMA integrity_check').fetchone()[0])
+        if result != 'ok':
+            raise RuntimeError(f'备份校验失败：{result}')
+        # 已入队的摄入先落库，进入 pre-restore 备份而不是写到恢复后的库里
+        intake_queue().flush('*')
+        if os.path.exists(db):
+            backup_once(label='-pre-restore')
+        with write_conn() as conn:
+            clock = conn.execute('SELECT n FROM write_clock WHERE id=1').fetchone() if _has_clock(conn) else None
+            src.backup(conn, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP_MS / 1000.0)
+    finally:
+        src.close()
+        os.remove(tmp)
+    close_pools()
+    init_db()
+    # 恢复后的写时钟可能恰好等于其它进程已见过的值：推到恢复前之后，让所有进程的查询缓存失效
+    with transaction() as conn:
+        conn.execute('UPDATE write_clock SET n = MAX(n, ?) + 1 WHERE id = 1', (clock[0] if clock else 0,))
+    return result
+
+def _has_clock(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='write_clock'").fetchone() is not None
+
+class BackupJob(threading.Thread):
+    def __init__(self, interval_min: float = BACKUP_INTERVAL_MIN):
+        super().__init__(name='macrocoach-backup', daemon=True)
+        self.interval_s = max(60.0, float(interval_min) * 60.0)
+        self.last_error: Optional[str] = None
+        self._stop_event = threading.Event()
+
+    def _due_in(self) -> float:
+        # 当前运动员（后台线程中由 run 逐个切换）距下一次备份的秒数
+        files = list_backups()
+        if not files:
+            return 0.0
+        age = time.time() - _backup_stamp(files[0]).timestamp()
+        return max(0.0, self.interval_s - age)
+
+    def _run_due(self) -> float:
+        # 每位运动员各自一个备份目录与节奏；返回距最早一次到期的秒数
+        wait = self.interval_s
+        for name in list_athletes():
+            with use_athlete(name):
+                if self._due_in() <= 0 and os.path.exists(db_path()):
+                    backup_once()
+                wait = min(wait, self._due_in() if os.path.exists(db_path()) else self.interval_s)
+        return wait
+
+    def run(self) -> None:
+        wait = 0.0
+        while not self._stop_event.wait(wait):
+            try:
+                wait = self._run_due()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                wait = 60.0
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+_job: Optional[BackupJob] = None
+_job_lock = threading.Lock()
+
+def start_backup_job() -> Optional[BackupJob]:
+    # 进程内只启动一个后台备份线程；间隔为 0 时不启动
+    global _job
+    if BACKUP_INTERVAL_MIN <= 0:
+        return None
+    with _job_lock:
+        if _job is None or not _job.is_alive():
+            _job = BackupJob()
+            _job.start()
+    return _job
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+import threading
+import pandas as pd
+from ..settings import QUERY_CACHE_MAX_MB
+
+# 进程内共享的查询结果 LRU 缓存；键中包含相关表的写代数，写入后旧键自然失效
+class QueryCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, k: Hashable) -> Optional[pd.DataFrame]:
+        with self._lock:
+            item = self._items.get(k)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(k)
+            self.hits += 1
+            return item[0]
+
+    def put(self, k: Hashable, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(k, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._items[k] = (df, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._items:
+                _, (_, s) = self._items.popitem(last=False)
+                self.bytes -= s
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._items), 'mb': round(self.bytes / 2**20, 2), 'max_mb': round(self.max_bytes / 2**20, 2),
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+query_cache = QueryCache(QUERY_CACHE_MAX_MB * 2**20)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import Callable, Dict, IO, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from ..settings import IMPORT_CHUNK_ROWS
+from .db import executemany, transaction, journaled, invalidate_history_state, _mark_dirty
+
+def _source_from_notes(notes: pd.Series) -> pd.Series:
+    # 与迁移 8 的 CASE 相同
+    return pd.Series(np.select([notes.str.startswith('预生成'), notes == '回算', notes.str.startswith('基线目标')],
+                               ['schedule', 'backfill', 'baseline'], 'plan'), index=notes.index, dtype=object)
+
+# 每张表：列顺序、列类型（real/int/text/key）、写入语句，以及缺失值的补齐（fill）
+IMPORT_SPECS: Dict[str, Dict[str, object]] = {
+    'daily_metrics': {
+        'cols': [('date','key'), ('weight','real'), ('steps','int'), ('exercise_min','real'), ('sleep_h','real'),
+                 ('fatigue','int'), ('perf_pct','real'), ('avg_hr','real'), ('max_hr','real'), ('load_index','real')],
+        'sql': 'INSERT OR REPLACE INTO daily_metrics(date,weight,steps,exercise_min,sleep_h,fatigue,perf_pct,avg_hr,max_hr,load_index) VALUES(?,?,?,?,?,?,?,?,?,?)',
+    },
+    'daily_targets': {
+        'cols': [('date','key'), ('target_kcal','real'), ('protein_g','real'), ('fat_g','real'), ('carb_g','real'), ('bmr','real'),
+                 ('pal','real'), ('tdee_used','real'), ('tdee_formula','real'), ('deficit','real'), ('ea','real'),
+                 ('ea_guard_applied','int'), ('notes','text'), ('day_type','nullable'), ('source','nullable')],
+        'sql': 'INSERT OR REPLACE INTO daily_targets(date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,tdee_formula,deficit,ea,ea_guard_applied,notes,day_type,source) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+        # 旧版导出缺列时按迁移的做法补齐：tdee_formula 取 tdee_used，source 按 notes 前缀归类（plan/backfill 行不被调度器覆盖）
+        'fill': {'tdee_formula': lambda t: t['tdee_used'], 'source': lambda t: _source_from_notes(t['notes'])},
+    },
+    # 摄入记录没有自然主键：按 (ts, date, 餐别, kcal, 宏量) 去重，重复导入同一文件不会产生重复餐次
+    'intake_logs': {
+        'cols': [('ts','key'), ('date','key'), ('meal_tag','text'), ('kcal','real'), ('protein_g','real'),
+                 ('fat_g','real'), ('carb_g','real'), ('note','text')],
+        'dedup': ['ts','date','meal_tag','kcal','protein_g','fat_g','carb_g'],
+    },
+    'weekly_volume': {
+        'cols': [('date','key'), ('muscle_group','text'), ('sets','int')],
+        'sql': 'INSERT INTO weekly_volume(date,muscle_group,sets) VALUES(?,?,?)',
+    },
+}
+
+# 先写入临时表，再用一条 INSERT ... SELECT 按 (date, ts) 索引排除已存在的餐次
+_INTAKE_STAGE = 'CREATE TEMP TABLE IF NOT EXISTS _intake_stage(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note)'
+_INTAKE_MERGE = """
+INSERT INTO intake_logs(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note)
+SELECT s.ts,s.date,s.meal_tag,s.kcal,s.protein_g,s.fat_g,s.carb_g,s.note FROM _intake_stage s
+WHERE NOT EXISTS (
+  SELECT 1 FROM intake_logs l
+  WHERE l.date=s.date AND l.ts=s.ts AND l.meal_tag IS s.meal_tag AND l.kcal IS s.kcal
+    AND l.protein_g IS s.protein_g AND l.fat_g IS s.fat_g AND l.carb_g IS s.carb_g
+)
+ORDER BY s.rowid
+"""
+
+def _column(s: pd.Series, kind: str) -> pd.Series:
+    if kind == 'real':
+        return pd.to_numeric(s, errors='coerce').astype(float)
+    if kind == 'int':
+        return np.trunc(pd.to_numeric(s, errors='coerce')).astype('Int64')
+    if kind == 'nullable':
+        return s.astype(object).where(s.notna(), None)
+    if kind == 'text':
+        return s.fillna('').astype(str)
+    return s.astype(str)
+
+def coerce_chunk(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    spec = IMPORT_SPECS[table]
+    out = {}
+    for name, kind in spec['cols']:
+        s = df[name] if name in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+        out[name] = _column(s, kind)
+    typed = pd.DataFrame(out, index=df.index)
+    for name, fill in spec.get('fill', {}).items():
+        typed[name] = typed[name].where(typed[name].notna(), fill(typed))
+    if 'dedup' in spec:
+        typed = typed.drop_duplicates(subset=spec['dedup'])
+    return typed
+
+def _rows(typed: pd.DataFrame) -> List[tuple]:
+    # 浮点列直接传 NaN（sqlite3 绑定为 NULL），整数列需转成 Python int/None
+    cols = []
+    for name in typed.columns:
+        s = typed[name]
+        if str(s.dtype) == 'Int64':
+            cols.append(s.astype(object).where(s.notna(), None).tolist())
+        else:
+            cols.append(s.tolist())
+    return list(zip(*cols))
+
+def _write_intake(rows: List[tuple]) -> int:
+    with transaction() as conn:
+        conn.execute(_INTAKE_STAGE)
+        conn.execute('DELETE FROM _intake_stage')
+        conn.executemany('INSERT INTO _intake_stage VALUES(?,?,?,?,?,?,?,?)', rows)
+        n = conn.execute(_INTAKE_MERGE).rowcount
+        conn.execute('DELETE FROM _intake_stage')
+        _mark_dirty('INSERT INTO intake_logs')
+    return n
+
+def import_csv(table: str, src: IO, chunksize: int = IMPORT_CHUNK_ROWS,
+               progress: Optional[Callable[[int, int, Optional[float]], None]] = None) -> Tuple[int, int]:
+    # 分块读取 → 按列转换 → 每块一个事务（各记一条撤销记录）；返回 (读取行数, 实际写入行数)
+    spec = IMPORT_SPECS[table]
+    text_cols = {name: str for name, kind in spec['cols'] if kind in ('key', 'text', 'nullable')}
+    total = getattr(src, 'size', None)
+    read = written = 0
+    for chunk in pd.read_csv(src, dtype=text_cols, chunksize=int(chunksize)):
+        rows = _rows(coerce_chunk(chunk, table))
+        # 按日期覆盖的表取前像；只追加的表记录新增 id 区间
+        keyed = {table: [r[0] for r in rows]} if table in ('daily_metrics', 'daily_targets') else None
+        with journaled('import', f'{table} {len(rows)} 行', keys=keyed, appends=() if keyed else (table,)):
+            written += _write_intake(rows) if table == 'intake_logs' else executemany(str(spec['sql']), rows)
+        read += len(chunk)
+        if progress is not None:
+            frac = None
+            if total:
+                try:
+                    frac = min(1.0, src.tell() / float(total))
+                except Exception:
+                    frac = None
+            progress(read, written, frac)
+    if table == 'daily_metrics' and written:
+        invalidate_history_state()
+    return read, written
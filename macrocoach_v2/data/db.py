@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import Iterable, List, Optional, Dict
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Sequence, Tuple
+import json as _json
+import re
 import sqlite3
+import threading
 import pandas as pd
-import streamlit as st
-from ..settings import DB_PATH
+from ..settings import DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_MAX_OPEN_SHARDS, DB_IDLE_CLOSE_S
+from .pool import ConnectionPool, ShardPools
+from .athletes import db_path
+from .cache import query_cache
+from . import journal
+from ..domain.models import HistoryState
+from ..domain.history import push_day, push_weight, state_from_rows, loss_obs, sleep_ema, recent_emas, trend_summary, ROW_WINDOW
 
 SCHEMA = {
     'daily_metrics': """
@@ -47,19 +56,366 @@ SCHEMA = {
     """
 }
 
-@st.cache_resource(show_spinner=False)
-def get_conn() -> sqlite3.Connection:
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+# 写连接（WAL）与只读连接分池：读者不阻塞写者，所有会话共享同一组池；
+# 每位运动员一个库文件（分片），按当前运动员（data/athletes.py）取对应的池，不同运动员的写入互不加锁
+_shards = ShardPools(DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_MAX_OPEN_SHARDS, DB_IDLE_CLOSE_S)
+
+def _writer_pool() -> ConnectionPool:
+    return _shards.get(db_path())[0]
+
+def _reader_pool() -> ConnectionPool:
+    return _shards.get(db_path())[1]
+
+_tx = threading.local()
+
+def _tx_depths() -> Dict[ConnectionPool, int]:
+    if not hasattr(_tx, 'depths'):
+        _tx.depths = {}
+    return _tx.depths
+
+def _tx_dirty(pool: ConnectionPool) -> set:
+    if not hasattr(_tx, 'dirty'):
+        _tx.dirty = {}
+    return _tx.dirty.setdefault(pool, set())
+
+def _tx_journal(pool: ConnectionPool) -> list:
+    # 本事务内待登记的撤销记录 (会话, 动作, 说明, 前像)，最外层提交前合并写入 journal
+    if not hasattr(_tx, 'journal'):
+        _tx.journal = {}
+    return _tx.journal.setdefault(pool, [])
+
+# —— 写代数：每张表一个计数器，事务提交后递增；'*' 代表“所有表” ——
+_WRITE_RE = re.compile(r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)', re.I)
+_READ_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.I)
+# 触发器带来的派生写入
+DERIVED_TABLES: Dict[str, Tuple[str, ...]] = {
+    'intake_logs': ('intake_daily', 'tdee_estimates'), 'intake_daily': ('tdee_estimates',),
+    'daily_metrics': ('tdee_estimates',), 'daily_targets': ('tdee_estimates',),
+}
+_generations: Dict[Tuple[str, str], int] = {}
+_gen_lock = threading.Lock()
+
+def _mark_dirty(sql: str) -> None:
+    m = _WRITE_RE.match(sql)
+    _tx_dirty(_writer_pool()).add(m.group(1).lower() if m else '*')
+
+def _bump_generations(path: str, tables: Iterable[str]) -> None:
+    with _gen_lock:
+        for t in tables:
+            for name in (t,) + DERIVED_TABLES.get(t, ()):
+                _generations[(path, name)] = _generations.get((path, name), 0) + 1
+
+# —— 写时钟：每张表上的触发器在任何连接写入时递增 write_clock.n（包括其它进程：CLI、API、直接用 sqlite3 改库）。
+# 本进程的事务持有写锁期间读取提交前/后的值，提交后记为已知；读缓存前核对当前值，
+# 与已知值不同说明有本进程之外的写入，此时无法知道改了哪些表，让该库的所有缓存失效 ——
+_clock_seen: Dict[str, int] = {}
+
+def _read_clock(conn: sqlite3.Connection) -> Optional[int]:
+    try:
+        row = conn.execute('SELECT n FROM write_clock WHERE id=1').fetchone()
+    except sqlite3.OperationalError:
+        return None  # 尚未迁移
+    return row[0] if row else None
+
+def _sync_clock(path: str) -> None:
+    with read_conn() as conn:
+        n = _read_clock(conn)
+    if n is None:
+        return
+    with _gen_lock:
+        if _clock_seen.get(path) != n:
+            _clock_seen[path] = n
+            _generations[(path, '*')] = _generations.get((path, '*'), 0) + 1
+
+def _cache_key(path: str, query: str, params: tuple) -> tuple:
+    tables = sorted({t.lower() for t in _READ_RE.findall(query)})
+    with _gen_lock:
+        gens = tuple(_generations.get((path, t), 0) for t in tables)
+        return (path, query, tuple(params), gens, _generations.get((path, '*'), 0))
+
+def cache_stats() -> Dict[str, float]:
+    return query_cache.stats()
+
+@contextmanager
+def write_conn() -> Iterator[sqlite3.Connection]:
+    with _writer_pool().connection() as conn:
+        yield conn
+
+@contextmanager
+def read_conn() -> Iterator[sqlite3.Connection]:
+    # 事务进行中时读写同一连接，保证读到本次尚未提交的写入
+    if _tx_depths().get(_writer_pool(), 0) > 0:
+        with write_conn() as conn:
+            yield conn
+        return
+    with _reader_pool().connection() as conn:
+        yield conn
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    # 一次用户动作 = 一次提交；嵌套调用使用 SAVEPOINT，异常时整体回滚
+    pool = _writer_pool(); depths = _tx_depths()
+    with pool.connection() as conn:
+        depth = depths.get(pool, 0)
+        conn.execute('BEGIN IMMEDIATE' if depth == 0 else f'SAVEPOINT sp{depth}')
+        depths[pool] = depth + 1
+        changes_before = conn.total_changes
+        clock_before = clock_after = _read_clock(conn) if depth == 0 else None
+        pending = _tx_journal(pool); mark = len(pending)
+        try:
+            yield conn
+            if depth == 0 and pending:
+                journal.record(conn, journal.merge(pending))
+                _tx_dirty(pool).add('journal')
+            if clock_before is not None:
+                clock_after = _read_clock(conn)
+        except BaseException:
+            depths[pool] = depth
+            del pending[mark:]
+            if depth == 0:
+                conn.execute('ROLLBACK'); _tx_dirty(pool).clear()
+            else:
+                conn.execute(f'ROLLBACK TO sp{depth}'); conn.execute(f'RELEASE sp{depth}')
+            raise
+        depths[pool] = depth
+        if depth > 0:
+            conn.execute(f'RELEASE sp{depth}')
+            return
+        conn.execute('COMMIT')
+        pending.clear()
+        dirty = _tx_dirty(pool)
+        # 未经 execute() 登记的直接写入：保守地让所有缓存失效
+        if conn.total_changes != changes_before and not dirty:
+            dirty.add('*')
+        # 开始前的时钟不是已知值：上次核对之后有外部写入
+        if clock_before is not None:
+            with _gen_lock:
+                if _clock_seen.get(pool.path) != clock_before:
+                    dirty.add('*')
+                _clock_seen[pool.path] = max(clock_after, _clock_seen.get(pool.path, clock_after))
+        _bump_generations(pool.path, dirty)
+        dirty.clear()
+
+@contextmanager
+def journaled(action: str, detail: str = '', keys: Optional[Dict[str, Sequence[str]]] = None,
+              appends: Sequence[str] = ()) -> Iterator[sqlite3.Connection]:
+    # 一次可撤销的写入：keys 为 {表: 日期}（按日期主键覆盖写入，先取这些日期的前像），
+    # appends 为只追加的表（记录本次新增的自增 id 区间）；正常退出时把逆操作挂到当前事务，提交时写入 journal
+    with transaction() as conn:
+        before = [journal.snapshot(conn, journal.image(t, 'date', ks)) for t, ks in (keys or {}).items()]
+        tops = {t: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {t}').fetchone()[0] for t in appends}
+        yield conn
+        for t, top in tops.items():
+            hi = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {t}').fetchone()[0]
+            if hi > top:
+                before.append(journal.image(t, 'id', ranges=[(top + 1, hi)]))
+        _tx_journal(_writer_pool()).append((journal.current_session(), action, detail, before))
+
+def pool_stats() -> Dict[str, Dict[str, float]]:
+    return {'writer': _writer_pool().stats(), 'reader': _reader_pool().stats(), 'shards': _shards.stats()}
+
+def close_pools() -> None:
+    # 关闭当前运动员库的空闲连接并让迁移/缓存失效（恢复备份之后调用：恢复的库可能是旧版本的结构）
+    pool = _writer_pool()
+    _shards.close(pool.path)
+    _migrated.discard(pool.path)
+    _bump_generations(pool.path, ['*'])
 
 def init_db() -> None:
-    conn = get_conn(); cur = conn.cursor()
-    for sql in SCHEMA.values():
-        cur.execute(sql)
-    conn.commit()
     migrate_db()
 
+# —— 版本化迁移：每个进程/数据库只执行一次，已应用的版本记录在 schema_version ——
+def _m1_base_tables(conn: sqlite3.Connection) -> None:
+    for sql in SCHEMA.values():
+        conn.execute(sql)
+    _migrate_columns(conn)
+
+def _m2_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_intake_logs_date_ts ON intake_logs(date, ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_weekly_volume_date_group ON weekly_volume(date, muscle_group)')
+
+# —— intake_daily：按日汇总的摄入物化表，由 intake_logs 上的触发器增量维护 ——
+INTAKE_DAILY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS intake_daily(
+  date TEXT PRIMARY KEY,
+  kcal REAL NOT NULL DEFAULT 0,
+  protein_g REAL NOT NULL DEFAULT 0,
+  fat_g REAL NOT NULL DEFAULT 0,
+  carb_g REAL NOT NULL DEFAULT 0,
+  n INTEGER NOT NULL DEFAULT 0,
+  first_ts TEXT,
+  last_ts TEXT
+)
+"""
+
+_INTAKE_DAILY_ADD = """
+  INSERT INTO intake_daily(date,kcal,protein_g,fat_g,carb_g,n,first_ts,last_ts)
+  VALUES(NEW.date, COALESCE(NEW.kcal,0), COALESCE(NEW.protein_g,0), COALESCE(NEW.fat_g,0), COALESCE(NEW.carb_g,0), 1, NEW.ts, NEW.ts)
+  ON CONFLICT(date) DO UPDATE SET
+    kcal=kcal+excluded.kcal, protein_g=protein_g+excluded.protein_g,
+    fat_g=fat_g+excluded.fat_g, carb_g=carb_g+excluded.carb_g, n=n+1,
+    first_ts=CASE WHEN first_ts IS NULL OR excluded.first_ts < first_ts THEN excluded.first_ts ELSE first_ts END,
+    last_ts=CASE WHEN last_ts IS NULL OR excluded.last_ts > last_ts THEN excluded.last_ts ELSE last_ts END;
+"""
+
+# 删除后 first/last 通过 (date, ts) 索引重新取值，只触及当天的行
+_INTAKE_DAILY_SUB = """
+  UPDATE intake_daily SET
+    kcal=kcal-COALESCE(OLD.kcal,0), protein_g=protein_g-COALESCE(OLD.protein_g,0),
+    fat_g=fat_g-COALESCE(OLD.fat_g,0), carb_g=carb_g-COALESCE(OLD.carb_g,0), n=n-1,
+    first_ts=(SELECT MIN(ts) FROM intake_logs WHERE date=OLD.date),
+    last_ts=(SELECT MAX(ts) FROM intake_logs WHERE date=OLD.date)
+  WHERE date=OLD.date;
+  DELETE FROM intake_daily WHERE date=OLD.date AND n<=0;
+"""
+
+INTAKE_DAILY_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS trg_intake_daily_ins AFTER INSERT ON intake_logs WHEN NEW.date IS NOT NULL BEGIN" + _INTAKE_DAILY_ADD + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_intake_daily_del AFTER DELETE ON intake_logs WHEN OLD.date IS NOT NULL BEGIN" + _INTAKE_DAILY_SUB + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_intake_daily_upd_old AFTER UPDATE OF date,ts,kcal,protein_g,fat_g,carb_g ON intake_logs WHEN OLD.date IS NOT NULL BEGIN" + _INTAKE_DAILY_SUB + "END",
+    "CREATE TRIGGER IF NOT EXISTS trg_intake_daily_upd_new AFTER UPDATE OF date,ts,kcal,protein_g,fat_g,carb_g ON intake_logs WHEN NEW.date IS NOT NULL BEGIN" + _INTAKE_DAILY_ADD + "END",
+]
+
+_INTAKE_DAILY_AGG = """
+SELECT date, COALESCE(SUM(kcal),0) AS kcal, COALESCE(SUM(protein_g),0) AS protein_g,
+       COALESCE(SUM(fat_g),0) AS fat_g, COALESCE(SUM(carb_g),0) AS carb_g,
+       COUNT(*) AS n, MIN(ts) AS first_ts, MAX(ts) AS last_ts
+FROM intake_logs WHERE date IS NOT NULL AND date >= ? GROUP BY date
+"""
+_INTAKE_DAILY_FILL = "INSERT INTO intake_daily(date,kcal,protein_g,fat_g,carb_g,n,first_ts,last_ts)" + _INTAKE_DAILY_AGG
+
+def _m3_intake_daily(conn: sqlite3.Connection) -> None:
+    conn.execute(INTAKE_DAILY_SCHEMA)
+    for sql in INTAKE_DAILY_TRIGGERS:
+        conn.execute(sql)
+    conn.execute('DELETE FROM intake_daily')
+    conn.execute(_INTAKE_DAILY_FILL, ('',))
+
+# —— archive_meta：各表已归档到冷存储的日期上界（不含） ——
+def _m4_archive_meta(conn: sqlite3.Connection) -> None:
+    conn.execute('CREATE TABLE IF NOT EXISTS archive_meta(table_name TEXT PRIMARY KEY, archived_before TEXT NOT NULL)')
+
+# —— metrics_state：日指标滚动窗口与 EMA 的持久化状态（单行），写入新的一天时 O(1) 推进 ——
+METRICS_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics_state(
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_date TEXT,
+  weights TEXT NOT NULL,
+  recent TEXT NOT NULL,
+  loss_obs REAL, sleep_ema REAL,
+  fatigue_ema REAL, sleep_ema14 REAL, load_ema REAL, perf_ema REAL
+)
+"""
+
+def _m5_metrics_state(conn: sqlite3.Connection) -> None:
+    # 首次读取时再按现有日指标构建
+    conn.execute(METRICS_STATE_SCHEMA)
+
+def _m6_metrics_trend(conn: sqlite3.Connection) -> None:
+    # 趋势滤波状态需要完整体重史：清空旧状态，下次读取时重建
+    for col, coltype in (('trend', 'TEXT'), ('trend_level', 'REAL'), ('trend_loss_kg_wk', 'REAL'), ('trend_loss_band', 'REAL'), ('n_weighins', 'INTEGER')):
+        conn.execute(f'ALTER TABLE metrics_state ADD COLUMN {col} {coltype}')
+    conn.execute('DELETE FROM metrics_state')
+
+# —— tdee_estimates：自适应 TDEE 的逐日结果与截至当天的估计器状态；只处理已结束的日子，按天增量追加 ——
+TDEE_ESTIMATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tdee_estimates(
+  date TEXT PRIMARY KEY,
+  weight REAL, intake_kcal REAL, logged_days INTEGER, formula_tdee REAL,
+  trend_level REAL, trend_slope REAL, observed_tdee REAL, ratio REAL, factor REAL, adaptive_tdee REAL,
+  state TEXT NOT NULL
+)
+"""
+
+# 输入（摄入汇总 / 日指标 / 公式 TDEE）变化时，删除该日期及之后的估计，下次读取时从前一天的状态续算
+_TDEE_INVALIDATE = " DELETE FROM tdee_estimates WHERE date >= {d}; "
+TDEE_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_tdee_{name}_{op.lower()} AFTER {op}{cols} ON {table} BEGIN" + _TDEE_INVALIDATE.format(d=d) + "END"
+    for name, table, upd_cols in (('intake', 'intake_daily', ''), ('metrics', 'daily_metrics', ' OF date,weight'),
+                                  ('targets', 'daily_targets', ' OF date,tdee_used,tdee_formula'))
+    for op, cols, d in (('INSERT', '', 'NEW.date'), ('DELETE', '', 'OLD.date'), ('UPDATE', upd_cols, 'MIN(OLD.date, NEW.date)'))
+]
+
+def _m7_tdee_estimates(conn: sqlite3.Connection) -> None:
+    # daily_targets.tdee_formula：未经自适应校正的公式 TDEE（估计器的基准）；已有行都是公式值
+    conn.execute('ALTER TABLE daily_targets ADD COLUMN tdee_formula REAL')
+    conn.execute('UPDATE daily_targets SET tdee_formula = tdee_used')
+    conn.execute(TDEE_ESTIMATES_SCHEMA)
+    for sql in TDEE_TRIGGERS:
+        conn.execute(sql)
+
+# —— daily_targets.source：目标的来源；plan / backfill 为 plan_day 完整计算，调度器默认不覆盖 ——
+COMPUTED_SOURCES = ('plan', 'backfill')
+
+def _m8_targets_source(conn: sqlite3.Connection) -> None:
+    # 旧行按 notes 中的固定前缀归类
+    conn.execute('ALTER TABLE daily_targets ADD COLUMN source TEXT')
+    conn.execute("""
+        UPDATE daily_targets SET source = CASE
+          WHEN notes LIKE '预生成%' THEN 'schedule'
+          WHEN notes = '回算' THEN 'backfill'
+          WHEN notes LIKE '基线目标%' THEN 'baseline'
+          ELSE 'plan' END
+    """)
+
+# —— journal：有界的撤销/重做日志（data/journal.py），取代只会按日期删“最新一条摄入”的 activity_logs ——
+def _m9_journal(conn: sqlite3.Connection) -> None:
+    # 旧日志只记了日期、没有行 id，无法精确撤销，直接丢弃
+    conn.execute('DROP TABLE IF EXISTS activity_logs')
+    conn.execute(journal.JOURNAL_SCHEMA)
+    conn.execute(journal.JOURNAL_INDEX)
+
+def _m10_write_clock(conn: sqlite3.Connection) -> None:
+    # 触发器由 _install_clock_triggers 按现有表补齐（migrate_db 每次应用迁移后都会执行，新表自动覆盖）
+    conn.execute('CREATE TABLE IF NOT EXISTS write_clock(id INTEGER PRIMARY KEY CHECK (id = 1), n INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO write_clock(id, n) VALUES(1, 0)')
+
+_CLOCK_BUMP = 'UPDATE write_clock SET n = n + 1 WHERE id = 1;'
+
+def _install_clock_triggers(conn: sqlite3.Connection) -> None:
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+              if r[0] not in ('write_clock', 'schema_version')]
+    for t in tables:
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'CREATE TRIGGER IF NOT EXISTS trg_clock_{t}_{op.lower()} AFTER {op} ON {t} BEGIN {_CLOCK_BUMP} END')
+
+MIGRATIONS: List[Tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _m1_base_tables),
+    (2, _m2_indexes),
+    (3, _m3_intake_daily),
+    (4, _m4_archive_meta),
+    (5, _m5_metrics_state),
+    (6, _m6_metrics_trend),
+    (7, _m7_tdee_estimates),
+    (8, _m8_targets_source),
+    (9, _m9_journal),
+    (10, _m10_write_clock),
+]
+
+_migrated: set = set()
+_migrate_lock = threading.Lock()
+
 def migrate_db() -> None:
-    conn = get_conn(); cur = conn.cursor()
+    pool = _writer_pool()
+    if pool.path in _migrated:
+        return
+    with _migrate_lock:
+        if pool.path in _migrated:
+            return
+        with transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER PRIMARY KEY, applied_at TEXT DEFAULT (strftime('%Y-%m-%d %H:%M:%S','now')))")
+            current = conn.execute('SELECT COALESCE(MAX(version),0) FROM schema_version').fetchone()[0]
+            for version, step in MIGRATIONS:
+                if version > current:
+                    step(conn)
+                    conn.execute('INSERT INTO schema_version(version) VALUES(?)', (version,))
+            if current < MIGRATIONS[-1][0]:
+                _install_clock_triggers(conn)
+            _tx_dirty(pool).add('*')
+        _migrated.add(pool.path)
+
+def _migrate_columns(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
     def existing_cols(table: str) -> Iterable[str]:
         cur.execute(f"PRAGMA table_info({table})")
         return [row[1] for row in cur.fetchall()]
@@ -84,139 +440,234 @@ def migrate_db() -> None:
                     cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {coltype}")
                 except Exception:
                     pass
-    conn.commit()
 
-def df_from_sql(query: str, params: tuple = ()) -> pd.DataFrame:
+def _read_df(query: str, params: tuple) -> pd.DataFrame:
     try:
-        return pd.read_sql_query(query, get_conn(), params=params)
+        with read_conn() as conn:
+            return pd.read_sql_query(query, conn, params=params)
     except Exception:
         return pd.DataFrame()
 
+def df_from_sql(query: str, params: tuple = ()) -> pd.DataFrame:
+    pool = _writer_pool()
+    if _tx_depths().get(pool, 0) > 0:
+        return _read_df(query, params)
+    _sync_clock(pool.path)
+    k = _cache_key(pool.path, query, params)
+    df = query_cache.get(k)
+    if df is None:
+        df = _read_df(query, params)
+        if len(df.columns) > 0:
+            query_cache.put(k, df)
+    return df.copy()
+
 def execute(sql: str, params: tuple = ()) -> None:
-    conn = get_conn(); cur = conn.cursor(); cur.execute(sql, params); conn.commit()
+    with transaction() as conn:
+        conn.execute(sql, params)
+        _mark_dirty(sql)
 
-def executemany(sql: str, rows: List[tuple]) -> None:
-    conn = get_conn(); cur = conn.cursor(); cur.executemany(sql, rows); conn.commit()
+def executemany(sql: str, rows: List[tuple]) -> int:
+    with transaction() as conn:
+        n = conn.executemany(sql, rows).rowcount
+        _mark_dirty(sql)
+    return n
 
 def upsert_metrics(d: str, data: Dict[str, Optional[float]]):
+    with journaled('metrics', d, keys={'daily_metrics': [d]}) as conn:
+        execute("""
+            INSERT OR REPLACE INTO daily_metrics
+            (date,weight,steps,exercise_min,sleep_h,fatigue,perf_pct,avg_hr,max_hr,load_index)
+            VALUES(?,?,?,?,?,?,?,?,?,?)
+        """, (
+            d, data.get('weight'), data.get('steps'), data.get('exercise_min'),
+            data.get('sleep_h'), data.get('fatigue'), data.get('perf_pct'),
+            data.get('avg_hr'), data.get('max_hr'), data.get('load_index'),
+        ))
+        # 新的一天：O(1) 推进；修改已有日期：按表重建
+        state = _load_history_state(conn)
+        if state is not None and (state.last_date is None or d > state.last_date):
+            push_day(state, d, data)
+        else:
+            state = _build_history_state(conn)
+        _save_history_state(conn, state)
+
+def _load_history_state(conn: sqlite3.Connection) -> Optional[HistoryState]:
+    row = conn.execute('SELECT last_date, weights, recent, trend FROM metrics_state WHERE id=1').fetchone()
+    if row is None:
+        return None
+    recent = [[float('nan') if v is None else v for v in r] for r in _json.loads(row[2])]
+    trend = _json.loads(row[3]) if row[3] else {}
+    return HistoryState(last_date=row[0], weights=_json.loads(row[1]), recent=recent,
+                        trend=trend.get('t', []), trend_date=trend.get('date'), n_weighins=int(trend.get('n', 0)))
+
+def _save_history_state(conn: sqlite3.Connection, state: HistoryState) -> None:
+    # 派生值也落表，便于直接查询；JSON 中 NaN 写为 null
+    emas = recent_emas(state)
+    recent = [[None if v != v else v for v in r] for r in state.recent]
+    trend = {'t': state.trend, 'date': state.trend_date, 'n': state.n_weighins}
+    ts = trend_summary(state) or {}
     execute("""
-        INSERT OR REPLACE INTO daily_metrics
-        (date,weight,steps,exercise_min,sleep_h,fatigue,perf_pct,avg_hr,max_hr,load_index)
-        VALUES(?,?,?,?,?,?,?,?,?,?)
-    """, (
-        d, data.get('weight'), data.get('steps'), data.get('exercise_min'),
-        data.get('sleep_h'), data.get('fatigue'), data.get('perf_pct'),
-        data.get('avg_hr'), data.get('max_hr'), data.get('load_index'),
-    ))
-
-def upsert_targets(d: str, res: Dict[str, float], notes: str, ea_guard_applied: int, day_type: Optional[str] = None):
-    execute("""
-        INSERT OR REPLACE INTO daily_targets
-        (date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,deficit,ea,ea_guard_applied,notes,day_type)
-        VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)
-    """, (
-        d, res['target_kcal'], res['protein_g'], res['fat_g'], res['carb_g'],
-        res['bmr'], res['pal'], res['tdee_used'], res['deficit'], res['ea'],
-        ea_guard_applied, notes, day_type
-    ))
+        INSERT OR REPLACE INTO metrics_state
+        (id,last_date,weights,recent,loss_obs,sleep_ema,fatigue_ema,sleep_ema14,load_ema,perf_ema,
+         trend,trend_level,trend_loss_kg_wk,trend_loss_band,n_weighins)
+        VALUES(1,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, (state.last_date, _json.dumps(state.weights), _json.dumps(recent), loss_obs(state), sleep_ema(state),
+          emas['fatigue'], emas['sleep_h'], emas['load_index'], emas['perf_pct'],
+          _json.dumps(trend), ts.get('level'), ts.get('loss_kg_wk'), ts.get('loss_band'), state.n_weighins))
+
+def _build_history_state(conn: sqlite3.Connection) -> HistoryState:
+    # 最近 14 行来自表尾；体重窗口与趋势滤波需要按日期顺序走完整的体重史（有归档时合并冷数据）
+    cols = ['date', 'weight', 'fatigue', 'sleep_h', 'load_index', 'perf_pct']
+    if archive_watermark(conn, 'daily_metrics'):
+        from .archive import read_history
+        dm = read_history('daily_metrics')[cols]
+        rows = list(dm.tail(ROW_WINDOW).itertuples(index=False, name=None))
+        wrows = list(dm.loc[dm['weight'].notna(), ['date', 'weight']].itertuples(index=False, name=None))
+    else:
+        rows = conn.execute(f'SELECT {", ".join(cols)} FROM daily_metrics ORDER BY date DESC LIMIT {ROW_WINDOW}').fetchall()[::-1]
+        wrows = conn.execute('SELECT date, weight FROM daily_metrics WHERE weight IS NOT NULL ORDER BY date').fetchall()
+    state = state_from_rows(dict(zip(cols, r), weight=None) for r in rows)
+    for d, w in wrows:
+        push_weight(state, str(d), float(w))
+    return state
+
+def rebuild_history_state() -> HistoryState:
+    with transaction() as conn:
+        state = _build_history_state(conn)
+        _save_history_state(conn, state)
+    return state
+
+def invalidate_history_state() -> None:
+    # 批量改写历史（导入等）后调用：下次读取时重建
+    execute('DELETE FROM metrics_state')
+
+def load_history_state() -> HistoryState:
+    init_db()
+    with read_conn() as conn:
+        state = _load_history_state(conn)
+    return state if state is not None else rebuild_history_state()
+
+def upsert_targets(d: str, res: Dict[str, float], notes: str, ea_guard_applied: int, day_type: Optional[str] = None,
+                   source: str = 'plan'):
+    with journaled('targets', d, keys={'daily_targets': [d]}):
+        execute("""
+            INSERT OR REPLACE INTO daily_targets
+            (date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,tdee_formula,deficit,ea,ea_guard_applied,notes,day_type,source)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, (
+            d, res['target_kcal'], res['protein_g'], res['fat_g'], res['carb_g'],
+            res['bmr'], res['pal'], res['tdee_used'], res.get('tdee_formula', res['tdee_used']), res['deficit'], res['ea'],
+            ea_guard_applied, notes, day_type, source
+        ))
 
 def ensure_intake_table():
-    execute(SCHEMA['intake_logs'])
+    init_db()
 
-def add_intake_row(d: str, meal_tag: str, kcal: float, protein_g: float, fat_g: float, carb_g: float, note: str=''):
+def add_intake_row(d: str, meal_tag: str, kcal: float, protein_g: float, fat_g: float, carb_g: float, note: str='') -> int:
+    return add_intake_rows([(d, meal_tag, kcal, protein_g, fat_g, carb_g, note)])[0]
+
+_INTAKE_INSERT = 'INSERT INTO intake_logs(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note) VALUES(?,?,?,?,?,?,?,?)'
+
+def add_intake_rows(rows: Sequence[Tuple[str, str, float, float, float, float, str]], ts: Optional[Sequence[str]] = None,
+                    sessions: Optional[Sequence[str]] = None) -> List[int]:
+    # 批量记录 (date, meal_tag, kcal, protein_g, fat_g, carb_g, note)：一个事务、一次提交；返回各行 id（与输入顺序一致）
+    # ts / sessions 为各行的记录时间与所属会话（写后队列传入入队时的值），缺省为当前时间与当前会话。
+    # 每行各记一条撤销记录（按行 id），组提交合并的是不同的用户动作，撤销仍逐条进行
     import datetime as _dt
-    ts = _dt.datetime.now().isoformat(timespec='seconds')
-    execute("""
-        INSERT INTO intake_logs(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note)
-        VALUES(?,?,?,?,?,?,?,?)
-    """, (ts, d, meal_tag, float(kcal or 0.0), float(protein_g or 0.0), float(fat_g or 0.0), float(carb_g or 0.0), note or ''))
-    # 记录活动日志用于撤销
-    try:
-        log_activity('add_intake', {'date': d})
-    except Exception:
-        pass
+    if ts is None:
+        ts = [_dt.datetime.now().isoformat(timespec='seconds')] * len(rows)
+    if sessions is None:
+        sessions = [journal.current_session()] * len(rows)
+    ids: List[int] = []
+    with transaction() as conn:
+        entries = []
+        for (d, meal_tag, kcal, protein_g, fat_g, carb_g, note), t, sess in zip(rows, ts, sessions):
+            cur = conn.execute(_INTAKE_INSERT, (t, d, meal_tag, float(kcal or 0.0), float(protein_g or 0.0), float(fat_g or 0.0), float(carb_g or 0.0), note or ''))
+            ids.append(cur.lastrowid)
+            entries.append((sess, 'intake', f'{d} {meal_tag} {float(kcal or 0.0):.0f} kcal',
+                            [journal.image('intake_logs', 'id', ranges=[(cur.lastrowid, cur.lastrowid)])]))
+        journal.record(conn, entries)
+        _mark_dirty(_INTAKE_INSERT); _mark_dirty('INSERT INTO journal')
+    return ids
 
 def fetch_intake_today(d: str) -> pd.DataFrame:
     return df_from_sql('SELECT * FROM intake_logs WHERE date=? ORDER BY ts ASC', (d,))
 
 def intake_sums(d: str) -> Dict[str, float]:
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute('SELECT COALESCE(SUM(kcal),0), COALESCE(SUM(protein_g),0), COALESCE(SUM(fat_g),0), COALESCE(SUM(carb_g),0) FROM intake_logs WHERE date=?', (d,))
-    k,p,f,c = cur.fetchone()
+    with read_conn() as conn:
+        row = conn.execute('SELECT kcal, protein_g, fat_g, carb_g FROM intake_daily WHERE date=?', (d,)).fetchone()
+    k,p,f,c = row or (0.0, 0.0, 0.0, 0.0)
     return {'kcal': float(k or 0.0), 'protein_g': float(p or 0.0), 'fat_g': float(f or 0.0), 'carb_g': float(c or 0.0)}
 
-def delete_last_intake_today(d: str) -> bool:
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute('SELECT id FROM intake_logs WHERE date=? ORDER BY ts DESC LIMIT 1', (d,))
-    row = cur.fetchone()
-    if not row: return False
-    cur.execute('DELETE FROM intake_logs WHERE id=?', (row[0],))
-    conn.commit()
-    return True
-
 def add_weekly_volume(d: str, group: str, sets: int):
-    execute('INSERT INTO weekly_volume(date,muscle_group,sets) VALUES(?,?,?)', (d, group, int(sets)))
+    with journaled('volume', f'{d} {group} {int(sets)}组', appends=['weekly_volume']):
+        execute('INSERT INTO weekly_volume(date,muscle_group,sets) VALUES(?,?,?)', (d, group, int(sets)))
 
 def volume_last_n_days(n: int = 7) -> pd.DataFrame:
     return df_from_sql('SELECT date,muscle_group,sets FROM weekly_volume WHERE date>=date("now", ?)', (f'-{n} day',))
 
 def intake_aggregate_by_day() -> pd.DataFrame:
-    df = df_from_sql('SELECT date, COALESCE(SUM(kcal),0) AS kcal, COALESCE(SUM(protein_g),0) AS protein_g FROM intake_logs GROUP BY date ORDER BY date')
-    for col in ['kcal','protein_g']:
+    df = df_from_sql('SELECT date, kcal, protein_g, fat_g, carb_g, n, first_ts, last_ts FROM intake_daily ORDER BY date')
+    for col in ['kcal','protein_g','fat_g','carb_g']:
         if col in df:
             df[col] = pd.to_numeric(df[col], errors='coerce')
     return df
 
+def archive_watermark(conn: sqlite3.Connection, table: str) -> str:
+    row = conn.execute('SELECT archived_before FROM archive_meta WHERE table_name=?', (table,)).fetchone()
+    return row[0] if row else ''
 
-# === Added: activity_logs table (sqlite) ===
-SCHEMA['activity_logs'] = """
-CREATE TABLE IF NOT EXISTS activity_logs(
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  ts TEXT DEFAULT (strftime('%Y-%m-%d %H:%M:%S','now')),
-  action TEXT NOT NULL,
-  payload TEXT NOT NULL
-)
-"""
+# 已归档日期的汇总行保留在 intake_daily 中（明细已移入冷存储），重建/校验只覆盖水位线之后
+def rebuild_intake_daily() -> int:
+    with transaction() as conn:
+        wm = archive_watermark(conn, 'intake_logs')
+        conn.execute('DELETE FROM intake_daily WHERE date >= ?', (wm,))
+        _mark_dirty(_INTAKE_DAILY_FILL)
+        return conn.execute(_INTAKE_DAILY_FILL, (wm,)).rowcount
 
+def verify_intake_daily(tol: float = 1e-6) -> pd.DataFrame:
+    # 返回汇总表与明细重新聚合不一致的日期（空表 = 无漂移）
+    cols = ['kcal','protein_g','fat_g','carb_g','n','first_ts','last_ts']
+    with read_conn() as conn:
+        wm = archive_watermark(conn, 'intake_logs')
+        expect = pd.read_sql_query(_INTAKE_DAILY_AGG, conn, params=(wm,))
+        have = pd.read_sql_query('SELECT * FROM intake_daily WHERE date >= ?', conn, params=(wm,))
+    df = pd.merge(expect, have, on='date', how='outer', suffixes=('_expect','_rollup'), indicator=True)
+    bad = df['_merge'] != 'both'
+    for c in cols:
+        a, b = df[f'{c}_expect'], df[f'{c}_rollup']
+        if c in ('first_ts','last_ts'):
+            bad |= (a.fillna('') != b.fillna(''))
+        else:
+            bad |= (pd.to_numeric(a, errors='coerce') - pd.to_numeric(b, errors='coerce')).abs().fillna(0) > tol
+    return df.loc[bad].drop(columns=['_merge']).reset_index(drop=True)
 
-# === Added: activity log helpers (sqlite) ===
-import json as _json
 
-def ensure_activity_table():
-    execute(SCHEMA['activity_logs'])
-
-def log_activity(action: str, payload: dict):
-    ensure_activity_table()
-    execute("INSERT INTO activity_logs(action,payload) VALUES(?,?)", (action, _json.dumps(payload, ensure_ascii=False)))
-
-def fetch_activity_logs(limit: int = 50) -> pd.DataFrame:
-    ensure_activity_table()
-    return df_from_sql("SELECT id,ts,action,payload FROM activity_logs ORDER BY id DESC LIMIT ?", (int(limit),))
-
-def undo_last(date_hint: Optional[str] = None) -> str:
-    ensure_activity_table()
-    conn = get_conn(); cur = conn.cursor()
-    cur.execute("SELECT id, action, payload FROM activity_logs ORDER BY id DESC LIMIT 1")
-    row = cur.fetchone()
-    if not row:
-        return "无可撤销的操作"
-    log_id, action, payload = row[0], row[1], row[2]
-    try:
-        payload_obj = _json.loads(payload) if isinstance(payload, str) else (payload or {})
-    except Exception:
-        payload_obj = {}
-    msg = ""
-    if action == "add_intake":
-        # 删除该日期的最近一条摄入记录
-        d = payload_obj.get("date") or date_hint
-        if d:
-            ok = delete_last_intake_today(d)
-            msg = "撤销成功：删除刚保存的摄入记录" if ok else "未找到可删除的摄入记录"
-        else:
-            msg = "缺少日期信息，无法撤销"
-    else:
-        msg = f"暂不支持撤销的操作类型：{action}"
-    # 删除这条活动日志
-    cur.execute("DELETE FROM activity_logs WHERE id=?", (log_id,))
-    conn.commit()
-    return msg
+
+# —— 撤销 / 重做：按当前会话（data/journal.py 的 set_session / use_session） ——
+def _journal_step(redo: bool, session: Optional[str]) -> Optional[Dict[str, object]]:
+    with transaction() as conn:
+        res = journal.step(conn, redo, session)
+        if res is not None:
+            _tx_dirty(_writer_pool()).add('journal')
+            if not res['conflict']:
+                for t in res['tables']:
+                    _mark_dirty(f'DELETE FROM {t}')
+                # 日指标被恢复：滚动状态按表重建
+                if 'daily_metrics' in res['tables']:
+                    _save_history_state(conn, _build_history_state(conn))
+    return res
+
+def undo(session: Optional[str] = None) -> Optional[Dict[str, object]]:
+    # 撤销本会话最近一次写入；返回 {'action','detail','tables','conflict',...}，无可撤销时返回 None
+    return _journal_step(False, session)
+
+def redo(session: Optional[str] = None) -> Optional[Dict[str, object]]:
+    return _journal_step(True, session)
+
+def journal_peek(session: Optional[str] = None) -> Dict[str, Optional[Tuple[str, str]]]:
+    with read_conn() as conn:
+        return journal.peek(conn, session)
+
+def journal_entries(limit: int = 50) -> pd.DataFrame:
+    return df_from_sql('SELECT seq, ts, session, action, detail, undone FROM journal ORDER BY seq DESC LIMIT ?', (int(limit),))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import Dict, Optional
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+import pandas as pd
+from ..settings import EXPORT_CHUNK_ROWS
+from .db import read_conn
+from .archive import ARCHIVE_TABLES, arrow_schema, iter_archive, parquet_available
+
+EXPORT_TABLES: Dict[str, str] = {
+    'daily_metrics': 'date',
+    'daily_targets': 'date',
+    'intake_logs': 'ts',
+    'weekly_volume': 'date',
+}
+
+def snapshot_db(dst_path: str) -> None:
+    # 在线备份 API 一步拷完：得到某一时刻的一致快照；WAL 下读者不阻塞写者
+    dst = sqlite3.connect(dst_path)
+    try:
+        with read_conn() as src:
+            src.backup(dst)
+        dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dst.close()
+
+def _chunks(conn: sqlite3.Connection, table: str, start: Optional[str], end: Optional[str]):
+    where, params = [], []
+    if start:
+        where.append('date >= ?'); params.append(start)
+    if end:
+        where.append('date <= ?'); params.append(end)
+    sql = f'SELECT * FROM {table}' + (' WHERE ' + ' AND '.join(where) if where else '') + f' ORDER BY {EXPORT_TABLES[table]} ASC'
+    # 已归档的冷数据在前，热表在后；与 read_history 一样同一键以热表为准（归档后又改写过的行）
+    if table in ARCHIVE_TABLES:
+        key = ARCHIVE_TABLES[table]
+        hot = {r[0] for r in conn.execute(sql.replace('SELECT *', f'SELECT {key}', 1), tuple(params))}
+        for chunk in iter_archive(table, start, end):
+            chunk = chunk[~chunk[key].isin(hot)] if hot else chunk
+            if len(chunk) > 0:
+                yield chunk
+    yield from pd.read_sql_query(sql, conn, params=tuple(params), chunksize=EXPORT_CHUNK_ROWS)
+
+def _write_csv(zf: zipfile.ZipFile, name: str, chunks) -> None:
+    with zf.open(name, 'w', force_zip64=True) as raw:
+        out = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(out, index=False, header=header)
+            header = False
+        out.flush(); out.detach()
+
+def _write_parquet(zf: zipfile.ZipFile, conn: sqlite3.Connection, table: str, name: str, chunks, workdir: str) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema(conn, table)
+    tmp = os.path.join(workdir, name)
+    with pq.ParquetWriter(tmp, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    zf.write(tmp, name)
+    os.remove(tmp)
+
+_EXPORT_PREFIX = 'macrocoach_export_'
+
+def _cleanup_old_exports(max_age_s: float = 3600.0) -> None:
+    root = tempfile.gettempdir()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith(_EXPORT_PREFIX) and time.time() - os.path.getmtime(path) > max_age_s:
+            shutil.rmtree(path, ignore_errors=True)
+
+def export_bundle(fmt: str = 'csv', start: Optional[str] = None, end: Optional[str] = None,
+                  include_db: bool = False, db_name: str = 'macrocoach.db') -> str:
+    # 返回临时 zip 路径：先做一致快照，再逐表分块流式写入 zip，内存占用与表大小无关
+    if fmt == 'parquet' and not parquet_available():
+        raise RuntimeError('Parquet 导出需要安装 pyarrow')
+    _cleanup_old_exports()
+    workdir = tempfile.mkdtemp(prefix=_EXPORT_PREFIX)
+    snap = os.path.join(workdir, 'snapshot.db')
+    snapshot_db(snap)
+    zip_path = os.path.join(workdir, 'macrocoach_export.zip')
+    conn = sqlite3.connect(snap)
+    try:
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for table in EXPORT_TABLES:
+                chunks = _chunks(conn, table, start, end)
+                if fmt == 'parquet':
+                    _write_parquet(zf, conn, table, f'{table}.parquet', chunks, workdir)
+                else:
+                    _write_csv(zf, f'{table}.csv', chunks)
+            if include_db:
+                zf.write(snap, db_name)
+    finally:
+        conn.close()
+        os.remove(snap)
+    return zip_path
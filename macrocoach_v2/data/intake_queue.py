@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from concurrent.futures import Future, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import atexit
+import threading
+import time
+from ..settings import INTAKE_QUEUE_MS, INTAKE_QUEUE_ROWS
+from .athletes import current_athlete, use_athlete
+from .db import add_intake_rows, init_db
+from .journal import current_session
+
+# 摄入记录的写后队列：put() 立即返回 Future（结果为新行 id），后台线程在首条入队 max_ms 毫秒后、
+# 或攒够 max_rows 行时做一次组提交——摄入行与各自的撤销记录（journal）在同一事务中写入，一次 fsync。
+# 需要“读到自己的写入”时（如显示剩余宏量前）先调用 flush()；进程退出时自动写完剩余行。
+# 入队时记下调用方的会话，撤销记录归到该会话名下（后台线程没有调用方的 ContextVar）。
+Row = Tuple[str, str, float, float, float, float, str]
+
+class IntakeQueue:
+    def __init__(self, max_rows: int = INTAKE_QUEUE_ROWS, max_ms: float = INTAKE_QUEUE_MS):
+        self.max_rows = max(1, int(max_rows))
+        self.max_s = max(0.0, float(max_ms)) / 1000.0
+        self._pending: Dict[str, List[Tuple[Row, str, str, Future]]] = {}
+        self._inflight: Dict[str, List[Future]] = {}
+        self._first: Optional[float] = None
+        self._urgent = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.rows = 0
+
+    def _start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='macrocoach-intake-queue', daemon=True)
+            self._thread.start()
+
+    def put(self, d: str, meal_tag: str, kcal: float, protein_g: float, fat_g: float, carb_g: float, note: str = '',
+            athlete: Optional[str] = None) -> Future:
+        # 时间戳取入队时刻；运动员缺省为调用方当前的运动员，会话取调用方当前的会话
+        fut: Future = Future()
+        row = (d, meal_tag, float(kcal or 0.0), float(protein_g or 0.0), float(fat_g or 0.0), float(carb_g or 0.0), note or '')
+        ts = datetime.now().isoformat(timespec='seconds')
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('摄入队列已关闭')
+            self._start()
+            self._pending.setdefault(current_athlete() if athlete is None else athlete, []).append((row, ts, current_session(), fut))
+            if self._first is None:
+                self._first = time.monotonic()
+            if sum(len(v) for v in self._pending.values()) >= self.max_rows:
+                self._urgent = True
+            self._cond.notify()
+        return fut
+
+    def flush(self, athlete: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        # 阻塞直到此前入队（含正在提交）的该运动员的行都已写入；athlete='*' 表示全部运动员
+        with self._cond:
+            names = list(set(self._pending) | set(self._inflight)) if athlete == '*' else [current_athlete() if athlete is None else athlete]
+            futs = [f for a in names for f in [x[-1] for x in self._pending.get(a, [])] + self._inflight.get(a, [])]
+            if not futs:
+                return
+            self._urgent = True
+            self._cond.notify()
+        wait(futs, timeout)
+        for f in futs:
+            if f.done() and f.exception() is not None:
+                raise f.exception()
+
+    def _take(self) -> Dict[str, List[Tuple[Row, str, str, Future]]]:
+        # 持锁调用：取走全部待写行并登记为进行中
+        batch, self._pending = self._pending, {}
+        self._first, self._urgent = None, False
+        for a, items in batch.items():
+            self._inflight[a] = [f for *_, f in items]
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                # 首条入队后等到窗口结束；flush / 攒满 / 关闭时提前提交
+                while not (self._urgent or self._closed):
+                    left = self._first + self.max_s - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._take()
+            for a, items in batch.items():
+                try:
+                    with use_athlete(a):
+                        # 该运动员的库可能还没被任何读取打开过：先迁移（已迁移时只是一次集合查找）
+                        init_db()
+                        ids = add_intake_rows([x[0] for x in items], [x[1] for x in items], [x[2] for x in items])
+                except BaseException as e:
+                    for *_, f in items:
+                        f.set_exception(e)
+                else:
+                    for (*_, f), i in zip(items, ids):
+                        f.set_result(i)
+                    with self._cond:
+                        self.batches += 1
+                        self.rows += len(items)
+                finally:
+                    with self._cond:
+                        self._inflight.pop(a, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            return {'pending': sum(len(v) for v in self._pending.values()), 'batches': self.batches, 'rows': self.rows,
+                    'avg_batch': round(self.rows / self.batches, 1) if self.batches else 0.0}
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+_queue: Optional[IntakeQueue] = None
+_queue_lock = threading.Lock()
+
+def intake_queue() -> IntakeQueue:
+    # 进程内共享一个队列（Streamlit 各会话、HTTP API 共用）
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IntakeQueue()
+            atexit.register(_queue.close)
+        return _queue
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import sqlite3
+import zlib
+from ..settings import JOURNAL_MAX_ENTRIES
+
+# 撤销/重做日志：每次可撤销的写入登记其逆操作，按会话分栈（各会话只撤销自己的写入）。
+# 映像 image = {'t': 表, 'k': 键列, 'keys': [...], 'ranges': [[lo, hi], ...], 'cols': [...], 'rows': [[...], ...]}
+# 含义是“把这些键（及 id 区间）上的行恢复成 rows”：先删后插。应用映像时先取同一批键的当前行作为反向映像，
+# 所以撤销与重做完全对称——inverse 列在“撤销要应用的前像”和“重做要应用的后像”之间翻转。
+# 按日期主键的表取精确前像；只追加的表（摄入、周组数）按自增 id 区间记录，撤销时删除的正是当初插入的行。
+# 环形缓冲：slot = seq % JOURNAL_MAX_ENTRIES，新记录覆盖最旧的一条；
+# 撤销取该会话 undone=0 的最大 seq，重做取 undone=1 的最小 seq，各是一次索引查找。
+DEFAULT_SESSION = 'local'
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal(
+  slot INTEGER PRIMARY KEY,
+  seq INTEGER NOT NULL UNIQUE,
+  ts TEXT NOT NULL,
+  session TEXT NOT NULL,
+  action TEXT NOT NULL,
+  detail TEXT NOT NULL DEFAULT '',
+  undone INTEGER NOT NULL DEFAULT 0,
+  inverse BLOB NOT NULL,
+  digest INTEGER
+)
+"""
+JOURNAL_INDEX = 'CREATE INDEX IF NOT EXISTS idx_journal_session ON journal(session, undone, seq)'
+
+_session: ContextVar[str] = ContextVar('macrocoach_session', default=DEFAULT_SESSION)
+
+def current_session() -> str:
+    return _session.get()
+
+def set_session(name: str) -> None:
+    # 与 set_athlete 相同：Streamlit 每次重跑开头调用
+    _session.set(str(name))
+
+@contextmanager
+def use_session(name: str) -> Iterator[str]:
+    token = _session.set(str(name))
+    try:
+        yield name
+    finally:
+        _session.reset(token)
+
+# —— 紧凑编码：JSON；压缩后更短时存 zlib（小映像原样存，免去压缩头的开销） ——
+def pack(obj: Any) -> bytes:
+    raw = json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    z = zlib.compress(raw, 6)
+    return z if len(z) < len(raw) else raw
+
+def unpack(b: bytes) -> Any:
+    b = bytes(b)
+    return json.loads(b if b[:1] in (b'{', b'[') else zlib.decompress(b))
+
+def image(table: str, key: str = 'date', keys: Sequence[Any] = (), ranges: Sequence[Tuple[int, int]] = ()) -> Dict[str, Any]:
+    img: Dict[str, Any] = {'t': table, 'k': key}
+    if keys:
+        img['keys'] = list(dict.fromkeys(keys))
+    if ranges:
+        img['ranges'] = [[int(lo), int(hi)] for lo, hi in ranges]
+    return img
+
+_CHUNK = 500
+
+def _where(img: Dict[str, Any]) -> Iterator[Tuple[str, tuple]]:
+    k, keys = img['k'], img.get('keys', [])
+    for i in range(0, len(keys), _CHUNK):
+        part = keys[i:i + _CHUNK]
+        yield f'{k} IN ({",".join("?" * len(part))})', tuple(part)
+    for lo, hi in img.get('ranges', []):
+        yield f'{k} BETWEEN ? AND ?', (lo, hi)
+
+def snapshot(conn: sqlite3.Connection, img: Dict[str, Any]) -> Dict[str, Any]:
+    # 同一批键 / 区间上的当前行，作为映像
+    out = {k: v for k, v in img.items() if k not in ('cols', 'rows')}
+    out['cols'], out['rows'] = [], []
+    for where, params in _where(img):
+        cur = conn.execute(f'SELECT * FROM {img["t"]} WHERE {where}', params)
+        out['cols'] = [c[0] for c in cur.description]
+        out['rows'] += [list(r) for r in cur.fetchall()]
+    return out
+
+def apply(conn: sqlite3.Connection, img: Dict[str, Any]) -> Dict[str, Any]:
+    # 恢复映像，返回应用前的状态（反向映像）
+    back = snapshot(conn, img)
+    for where, params in _where(img):
+        conn.execute(f'DELETE FROM {img["t"]} WHERE {where}', params)
+    if img.get('rows'):
+        cols = img['cols']
+        conn.executemany(f'INSERT INTO {img["t"]}({",".join(cols)}) VALUES({",".join("?" * len(cols))})', img['rows'])
+    return back
+
+def digest(conn: sqlite3.Connection, images: Sequence[Dict[str, Any]]) -> Optional[int]:
+    # 按日期键的表可能被其它会话改写：记下应用前应有的状态，撤销/重做时核对；按 id 的行只属于写入它的操作，不核对
+    crc, keyed = 0, False
+    for img in images:
+        if img['k'] != 'id':
+            keyed = True
+            crc = zlib.crc32(json.dumps(snapshot(conn, img)['rows'], separators=(',', ':')).encode('utf-8'), crc)
+    return crc if keyed else None
+
+Entry = Tuple[str, str, str, List[Dict[str, Any]]]  # (会话, 动作, 说明, 写入前的映像)
+
+def record(conn: sqlite3.Connection, entries: Sequence[Entry]) -> None:
+    # 写入之后、提交之前调用，按顺序各占一个 seq；新写入清空所属会话的重做栈
+    entries = [(s, a, d, [i for i in imgs if i.get('keys') or i.get('ranges')]) for s, a, d, imgs in entries]
+    entries = [e for e in entries if e[3]]
+    if not entries or JOURNAL_MAX_ENTRIES <= 0:
+        return
+    conn.executemany('DELETE FROM journal WHERE session=? AND undone=1', [(s,) for s in dict.fromkeys(e[0] for e in entries)])
+    seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM journal').fetchone()[0]
+    ts = datetime.now().isoformat(timespec='seconds')
+    conn.executemany('INSERT OR REPLACE INTO journal(slot,seq,ts,session,action,detail,undone,inverse,digest) VALUES(?,?,?,?,?,?,0,?,?)',
+                     [((seq + n) % JOURNAL_MAX_ENTRIES, seq + n, ts, s, a, d[:200], pack(imgs), digest(conn, imgs))
+                      for n, (s, a, d, imgs) in enumerate(entries, 1)])
+
+def _top(conn: sqlite3.Connection, session: str, redo: bool) -> Optional[tuple]:
+    order = 'ASC' if redo else 'DESC'
+    return conn.execute(f'SELECT slot, seq, action, detail, inverse, digest FROM journal '
+                        f'WHERE session=? AND undone=? ORDER BY seq {order} LIMIT 1', (session, int(redo))).fetchone()
+
+def step(conn: sqlite3.Connection, redo: bool = False, session: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    # 撤销（或重做）该会话的下一条记录；无记录返回 None。
+    # 受影响的行已被其它会话改过时不应用，丢弃这条记录并返回 conflict=True（之后可继续撤销更早的记录）
+    row = _top(conn, current_session() if session is None else session, redo)
+    if row is None:
+        return None
+    slot, seq, action, detail, inverse, dg = row
+    images = unpack(inverse)
+    out = {'seq': seq, 'action': action, 'detail': detail, 'redo': redo, 'tables': sorted({i['t'] for i in images}), 'conflict': False}
+    if dg is not None and digest(conn, images) != dg:
+        conn.execute('DELETE FROM journal WHERE slot=?', (slot,))
+        out['conflict'] = True
+        return out
+    # 同一记录里可能先后两次写同一键：逆序应用，最早的前像最后落地；反向映像按应用顺序保存，下次同样逆序
+    back = [apply(conn, img) for img in reversed(images)]
+    conn.execute('UPDATE journal SET undone=?, inverse=?, digest=? WHERE slot=?', (int(not redo), pack(back), digest(conn, back), slot))
+    return out
+
+def peek(conn: sqlite3.Connection, session: Optional[str] = None) -> Dict[str, Optional[Tuple[str, str]]]:
+    # 下一步可撤销 / 可重做的 (action, detail)，供界面显示按钮
+    session = current_session() if session is None else session
+    return {name: (r[2], r[3]) if r else None for name, r in (('undo', _top(conn, session, False)), ('redo', _top(conn, session, True)))}
+
+def merge(pending: Sequence[Entry]) -> List[Entry]:
+    # 一个事务内的多次写入（如“保存今日计划”= 日指标 + 日目标）按会话合并为一条记录
+    out: Dict[str, Tuple[List[str], List[str], List[Dict[str, Any]]]] = {}
+    for session, action, detail, images in pending:
+        actions, details, imgs = out.setdefault(session, ([], [], []))
+        if action not in actions:
+            actions.append(action)
+        if detail and detail not in details:
+            details.append(detail)
+        imgs.extend(images)
+    return [(s, '+'.join(a), '; '.join(d), i) for s, (a, d, i) in out.items()]
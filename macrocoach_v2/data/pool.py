@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Iterator, Tuple
+import queue
+import sqlite3
+import threading
+import time
+
+# 有上限的 SQLite 连接池：同一线程内重入时复用已借出的连接
+class ConnectionPool:
+    def __init__(self, path: str, size: int, readonly: bool = False, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.size = max(1, int(size))
+        self.readonly = readonly
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._all: list = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.acquires = 0
+        self.waits = 0
+        self.wait_s = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        timeout = self.busy_timeout_ms / 1000.0
+        if self.readonly:
+            uri = Path(self.path).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, timeout=timeout, check_same_thread=False)
+        else:
+            # 事务由调用方显式 BEGIN/COMMIT 管理
+            conn = sqlite3.connect(self.path, timeout=timeout, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            grow = len(self._all) < self.size
+            if grow:
+                self._all.append(None)
+        if grow:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._all.remove(None)
+                raise
+            with self._lock:
+                self._all[self._all.index(None)] = conn
+            return conn
+        t0 = time.perf_counter()
+        conn = self._idle.get()
+        with self._lock:
+            self.waits += 1
+            self.wait_s += time.perf_counter() - t0
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self._acquire()
+        with self._lock:
+            self.acquires += 1
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'size': self.size, 'open': len(self._all), 'idle': self._idle.qsize(),
+                'acquires': self.acquires, 'waits': self.waits, 'wait_ms': round(self.wait_s * 1000.0, 1),
+            }
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._all.remove(conn)
+
+# 每个库文件（运动员分片）一对写/只读池；最多 max_open 个库保持打开的连接，超出（最久未用的先关）
+# 或空闲超过 idle_s 的库关闭其空闲连接。池对象本身保留（嵌套事务按池对象记深度），下次借用时重连。
+class ShardPools:
+    def __init__(self, size: int, busy_timeout_ms: int, max_open: int, idle_s: float):
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_open = max(1, int(max_open))
+        self.idle_s = float(idle_s)
+        self._pools: Dict[str, Tuple[ConnectionPool, ConnectionPool]] = {}
+        self._open: OrderedDict = OrderedDict()   # 可能有打开连接的库 → 最近使用时间；最近使用的在末尾
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        self.closed = 0
+
+    def get(self, path: str) -> Tuple[ConnectionPool, ConnectionPool]:
+        now = time.monotonic()
+        with self._lock:
+            pair = self._pools.get(path)
+            if pair is None:
+                pair = self._pools[path] = (
+                    ConnectionPool(path, self.size, busy_timeout_ms=self.busy_timeout_ms),
+                    ConnectionPool(path, self.size, readonly=True, busy_timeout_ms=self.busy_timeout_ms),
+                )
+            if path in self._open:
+                self._open.move_to_end(path)
+            self._open[path] = now
+            while len(self._open) > self.max_open:
+                self._close(next(iter(self._open)))
+            if now - self._swept > min(self.idle_s, 5.0):
+                self._swept = now
+                for k, used in list(self._open.items()):
+                    if now - used > self.idle_s:
+                        self._close(k)
+        return pair
+
+    def _close(self, path: str) -> None:
+        # 只关闭空闲连接；借出中的连接归还后留在池内，下次 get 时重新计入
+        self._open.pop(path, None)
+        for p in self._pools[path]:
+            p.close()
+        self.closed += 1
+
+    def close(self, path: str) -> None:
+        with self._lock:
+            if path in self._pools:
+                self._close(path)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {'shards': len(self._pools), 'open_shards': len(self._open), 'max_open': self.max_open, 'closed': self.closed}
@@ -4,6 +4,8 @@ from typing import List, Tuple
 from .models import ActivityBlock, UserProfile
 from ..settings import MET_TABLE, CARB_FLOOR_HIGH_INT, CARB_FLOOR_MOD_INT
 
+KCAL_PER_KG_FAT = 7700.0
+
 def mifflin_bmr(sex: str, age: int, height_cm: float, weight_kg: float) -> float:
     return float(10*weight_kg + 6.25*height_cm - 5*age + (5 if sex.lower()=='male' else -161))
 
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import math
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+from .models import HistoryState
+from .trend import trend_init, trend_predict, trend_update, weekly_loss, weekly_loss_band
+from ..settings import TREND_MIN_WEIGHINS
+
+# plan_day / plan_days / 回算 / 模拟共用的滚动状态（整表历史经 planner.history_state_from_df 转成同一状态）：
+# 趋势 → 称重够 TREND_MIN_WEIGHINS 次用滤波斜率，否则最近 14 个体重的 7 对 7 均值；睡眠护栏 → 最近 7 行睡眠；
+# predict_next_day → 最近 14 行的 EMA
+WEIGHT_WINDOW = 14
+ROW_WINDOW = 14
+SLEEP_WINDOW = 7
+RECENT_COLS = ('fatigue', 'sleep_h', 'load_index', 'perf_pct')
+
+def _num(x) -> float:
+    try:
+        v = float(x)
+    except (TypeError, ValueError):
+        return math.nan
+    return v
+
+def ewm_last(vals: Iterable[float], alpha: float) -> float:
+    # pandas ewm(alpha, adjust=False).mean().iloc[-1]（ignore_na=False）：缺失值不更新均值，但权重照常衰减
+    out, old_wt, factor = math.nan, 1., 1. - alpha
+    for cur in vals:
+        obs = cur == cur
+        if out == out:
+            old_wt *= factor
+            if obs:
+                if out != cur:
+                    out = (old_wt * out + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.
+        elif obs:
+            out = cur
+    return float(out)
+
+def _days_between(a: str, b: str) -> int:
+    return (date.fromisoformat(b[:10]) - date.fromisoformat(a[:10])).days
+
+def push_weight(state: HistoryState, d: str, w: float) -> None:
+    # 体重窗口 + 趋势滤波：先把滤波预测到当天，再用当天称重更新
+    state.weights.append(w)
+    del state.weights[:-WEIGHT_WINDOW]
+    if state.trend and state.trend_date:
+        state.trend = trend_update(trend_predict(state.trend, _days_between(state.trend_date, d)), w)
+    else:
+        state.trend = trend_init(w)
+    state.trend_date = d
+    state.n_weighins += 1
+
+def push_day(state: HistoryState, d: str, row: Dict[str, object]) -> None:
+    # O(1)：追加一天（调用方保证 d 晚于 state.last_date）
+    w = _num(row.get('weight'))
+    if not math.isnan(w):
+        push_weight(state, d, w)
+    state.recent.append([_num(row.get(c)) for c in RECENT_COLS])
+    del state.recent[:-ROW_WINDOW]
+    state.last_date = d
+
+def state_from_rows(rows: Iterable[Dict[str, object]]) -> HistoryState:
+    # rows 需按日期升序
+    state = HistoryState()
+    for r in rows:
+        push_day(state, str(r['date']), r)
+    return state
+
+def _seq_sum(vals: List[float]) -> float:
+    # 与 numpy 对 <8 个元素的顺序累加一致
+    total = 0.
+    for v in vals:
+        total += v
+    return total
+
+def trend_loss(state: Optional[HistoryState]) -> Optional[float]:
+    # 趋势滤波给出的每周下降(kg)；称重次数不足时为 None
+    if state is None or not state.trend or state.n_weighins < TREND_MIN_WEIGHINS:
+        return None
+    return float(weekly_loss(state.trend))
+
+def trend_summary(state: Optional[HistoryState], as_of: Optional[str] = None) -> Optional[Dict[str, float]]:
+    # 平滑体重（预测到 as_of）、每周下降及 95% 区间半宽
+    if state is None or not state.trend or not state.trend_date:
+        return None
+    t = state.trend
+    if as_of and as_of > state.trend_date:
+        t = trend_predict(t, _days_between(state.trend_date, as_of))
+    return {'level': t[0], 'level_band': 1.96 * math.sqrt(max(0.0, t[2])),
+            'loss_kg_wk': weekly_loss(t), 'loss_band': weekly_loss_band(t), 'n_weighins': state.n_weighins}
+
+def loss_obs(state: Optional[HistoryState]) -> Optional[float]:
+    # 称重次数足够时用趋势斜率；否则最近 14 个体重的 7 对 7 均值，不足 8 个体重记录时为 None
+    tl = trend_loss(state)
+    if tl is not None:
+        return float(max(0.0, tl))
+    if state is None or len(state.weights) < 8:
+        return None
+    w = state.weights
+    last7 = _seq_sum(w[-7:]) / 7
+    prev7 = _seq_sum(w[:7]) / 7
+    return float(max(0.0, prev7 - last7))
+
+def sleep_ema(state: Optional[HistoryState]) -> Optional[float]:
+    if state is None:
+        return None
+    vals = [r[1] for r in state.recent[-SLEEP_WINDOW:] if r[1] == r[1]]
+    return ewm_last(vals, 0.5) if vals else None
+
+def recent_emas(state: HistoryState, alpha: float = 0.3) -> Dict[str, float]:
+    return {c: ewm_last([r[i] for r in state.recent], alpha) for i, c in enumerate(RECENT_COLS)}
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional
 
 @dataclass
 class UserProfile:
@@ -22,3 +22,24 @@ class ActivityBlock:
 @dataclass
 class PIDConfig:
     Kp: float; Ki: float; Kd: float; integral_cap: float = 0.2
+
+@dataclass
+class HistoryState:
+    # 日指标的滚动窗口：最近 14 个有体重的记录、最近 14 行 (fatigue, sleep_h, load_index, perf_pct)；
+    # 体重趋势滤波状态 [水平, 斜率, p00, p01, p11]（截至 trend_date）与累计称重次数
+    last_date: Optional[str] = None
+    weights: List[float] = field(default_factory=list)
+    recent: List[List[Optional[float]]] = field(default_factory=list)
+    trend: List[float] = field(default_factory=list)
+    trend_date: Optional[str] = None
+    n_weighins: int = 0
+
+@dataclass
+class TdeeState:
+    # 自适应 TDEE 的逐日状态（截至 last_date）：逐日推进的体重趋势滤波、累计称重次数、
+    # 观测/公式 TDEE 比值的 EMA 与有效观测天数
+    last_date: Optional[str] = None
+    trend: List[float] = field(default_factory=list)
+    n_weighins: int = 0
+    ratio_ema: Optional[float] = None
+    n_obs: int = 0
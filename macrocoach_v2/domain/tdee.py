@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import math
+from typing import Dict
+from .models import TdeeState
+from .calcs import KCAL_PER_KG_FAT
+from .trend import trend_init, trend_predict, trend_update
+from ..settings import (TREND_MIN_WEIGHINS, TDEE_MIN_LOGGED_DAYS, TDEE_EMA_DAYS, TDEE_FULL_CONFIDENCE_DAYS,
+                        TDEE_FACTOR_MIN, TDEE_FACTOR_MAX)
+
+# 自适应 TDEE：观测 TDEE = 窗口内日均摄入 − 日均储能变化（趋势斜率 kg/天 × 7700 kcal/kg）。
+# 观测值与同窗口公式 TDEE 的比值做 EMA，再按有效观测天数从 1 逐步过渡到该比值，
+# 得到作用于当天公式 TDEE 的校正系数。每天 O(1) 推进，状态可持久化。
+
+def tdee_factor(state: TdeeState) -> float:
+    if state.ratio_ema is None or state.n_obs == 0:
+        return 1.0
+    conf = min(1.0, state.n_obs / float(max(1, TDEE_FULL_CONFIDENCE_DAYS)))
+    return float(min(TDEE_FACTOR_MAX, max(TDEE_FACTOR_MIN, 1.0 + conf * (state.ratio_ema - 1.0))))
+
+def tdee_step(state: TdeeState, d: str, weight: float, intake_mean: float, logged_days: int,
+              formula_mean: float) -> Dict[str, float]:
+    # 推进一天（调用方保证 d 为 last_date 的次日）；weight / intake_mean / formula_mean 缺失为 NaN
+    if state.trend:
+        state.trend = trend_predict(state.trend, 1)
+    if not math.isnan(weight):
+        state.trend = trend_update(state.trend, weight) if state.trend else trend_init(weight)
+        state.n_weighins += 1
+    slope = state.trend[1] if state.trend else math.nan
+    observed = math.nan
+    if state.n_weighins >= TREND_MIN_WEIGHINS and logged_days >= TDEE_MIN_LOGGED_DAYS and not math.isnan(intake_mean):
+        observed = intake_mean - slope * KCAL_PER_KG_FAT
+    ratio = observed / formula_mean if formula_mean > 0 else math.nan
+    if ratio == ratio:
+        a = 2.0 / (TDEE_EMA_DAYS + 1.0)
+        state.ratio_ema = ratio if state.ratio_ema is None else state.ratio_ema + a * (ratio - state.ratio_ema)
+        state.n_obs += 1
+    state.last_date = d
+    factor = tdee_factor(state)
+    return {
+        'trend_level': state.trend[0] if state.trend else math.nan, 'trend_slope': slope,
+        'observed_tdee': observed, 'ratio': ratio, 'factor': factor,
+        'adaptive_tdee': formula_mean * factor,
+    }
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import math
+from typing import Dict, List
+import numpy as np
+from ..settings import TREND_LEVEL_VAR, TREND_SLOPE_VAR, TREND_OBS_VAR, TREND_SLOPE0_VAR
+
+# 局部线性趋势 Kalman 滤波：状态 = [水平 kg, 斜率 kg/天]，协方差存为 (p00, p01, p11)。
+# 每天一次预测，有称重时再做一次更新；缺测的日子只预测，不需要插值。
+# 逐日增量版本（trend_*，作用于 5 元列表）与整段向量化版本（filter_weights）运算顺序相同，结果逐位一致。
+Z95 = 1.96
+
+def trend_init(w: float) -> List[float]:
+    return [float(w), 0.0, TREND_OBS_VAR, 0.0, TREND_SLOPE0_VAR]
+
+def trend_predict(t: List[float], days: int = 1) -> List[float]:
+    lvl, slope, p00, p01, p11 = t
+    for _ in range(max(0, int(days))):
+        lvl = lvl + slope
+        p00 = p00 + 2*p01 + p11 + TREND_LEVEL_VAR
+        p01 = p01 + p11
+        p11 = p11 + TREND_SLOPE_VAR
+    return [lvl, slope, p00, p01, p11]
+
+def trend_update(t: List[float], y: float) -> List[float]:
+    lvl, slope, p00, p01, p11 = t
+    s = p00 + TREND_OBS_VAR
+    k0, k1 = p00 / s, p01 / s
+    innov = y - lvl
+    return [lvl + k0*innov, slope + k1*innov, (1 - k0)*p00, (1 - k0)*p01, p11 - k1*p01]
+
+def weekly_loss(t: List[float]) -> float:
+    # 正值 = 每周下降 kg
+    return -t[1] * 7.0
+
+def weekly_loss_band(t: List[float]) -> float:
+    return Z95 * 7.0 * float(np.sqrt(max(0.0, t[4])))
+
+def filter_weights(W: np.ndarray) -> Dict[str, np.ndarray]:
+    # W：按天等间隔的体重，形状 (天数,) 或 (序列数, 天数)，缺测为 NaN；各序列在首个称重日初始化，之前为 NaN
+    W = np.asarray(W, dtype=float)
+    single = W.ndim == 1
+    if single:
+        return _filter_one(W)
+    k, T = W.shape
+    out = {n: np.full((k, T), np.nan) for n in ('level', 'slope', 'level_sd', 'slope_sd')}
+    lvl, slope = np.full(k, np.nan), np.full(k, np.nan)
+    p00, p01, p11 = np.full(k, np.nan), np.full(k, np.nan), np.full(k, np.nan)
+    for i in range(T):
+        y = W[:, i]
+        obs = ~np.isnan(y)
+        started = ~np.isnan(lvl)
+        # 已初始化的序列：预测一天
+        lvl = np.where(started, lvl + slope, lvl)
+        p00 = np.where(started, p00 + 2*p01 + p11 + TREND_LEVEL_VAR, p00)
+        p01 = np.where(started, p01 + p11, p01)
+        p11 = np.where(started, p11 + TREND_SLOPE_VAR, p11)
+        # 更新
+        upd = started & obs
+        s = p00 + TREND_OBS_VAR
+        k0, k1 = p00 / s, p01 / s
+        innov = y - lvl
+        lvl, slope, p00, p01, p11 = (np.where(upd, lvl + k0*innov, lvl), np.where(upd, slope + k1*innov, slope),
+                                     np.where(upd, (1 - k0)*p00, p00), np.where(upd, (1 - k0)*p01, p01),
+                                     np.where(upd, p11 - k1*p01, p11))
+        # 首次称重：初始化
+        init = ~started & obs
+        lvl = np.where(init, y, lvl); slope = np.where(init, 0.0, slope)
+        p00 = np.where(init, TREND_OBS_VAR, p00); p01 = np.where(init, 0.0, p01); p11 = np.where(init, TREND_SLOPE0_VAR, p11)
+        out['level'][:, i], out['slope'][:, i] = lvl, slope
+        out['level_sd'][:, i], out['slope_sd'][:, i] = np.sqrt(p00), np.sqrt(p11)
+    return out
+
+def _filter_one(W: np.ndarray) -> Dict[str, np.ndarray]:
+    # 单条序列：逐日标量运算（与上面的向量化版本运算顺序相同、结果逐位一致），长序列时快一个数量级
+    T = len(W)
+    level, slope_out, level_sd, slope_sd = np.full(T, np.nan), np.full(T, np.nan), np.full(T, np.nan), np.full(T, np.nan)
+    t: List[float] = []
+    for i, y in enumerate(W.tolist()):
+        if t:
+            t = trend_predict(t, 1)
+            if y == y:
+                t = trend_update(t, y)
+        elif y == y:
+            t = trend_init(y)
+        else:
+            continue
+        level[i], slope_out[i], level_sd[i], slope_sd[i] = t[0], t[1], math.sqrt(t[2]), math.sqrt(t[4])
+    return {'level': level, 'slope': slope_out, 'level_sd': level_sd, 'slope_sd': slope_sd}
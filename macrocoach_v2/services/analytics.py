@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from ..settings import TREND_MIN_WEIGHINS
+from ..domain.trend import filter_weights, Z95
+from ..data.db import df_from_sql, intake_aggregate_by_day, volume_last_n_days
+from ..data.archive import read_history
+from .tdee import tdee_estimates
+
+# 报告页的全部序列：一次读取（load_report_data），整列向量化计算（report_series）；
+# 输出的 date 列已是 datetime64，报告页只负责画图。
+
+def load_report_data() -> Dict[str, pd.DataFrame]:
+    return {
+        'metrics': read_history('daily_metrics'),
+        'targets': df_from_sql('SELECT * FROM daily_targets ORDER BY date ASC'),
+        'intake': intake_aggregate_by_day(),
+        'volume': volume_last_n_days(7),
+        'tdee': tdee_estimates(),
+    }
+
+def _num(df: pd.DataFrame, cols: List[str]) -> pd.DataFrame:
+    out = pd.DataFrame({'date': pd.to_datetime(df['date'], format='ISO8601')}) if 'date' in df else pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]')})
+    for c in cols:
+        out[c] = pd.to_numeric(df[c], errors='coerce') if c in df else np.nan
+    return out
+
+def weight_trend(metrics: pd.DataFrame) -> Optional[Dict[str, pd.DataFrame]]:
+    # 体重按天展开（缺测为 NaN）后整段滤波；称重不足 TREND_MIN_WEIGHINS 次时返回 None
+    wd = metrics[['date', 'weight']].dropna()
+    if len(wd) < TREND_MIN_WEIGHINS:
+        return None
+    wd = wd.sort_values('date')
+    days = pd.date_range(wd['date'].iloc[0], wd['date'].iloc[-1], freq='D')
+    W = np.full(len(days), np.nan)
+    W[(wd['date'] - days[0]).dt.days.to_numpy()] = wd['weight'].to_numpy()
+    tr = filter_weights(W)
+    lvl = tr['level']
+    pct = (-tr['slope'] * 7.0) / lvl * 100.0
+    pct_band = Z95 * 7.0 * tr['slope_sd'] / lvl * 100.0
+    band = Z95 * tr['level_sd']
+    trend = pd.DataFrame({
+        'date': days, 'level': lvl, 'level_lo': lvl - band, 'level_hi': lvl + band,
+        'pct': pct, 'pct_lo': pct - pct_band, 'pct_hi': pct + pct_band,
+        'ok': np.cumsum(~np.isnan(W)) >= TREND_MIN_WEIGHINS,
+    })
+    return {'trend': trend, 'weighins': wd.reset_index(drop=True)}
+
+def energy_availability(metrics: pd.DataFrame, intake: pd.DataFrame, weight_kg: float,
+                        body_fat_pct: Optional[float]) -> pd.DataFrame:
+    # EA = (摄入 - 运动消耗) / FFM；无体重的日子用侧栏体重，无摄入、无负荷记为 0；7 天滚动均值
+    if len(metrics) == 0 or len(intake) == 0:
+        return pd.DataFrame(columns=['date', 'EA', 'EA_7d'])
+    kcal = metrics['date'].map(pd.Series(intake['kcal'].to_numpy(), index=intake['date'])).fillna(0.0).to_numpy()
+    w = metrics['weight'].to_numpy()
+    w = np.where(w > 0, w, float(weight_kg))
+    bf = float(body_fat_pct) if body_fat_pct is not None else 24.0
+    ffm = np.maximum(w * (1 - bf/100.0), 1e-6)
+    ex = 3.5 * w * np.nan_to_num(metrics['load_index'].to_numpy(float), nan=0.0) / 200.0
+    ea = pd.Series((kcal - ex) / ffm)
+    return pd.DataFrame({'date': metrics['date'].to_numpy(), 'EA': ea.to_numpy(),
+                         'EA_7d': ea.rolling(window=7, min_periods=1).mean().to_numpy()})
+
+def protein_adherence(targets: pd.DataFrame, intake: pd.DataFrame) -> pd.DataFrame:
+    # 每日摄入蛋白 / 当日目标蛋白（无摄入记为 0，封顶 200%）
+    if len(targets) == 0:
+        return pd.DataFrame(columns=['date', 'rate'])
+    got = targets['date'].map(pd.Series(intake['protein_g'].to_numpy(), index=intake['date'])).fillna(0.0) if len(intake) else 0.0
+    rate = (got / targets['protein_g']).clip(upper=2.0) * 100.0
+    return pd.DataFrame({'date': targets['date'].to_numpy(), 'rate': np.asarray(rate, dtype=float)})
+
+def volume_summary(volume: pd.DataFrame) -> Dict[str, object]:
+    if len(volume) == 0:
+        return {'sets': pd.DataFrame(columns=['muscle_group', 'sets']), 'tips': []}
+    dfv = volume.groupby('muscle_group', as_index=False)['sets'].sum()
+    tips = [f"{g} < 10 组/周：考虑增加。" if n < 10 else f"{g} > 20 组/周：若疲劳高/睡眠差，考虑降量一周。"
+            for g, n in zip(dfv['muscle_group'], dfv['sets']) if n < 10 or n > 20]
+    return {'sets': dfv, 'tips': tips}
+
+def report_series(data: Dict[str, pd.DataFrame], weight_kg: float, body_fat_pct: Optional[float]) -> Dict[str, object]:
+    metrics = _num(data['metrics'], ['weight', 'sleep_h', 'load_index'])
+    targets = _num(data['targets'], ['tdee_used', 'target_kcal', 'protein_g'])
+    intake = _num(data['intake'], ['kcal', 'protein_g'])
+    tdee = _num(data['tdee'], ['formula_tdee', 'observed_tdee', 'adaptive_tdee', 'factor', 'ratio', 'logged_days'])
+    return {
+        'metrics': metrics,
+        'targets': targets,
+        'tdee': tdee,
+        'weight_trend': weight_trend(metrics),
+        'ea': energy_availability(metrics, intake, weight_kg, body_fat_pct),
+        'protein': protein_adherence(targets, intake),
+        'volume': volume_summary(data['volume']),
+    }
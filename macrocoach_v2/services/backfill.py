@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from datetime import date
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from ..settings import EA_MIN_DEFAULT, EA_PREF_DEFAULT, TRAINING_LOAD_THRESHOLD, TRAINING_DAY_CARB_BUMP_G_PER_KG
+from ..domain.models import UserProfile, PIDConfig, HistoryState
+from ..domain.history import push_day, loss_obs, sleep_ema
+from ..data.db import df_from_sql, executemany, journaled
+from ..data.archive import read_history
+from .batch_planner import plan_days, activity_from_load
+from .tdee import tdee_estimates
+
+# 指标缺失时采用“今日计划”表单的默认值
+_FORM_DEFAULTS = {'fatigue': 4.0, 'sleep_h': 7.5, 'perf_pct': 0.0}
+TARGET_COLS = ['target_kcal', 'protein_g', 'fat_g', 'carb_g', 'bmr', 'pal', 'tdee_used', 'deficit', 'ea', 'tdee_formula']
+
+def replay_targets(profile: UserProfile, start: date, end: date,
+                   loss_rate_pct: float, auto_mode: bool, pid_cfg: PIDConfig,
+                   apply_suggestions: bool = False,
+                   protein_basis: str = 'FFM', protein_per_kg_ffm: float = 2.6,
+                   ea_min: float = EA_MIN_DEFAULT, ea_pref: float = EA_PREF_DEFAULT,
+                   training_day_carb_bump_g_per_kg: float = TRAINING_DAY_CARB_BUMP_G_PER_KG,
+                   training_load_threshold: float = TRAINING_LOAD_THRESHOLD,
+                   adaptive_tdee: bool = False) -> pd.DataFrame:
+    # 按日期顺序重放区间内每个有日指标的日期；每天只看到“当天之前”的历史
+    # adaptive_tdee：每天使用前一天结束时的自适应 TDEE 系数（估计器只依赖公式 TDEE，回写不会形成反馈）
+    dm = read_history('daily_metrics')
+    s, e = start.isoformat(), end.isoformat()
+    # 与 metrics_state 同一套滚动窗口逻辑
+    hist = HistoryState()
+    days: List[Tuple[str, float, float, float, float, float, float, float, float]] = []
+    for row in dm[['date', 'weight', 'steps', 'sleep_h', 'fatigue', 'perf_pct', 'load_index']].itertuples(index=False):
+        if row.date > e:
+            break
+        if row.date >= s:
+            lo, se = loss_obs(hist), sleep_ema(hist)
+            days.append((row.date, row.weight, row.steps, row.sleep_h, row.fatigue, row.perf_pct, row.load_index,
+                         np.nan if lo is None else lo, np.nan if se is None else se))
+        push_day(hist, row.date, row._asdict())
+    cols = ['date', 'weight', 'steps', 'sleep_h', 'fatigue', 'perf_pct', 'load_index', 'loss_obs', 'sleep_ema']
+    inp = pd.DataFrame(days, columns=cols)
+    if len(inp) == 0:
+        return pd.DataFrame(columns=['date'] + TARGET_COLS + ['ea_guard_applied', 'day_type'])
+    for c, v in _FORM_DEFAULTS.items():
+        inp[c] = pd.to_numeric(inp[c], errors='coerce').fillna(v)
+
+    weight = pd.to_numeric(inp['weight'], errors='coerce').to_numpy(float)
+    steps = pd.to_numeric(inp['steps'], errors='coerce').to_numpy(float)
+    # 回算时没有原始的分项运动记录，按当日负荷还原
+    act_minutes, act_met = activity_from_load(pd.to_numeric(inp['load_index'], errors='coerce').to_numpy(float))
+    current_w = np.where(weight > 0, weight, float(profile.weight_kg))
+    factor = np.nan
+    if adaptive_tdee:
+        est = tdee_estimates()
+        prev = (pd.to_datetime(inp['date']) - pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d')
+        factor = prev.map(dict(zip(est['date'], est['factor'])) if len(est) else {}).to_numpy(float)
+    res = plan_days(
+        profile, act_minutes, act_met,
+        np.where(steps > 0, np.trunc(steps), np.nan), auto_mode, current_w * (float(loss_rate_pct)/100.0), pid_cfg,
+        np.trunc(inp['fatigue'].to_numpy(float)), inp['sleep_h'].to_numpy(float), inp['perf_pct'].to_numpy(float),
+        apply_suggestions, inp['loss_obs'].to_numpy(float), inp['sleep_ema'].to_numpy(float), weight,
+        protein_basis=protein_basis, protein_per_kg_ffm=protein_per_kg_ffm, ea_min=ea_min, ea_pref=ea_pref,
+        training_day_carb_bump_g_per_kg=training_day_carb_bump_g_per_kg, training_load_threshold=training_load_threshold,
+        tdee_factor=factor,
+    )
+    out = res[TARGET_COLS].copy()
+    out.insert(0, 'date', inp['date'].to_numpy())
+    # 与“今日计划”保存时的口径一致
+    out['ea_guard_applied'] = (res['ea'] < float(ea_min)).astype(int)
+    out['day_type'] = np.where(res['deficit'] > 0, 'deficit', 'maintain')
+    return out
+
+def diff_targets(new: pd.DataFrame, tol: float = 1e-9) -> pd.DataFrame:
+    # 干跑：与库中现有 daily_targets 对比，只返回会改变的日期（旧值/新值并列）
+    if len(new) == 0:
+        return pd.DataFrame(columns=['date', 'changed'])
+    old = df_from_sql(f"SELECT date, {', '.join(TARGET_COLS)} FROM daily_targets WHERE date >= ? AND date <= ?",
+                      (str(new['date'].iloc[0]), str(new['date'].iloc[-1])))
+    m = new.merge(old, on='date', how='left', suffixes=('', '_old'))
+    changed = np.zeros(len(m), dtype=bool)
+    names = [[] for _ in range(len(m))]
+    for c in TARGET_COLS:
+        a = m[c].to_numpy(float)
+        b = pd.to_numeric(m[f'{c}_old'], errors='coerce').to_numpy(float)
+        diff = np.isnan(b) | (np.abs(a - b) > tol)
+        changed |= diff
+        for i in np.flatnonzero(diff):
+            names[i].append(c)
+    m['changed'] = [', '.join(n) for n in names]
+    m = m[changed]
+    cols = ['date', 'changed']
+    for c in ('target_kcal', 'protein_g', 'fat_g', 'carb_g', 'deficit'):
+        cols += [f'{c}_old', c]
+    return m[cols].reset_index(drop=True)
+
+def write_targets(new: pd.DataFrame, notes: str = '回算') -> int:
+    # 一个事务批量写入
+    rows = [(r[0], *[float(x) for x in r[1:11]], int(r[11]), notes, r[12])
+            for r in new[['date'] + TARGET_COLS + ['ea_guard_applied', 'day_type']].itertuples(index=False, name=None)]
+    dates = [r[0] for r in rows]
+    with journaled('backfill', f'{dates[0]}~{dates[-1]}' if dates else '', keys={'daily_targets': dates}):
+        return executemany("""
+            INSERT OR REPLACE INTO daily_targets
+            (date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,deficit,ea,tdee_formula,ea_guard_applied,notes,day_type,source)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,'backfill')
+        """, rows)
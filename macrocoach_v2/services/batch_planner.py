@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from dataclasses import fields, replace
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+from ..settings import (EA_MIN_DEFAULT, EA_PREF_DEFAULT, TRAINING_LOAD_THRESHOLD, TRAINING_DAY_CARB_BUMP_G_PER_KG,
+                        CARB_FLOOR_HIGH_INT, CARB_FLOOR_MOD_INT)
+from ..domain.models import UserProfile, ActivityBlock, PIDConfig
+from ..domain.calcs import resolve_met
+from ..domain.history import loss_obs as state_loss_obs, sleep_ema as state_sleep_ema
+from .planner import KCAL_PER_KG_FAT, history_state_from_df
+
+# plan_day 的批量版本：每个参数可以是标量或数组（按 NumPy 广播），一行对应一个“运动员-日”。
+# 运算顺序与 plan_day 逐项一致，因此结果与逐日调用 plan_day 完全相同；
+# “缺失”统一用 NaN 表示（steps / today_weight / body_fat_pct / loss_obs / sleep_ema）。
+
+ArrayLike = Union[float, int, bool, str, Sequence, np.ndarray]
+
+PLAN_COLUMNS = ['weight_kg', 'bmr', 'pal', 'exercise_kcal', 'tdee_used', 'tdee_formula', 'deficit', 'target_kcal', 'protein_g', 'fat_g',
+                'carb_g', 'load_index', 'ea', 'ffm', 'ea_guard_applied', 'is_training_day', 'weekly_loss_pct',
+                'target_loss_pct', 'intended_kcal', 'ea_floor_kcal']
+
+def _f(x: ArrayLike) -> np.ndarray:
+    if x is None:
+        return np.array(np.nan)
+    a = np.asarray(x)
+    if a.dtype == object:
+        a = np.array([np.nan if v is None else v for v in a.ravel()], dtype=float).reshape(a.shape)
+    return a.astype(float)
+
+def _round(x: np.ndarray, nd: int) -> np.ndarray:
+    # np.round 先乘 10**nd 再取整，接近 .5 的值可能与内置 round 不同：这些少数元素回退到内置 round
+    if nd == 0:
+        return np.rint(x)
+    scaled = x * 10.0**nd
+    out = np.round(x, nd)
+    frac = np.abs(scaled - np.floor(scaled) - 0.5)
+    amb = np.flatnonzero(np.isfinite(x) & (frac < 1e-6))
+    if len(amb):
+        flat = out.reshape(-1)
+        src = x.reshape(-1)
+        for i in amb:
+            flat[i] = round(float(src[i]), nd)
+    return out
+
+def _clamp(v: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    return np.maximum(lo, np.minimum(hi, v))
+
+def activity_arrays(acts_per_day: Sequence[Sequence[ActivityBlock]]) -> Tuple[np.ndarray, np.ndarray]:
+    # 把每天的 ActivityBlock 列表整理成 (天数, 最多块数) 的分钟与 MET 矩阵；不足的位置补 0 分钟
+    k = max([len(a) for a in acts_per_day] + [1])
+    minutes = np.zeros((len(acts_per_day), k))
+    mets = np.zeros((len(acts_per_day), k))
+    for i, acts in enumerate(acts_per_day):
+        for j, a in enumerate(acts):
+            if a.minutes <= 0:
+                continue
+            minutes[i, j] = float(a.minutes)
+            mets[i, j] = resolve_met(a.name, a.intensity)
+    return minutes, mets
+
+# 只知道当日负荷时：还原成等负荷的 strength/moderate（MET=5.0，分钟=负荷/5）；运动消耗只取决于 MET×分钟 之和
+LOAD_MET = 5.0
+
+def activity_from_load(load_index: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    load = np.nan_to_num(np.atleast_1d(_f(load_index)), nan=0.0)
+    return (load / LOAD_MET)[:, None], np.full((len(load), 1), LOAD_MET)
+
+def hist_inputs(dm_hist: Optional[pd.DataFrame]) -> Tuple[float, float]:
+    # 与 plan_day 对同一份历史的处理一致（同一个滚动状态）：返回 (loss_obs, sleep_ema)，缺失为 NaN
+    state = history_state_from_df(dm_hist)
+    loss_obs, sleep_ema = state_loss_obs(state), state_sleep_ema(state)
+    return (np.nan if loss_obs is None else float(loss_obs)), (np.nan if sleep_ema is None else float(sleep_ema))
+
+def plan_days(profile: UserProfile,
+              act_minutes: ArrayLike,
+              act_met: ArrayLike,
+              steps: ArrayLike,
+              auto_mode: ArrayLike,
+              target_loss_week_kg: ArrayLike,
+              pid_cfg: PIDConfig,
+              fatigue: ArrayLike, sleep_h: ArrayLike, perf_change_pct: ArrayLike,
+              apply_suggestions: ArrayLike,
+              loss_obs: ArrayLike,
+              sleep_ema: ArrayLike,
+              today_weight: ArrayLike,
+              protein_basis: ArrayLike = 'FFM',
+              protein_per_kg_ffm: ArrayLike = 2.6,
+              ea_min: ArrayLike = EA_MIN_DEFAULT,
+              ea_pref: ArrayLike = EA_PREF_DEFAULT,
+              training_day_carb_bump_g_per_kg: ArrayLike = TRAINING_DAY_CARB_BUMP_G_PER_KG,
+              training_load_threshold: ArrayLike = TRAINING_LOAD_THRESHOLD,
+              tdee_factor: ArrayLike = np.nan
+              ) -> pd.DataFrame:
+    # profile / pid_cfg 的字段同样可以是数组；act_minutes / act_met 形如 (行数, 块数)，块按 plan_day 中 acts 的顺序累加
+    # tdee_factor 为 NaN 的行只用公式 TDEE
+    minutes = np.atleast_2d(_f(act_minutes))
+    mets = np.atleast_2d(_f(act_met))
+    male = np.char.lower(np.asarray(profile.sex).astype(str)) == 'male'
+    ffm_basis = np.char.upper(np.asarray(protein_basis).astype(str)) == 'FFM'
+    cols = np.broadcast_arrays(
+        _f(profile.weight_kg), _f(profile.body_fat_pct), _f(profile.age), _f(profile.height_cm), male,
+        _f(profile.baseline_pal), _f(profile.protein_g_per_kg_bw), _f(profile.fat_g_per_kg_bw),
+        _f(profile.deficit), _f(profile.min_deficit), _f(profile.max_deficit), np.asarray(profile.carb_periodization, dtype=bool),
+        _f(steps), np.asarray(auto_mode, dtype=bool), _f(target_loss_week_kg),
+        _f(pid_cfg.Kp), _f(pid_cfg.Ki), _f(pid_cfg.Kd), _f(pid_cfg.integral_cap),
+        _f(fatigue), _f(sleep_h), _f(perf_change_pct), np.asarray(apply_suggestions, dtype=bool),
+        _f(loss_obs), _f(sleep_ema), _f(today_weight), ffm_basis, _f(protein_per_kg_ffm), _f(ea_min),
+        _f(training_day_carb_bump_g_per_kg), _f(training_load_threshold), _f(tdee_factor), minutes[:, 0],
+    )
+    (w, bf, age, height, male, base_pal, p_bw, f_bw, def0, dmin, dmax, periodize, steps, auto, tgt,
+     Kp, Ki, Kd, icap, fatigue, sleep_h, perf, apply_sug, loss_obs, sleep_ema, today_w, ffm_basis, p_ffm, ea_min,
+     bump, thr, tdee_k, _) = [np.array(c, ndmin=1).reshape(-1) for c in cols]
+    n = len(w)
+    minutes = np.broadcast_to(minutes, (n, minutes.shape[1])) if minutes.shape[0] in (1, n) else minutes
+    mets = np.broadcast_to(mets, minutes.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(today_w > 0, today_w, w)
+        has_bf = ~np.isnan(bf)
+        ffm = np.where(has_bf, w * (1 - bf/100.0), w * 0.75)
+
+        pal = np.where(np.isnan(steps), base_pal, base_pal + np.maximum(0, (steps - 7000)) / 2000.0 * 0.05)
+
+        bmr = np.where(has_bf, 370 + 21.6*(w * (1 - bf/100.0)),
+                       10*w + 6.25*height - 5*age + np.where(male, 5.0, -161.0))
+        ex_kcal = np.zeros(n)
+        load_index = np.zeros(n)
+        for j in range(minutes.shape[1]):
+            on = minutes[:, j] > 0
+            ex_kcal = ex_kcal + np.where(on, mets[:, j] * 3.5 * w / 200.0 * minutes[:, j], 0.0)
+            load_index = load_index + np.where(on, mets[:, j] * minutes[:, j], 0.0)
+        tdee_formula = bmr * pal + ex_kcal
+        tdee = np.where(np.isnan(tdee_k), tdee_formula, tdee_formula * tdee_k)
+
+        rate = np.where(tdee > 0, (tgt * KCAL_PER_KG_FAT) / 7.0 / tdee, 0.0)
+        deficit = _clamp(np.where(rate > 0, rate, def0), dmin, dmax)
+
+        # PID 每次调用都是新实例：积分=夹紧后的误差，微分项为 0
+        has_loss = ~np.isnan(loss_obs)
+        err = tgt - loss_obs
+        delta = Kp*err + Ki*_clamp(err, -icap, icap) + Kd*0.0
+        deficit = np.where(auto & has_loss, _clamp(deficit + delta, dmin, dmax), deficit)
+
+        low_sleep = ~np.isnan(sleep_ema) & (sleep_ema < 6.5)
+        deficit = np.where(low_sleep, _clamp(np.minimum(deficit, 0.10), dmin, dmax), deficit)
+
+        target_kcal = tdee * (1 - deficit)
+        protein_g = np.where(ffm_basis, p_ffm * ffm, p_bw * w)
+        fat_g = f_bw * w
+        kcal_pf = protein_g*4 + fat_g*9
+        carb_g = np.maximum(0.0, target_kcal - kcal_pf) / 4.0
+
+        carb_sug = np.where(fatigue >= 7, 0.8*w, 0.0) + np.where(perf <= -5, 1.0*w, 0.0)
+        carb_g = np.where(apply_sug & ((fatigue >= 7) | (perf <= -5)), carb_g + carb_sug, carb_g)
+
+        is_training = load_index >= thr
+        carb_g = np.where(is_training & (bump > 0), carb_g + bump * w, carb_g)
+
+        adj = carb_g + 50.0 * np.maximum(0.0, (load_index - 1200.0))/1000.0
+        periodized = np.where(load_index >= 1600, np.maximum(adj, CARB_FLOOR_HIGH_INT*w),
+                              np.where(load_index >= 1200, np.maximum(adj, CARB_FLOOR_MOD_INT*w), adj))
+        carb_g = np.where(periodize, periodized, carb_g)
+
+        final_kcal = protein_g*4 + fat_g*9 + carb_g*4
+        intended_kcal = tdee * (1 - deficit)
+        ea_floor_kcal = ex_kcal + ea_min * ffm
+
+        ffm_div = np.maximum(1e-6, ffm)
+        ea = (final_kcal - ex_kcal) / ffm_div
+        new_kcal = np.minimum(ex_kcal + ea_min * ffm, tdee)
+        guard = (ea < ea_min) & (new_kcal > final_kcal + 1e-6)
+        final_kcal = np.where(guard, new_kcal, final_kcal)
+        carb_g = np.where(guard, np.maximum(0.0, (final_kcal - (protein_g*4 + fat_g*9)) / 4.0), carb_g)
+        ea = np.where(guard, (final_kcal - ex_kcal) / ffm_div, ea)
+
+        w_div = np.maximum(1e-6, w)
+        weekly_loss_pct = np.where(has_loss, (loss_obs / w_div) * 100.0, np.nan)
+        target_loss_pct = np.where(has_loss, (tgt / w_div) * 100.0, np.nan)
+
+    return pd.DataFrame({
+        'weight_kg': w,
+        'bmr': _round(bmr,1), 'pal': _round(pal,2),
+        'exercise_kcal': _round(ex_kcal,0), 'tdee_used': _round(tdee,0),
+        'tdee_formula': _round(tdee_formula,0),
+        'deficit': _round(deficit,3),
+        'target_kcal': _round(final_kcal,0),
+        'protein_g': _round(protein_g,0), 'fat_g': _round(fat_g,0), 'carb_g': _round(carb_g,0),
+        'load_index': _round(load_index,0),
+        'ea': _round(ea,1),
+        'ffm': _round(ffm,1),
+        'ea_guard_applied': guard.astype(int),
+        'is_training_day': is_training,
+        'weekly_loss_pct': _round(weekly_loss_pct,2),
+        'target_loss_pct': _round(target_loss_pct,2),
+        'intended_kcal': _round(intended_kcal,0),
+        'ea_floor_kcal': _round(ea_floor_kcal,0),
+    }, columns=PLAN_COLUMNS)
+
+def plan_frame_to_dicts(df: pd.DataFrame) -> List[Dict[str, object]]:
+    # 转回与 plan_day 相同的键与类型（NaN → None），便于与逐日结果对照或复用现有展示代码
+    out = []
+    for row in df.to_dict('records'):
+        row['ea_guard_applied'] = int(row['ea_guard_applied'])
+        row['is_training_day'] = bool(row['is_training_day'])
+        for k in ('weekly_loss_pct', 'target_loss_pct'):
+            if pd.isna(row[k]):
+                row[k] = None
+        out.append(row)
+    return out
+
+_PROFILE_FIELDS = {f.name for f in fields(UserProfile)}
+
+def plan_grid(profile: UserProfile, inputs: Dict[str, object], grid: Dict[str, Sequence]) -> pd.DataFrame:
+    # 参数网格（笛卡尔积）一次性批量计算：grid 的键为 UserProfile 字段、plan_days 的关键字参数或 loss_rate_pct；
+    # 当日负荷/BMR/历史统计等公共输入只准备一次，按广播参与计算。返回“参数列 + 计划结果列”。
+    names = list(grid)
+    combos = list(product(*[list(v) for v in grid.values()]))
+    cols = {n: np.array([c[i] for c in combos]) for i, n in enumerate(names)}
+    if 'min_deficit' in cols and 'max_deficit' in cols:
+        keep = cols['min_deficit'] <= cols['max_deficit']
+        cols = {n: v[keep] for n, v in cols.items()}
+    prof = replace(profile, **{n: v for n, v in cols.items() if n in _PROFILE_FIELDS})
+    kwargs = dict(inputs)
+    kwargs.update({n: v for n, v in cols.items() if n not in _PROFILE_FIELDS and n != 'loss_rate_pct'})
+    if 'loss_rate_pct' in cols:
+        tw = _f(kwargs.get('today_weight'))
+        current_w = np.where(tw > 0, tw, _f(profile.weight_kg))
+        kwargs['target_loss_week_kg'] = current_w * (cols['loss_rate_pct'] / 100.0)
+    res = plan_days(prof, **kwargs)
+    return pd.concat([pd.DataFrame(cols), res], axis=1)
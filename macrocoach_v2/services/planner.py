@@ -3,21 +3,16 @@ from __future__ import annotations
 from typing import Optional, List, Dict
 import pandas as pd
 from ..settings import EA_MIN_DEFAULT, EA_PREF_DEFAULT, TRAINING_LOAD_THRESHOLD, TRAINING_DAY_CARB_BUMP_G_PER_KG
-from ..domain.models import UserProfile, ActivityBlock, PIDConfig
-from ..domain.calcs import calc_bmr, ffm_from_bf, calc_daily_exercise_kcal, carb_periodize, clamp
+from ..domain.models import UserProfile, ActivityBlock, PIDConfig, HistoryState
+from ..domain.history import loss_obs as state_loss_obs, sleep_ema as state_sleep_ema, recent_emas, state_from_rows
+from ..domain.calcs import calc_bmr, ffm_from_bf, calc_daily_exercise_kcal, carb_periodize, clamp, KCAL_PER_KG_FAT
 from ..domain.pid import PID
 
-KCAL_PER_KG_FAT = 7700.0
-
-def weekly_loss_from_df(dm: pd.DataFrame) -> Optional[float]:
-    if dm is None or len(dm) == 0 or 'weight' not in dm:
-        return None
-    df = dm[['date','weight']].dropna().sort_values('date')
-    if len(df) < 8: return None
-    last7 = df.tail(7)['weight'].mean()
-    prev7 = df.tail(14).head(7)['weight'].mean()
-    if pd.isna(last7) or pd.isna(prev7): return None
-    return float(max(0.0, prev7 - last7))
+def history_state_from_df(dm: Optional[pd.DataFrame]) -> HistoryState:
+    # 整表历史 → 与 metrics_state 相同的滚动状态：两条路径的趋势（loss_obs）与睡眠护栏因此一致
+    if dm is None or len(dm) == 0 or 'date' not in dm:
+        return HistoryState()
+    return state_from_rows(dm[dm['date'].notna()].sort_values('date', kind='stable').to_dict('records'))
 
 def _ema(series: pd.Series, alpha: float=0.5) -> float:
     if series is None or len(series) == 0: return 0.0
@@ -26,14 +21,21 @@ def _ema(series: pd.Series, alpha: float=0.5) -> float:
     except Exception:
         return float(series.mean())
 
-def predict_next_day(tracker_df: Optional[pd.DataFrame]) -> Dict[str,str]:
-    if tracker_df is None or len(tracker_df) == 0:
-        return {'train_band':'medium','deficit_band':'medium','note':'无历史数据，使用默认中档。'}
-    df = tracker_df.copy().sort_values('date').tail(14)
-    f_ema = _ema(df.get('fatigue', pd.Series(dtype=float)), 0.3)
-    s_ema = _ema(df.get('sleep_h', pd.Series(dtype=float)), 0.3)
-    l_ema = _ema(df.get('load_index', pd.Series(dtype=float)), 0.3)
-    p_ema = _ema(df.get('perf_pct', pd.Series(dtype=float)), 0.3)
+def predict_next_day(tracker_df: Optional[pd.DataFrame], hist_state: Optional[HistoryState] = None) -> Dict[str,str]:
+    # 传入 hist_state 时直接用其中最近 14 行的 EMA，不再读取/排序整张表
+    if hist_state is not None:
+        if len(hist_state.recent) == 0:
+            return {'train_band':'medium','deficit_band':'medium','note':'无历史数据，使用默认中档。'}
+        emas = recent_emas(hist_state, 0.3)
+        f_ema, s_ema, l_ema, p_ema = emas['fatigue'], emas['sleep_h'], emas['load_index'], emas['perf_pct']
+    else:
+        if tracker_df is None or len(tracker_df) == 0:
+            return {'train_band':'medium','deficit_band':'medium','note':'无历史数据，使用默认中档。'}
+        df = tracker_df.copy().sort_values('date').tail(14)
+        f_ema = _ema(df.get('fatigue', pd.Series(dtype=float)), 0.3)
+        s_ema = _ema(df.get('sleep_h', pd.Series(dtype=float)), 0.3)
+        l_ema = _ema(df.get('load_index', pd.Series(dtype=float)), 0.3)
+        p_ema = _ema(df.get('perf_pct', pd.Series(dtype=float)), 0.3)
     HIGH_FATIGUE, LOW_SLEEP, HIGH_LOAD, LOW_LOAD, POOR_PERF = 7.0, 6.5, 1600, 900, -5.0
     if f_ema >= HIGH_FATIGUE or s_ema < LOW_SLEEP or p_ema <= POOR_PERF:
         return {'train_band':'low','deficit_band':'low','note':'疲劳/睡眠/表现指示恢复日。'}
@@ -58,8 +60,17 @@ def plan_day(profile: UserProfile,
              ea_min: float = EA_MIN_DEFAULT,
              ea_pref: float = EA_PREF_DEFAULT,
              training_day_carb_bump_g_per_kg: float = TRAINING_DAY_CARB_BUMP_G_PER_KG,
-             training_load_threshold: float = TRAINING_LOAD_THRESHOLD
+             training_load_threshold: float = TRAINING_LOAD_THRESHOLD,
+             hist_state: Optional[HistoryState] = None,
+             pid: Optional[PID] = None,
+             tdee_factor: Optional[float] = None
              ) -> Dict[str, object]:
+    # 趋势与睡眠护栏从滚动状态读取：hist_state 为空时由 dm_hist 现算（此时 dm_hist 可为 None，即无历史）
+    # pid 不为空时使用调用方持有的控制器（积分/微分跨天累积），否则每次新建
+    # tdee_factor 不为空时，公式 TDEE 乘以自适应估计的校正系数（见 services/tdee.py）
+    if hist_state is None:
+        hist_state = history_state_from_df(dm_hist)
+    hist_loss = state_loss_obs(hist_state)
 
     if today_weight is not None and today_weight > 0:
         profile.weight_kg = float(today_weight)
@@ -73,6 +84,9 @@ def plan_day(profile: UserProfile,
     bmr = calc_bmr(profile)
     ex_kcal, load_index = calc_daily_exercise_kcal(profile.weight_kg, acts)
     tdee = bmr * pal + ex_kcal
+    tdee_formula = tdee
+    if tdee_factor is not None:
+        tdee = tdee * float(tdee_factor)
 
     # —— 关键改动：基于“目标每周下降”即刻反推赤字（历史不足时也生效） ——
     deficit_from_rate = 0.0
@@ -81,13 +95,16 @@ def plan_day(profile: UserProfile,
         deficit_from_rate = daily_deficit_kcal / tdee
     deficit = float(clamp(deficit_from_rate if deficit_from_rate>0 else profile.deficit, profile.min_deficit, profile.max_deficit))
     notes: List[str] = [f'按目标下降直接估算赤字={deficit_from_rate:.3f}（已夹在上下限内）']
+    if tdee_factor is not None:
+        notes.append(f'自适应 TDEE：公式 {tdee_formula:.0f} × {float(tdee_factor):.3f} = {tdee:.0f} kcal')
 
     # 有历史 → 使用 PID 围绕目标周下降微调（基于实际趋势）
     if auto_mode:
-        loss_obs = weekly_loss_from_df(dm_hist)
+        loss_obs = hist_loss
         if loss_obs is not None:
             err = target_loss_week_kg - loss_obs
-            pid = PID(pid_cfg)
+            if pid is None:
+                pid = PID(pid_cfg)
             delta = pid.step(err)
             before = deficit
             deficit = clamp(deficit + delta, profile.min_deficit, profile.max_deficit)
@@ -106,15 +123,12 @@ def plan_day(profile: UserProfile,
         suggestions += [{'type':'deficit_to','value':0.10,'desc':'表现下降→赤字≤0.10'},
                         {'type':'carb','g_per_kg':+1.0,'desc':'表现下降→碳水+1.0 g/kg'}]
 
-    if dm_hist is not None and len(dm_hist)>0 and 'sleep_h' in dm_hist:
-        df_sorted = dm_hist.sort_values('date').tail(7)
-        if len(df_sorted)>0 and df_sorted['sleep_h'].notna().any():
-            sleep_ema3 = _ema(df_sorted['sleep_h'].dropna(), 0.5)
-            if sleep_ema3 < 6.5:
-                before = deficit
-                deficit = clamp(min(deficit, 0.10), profile.min_deficit, profile.max_deficit)
-                if deficit < before:
-                    notes.append('短期睡眠偏低(EMA)：将赤字限制到 ≤0.10')
+    sleep_ema3 = state_sleep_ema(hist_state)
+    if sleep_ema3 is not None and sleep_ema3 < 6.5:
+        before = deficit
+        deficit = clamp(min(deficit, 0.10), profile.min_deficit, profile.max_deficit)
+        if deficit < before:
+            notes.append('短期睡眠偏低(EMA)：将赤字限制到 ≤0.10')
 
     target_kcal = tdee * (1 - deficit)
 
@@ -157,7 +171,7 @@ def plan_day(profile: UserProfile,
             carb_g = max(0.0, (final_kcal - (protein_g*4 + fat_g*9)) / 4.0)
             ea_kcal_per_kg = (final_kcal - ex_kcal) / max(1e-6, ffm)
 
-    loss_obs = weekly_loss_from_df(dm_hist) if dm_hist is not None else None
+    loss_obs = hist_loss
     weekly_loss_pct = None
     target_loss_pct = None
     if loss_obs is not None:
@@ -168,6 +182,7 @@ def plan_day(profile: UserProfile,
     return {
         'bmr': round(bmr,1), 'pal': round(pal,2),
         'exercise_kcal': round(ex_kcal,0), 'tdee_used': round(tdee,0),
+        'tdee_formula': round(tdee_formula,0),
         'deficit': round(deficit,3),
         'target_kcal': round(final_kcal,0),
         'protein_g': round(protein_g,0), 'fat_g': round(fat_g,0), 'carb_g': round(carb_g,0),
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import os
+from typing import Dict, Optional, Tuple
+from ..settings import DEFAULTS, PID_DEFAULT, EA_MIN_DEFAULT, EA_PREF_DEFAULT, TRAINING_LOAD_THRESHOLD, TRAINING_DAY_CARB_BUMP_G_PER_KG
+from ..domain.models import UserProfile, PIDConfig
+from ..data.athletes import athlete_paths
+
+# 无界面入口（CLI / HTTP API）使用的运动员资料：<库文件所在目录>/profile.json，字段与侧栏一致；缺省项取 settings 的默认值
+PROFILE_FILE = 'profile.json'
+PROFILE_DEFAULTS: Dict[str, object] = {
+    'sex': DEFAULTS['sex'], 'age': DEFAULTS['age'], 'height_cm': DEFAULTS['height_cm'], 'weight_kg': DEFAULTS['weight_kg'],
+    'body_fat_pct': DEFAULTS['body_fat_pct'], 'baseline_pal': DEFAULTS['baseline_pal'], 'steps': 8000,
+    'loss_rate_pct': DEFAULTS['loss_rate_pct'], 'auto_mode': True, 'adaptive_tdee': False,
+    'protein_basis': 'FFM', 'protein_per_kg_ffm': 2.6, 'protein_per_kg_bw': DEFAULTS['protein_g_per_kg_bw'],
+    'fat_per_kg_bw': DEFAULTS['fat_g_per_kg_bw'],
+    'deficit': DEFAULTS['deficit'], 'min_def': DEFAULTS['min_deficit'], 'max_def': DEFAULTS['max_deficit'],
+    'ea_min': EA_MIN_DEFAULT, 'ea_pref': EA_PREF_DEFAULT,
+    'training_threshold': TRAINING_LOAD_THRESHOLD, 'training_bump': TRAINING_DAY_CARB_BUMP_G_PER_KG,
+    'Kp': PID_DEFAULT['Kp'], 'Ki': PID_DEFAULT['Ki'], 'Kd': PID_DEFAULT['Kd'], 'Icap': PID_DEFAULT['integral_cap'],
+}
+
+def profile_path(name: Optional[str] = None) -> str:
+    return os.path.join(os.path.dirname(athlete_paths(name).db) or '.', PROFILE_FILE)
+
+def load_profile(name: Optional[str] = None, path: Optional[str] = None) -> Dict[str, object]:
+    path = path or profile_path(name)
+    cfg = dict(PROFILE_DEFAULTS)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            cfg.update(json.load(f))
+    return cfg
+
+def user_profile(cfg: Dict[str, object]) -> UserProfile:
+    return UserProfile(
+        sex=str(cfg['sex']), age=int(cfg['age']), height_cm=float(cfg['height_cm']), weight_kg=float(cfg['weight_kg']),
+        body_fat_pct=float(cfg['body_fat_pct']) if cfg['body_fat_pct'] is not None else None, baseline_pal=float(cfg['baseline_pal']),
+        protein_g_per_kg_bw=float(cfg['protein_per_kg_bw']), fat_g_per_kg_bw=float(cfg['fat_per_kg_bw']),
+        deficit=float(cfg['deficit']), min_deficit=float(cfg['min_def']), max_deficit=float(cfg['max_def']),
+        carb_periodization=True,
+    )
+
+def pid_config(cfg: Dict[str, object]) -> PIDConfig:
+    return PIDConfig(Kp=float(cfg['Kp']), Ki=float(cfg['Ki']), Kd=float(cfg['Kd']), integral_cap=float(cfg['Icap']))
+
+def macros(cfg: Dict[str, object]) -> Tuple[float, float]:
+    # 与调度页相同：按 FFM（有体脂率时）或按体重计蛋白，脂肪按体重
+    w = float(cfg['weight_kg'])
+    if cfg['protein_basis'] == 'FFM' and cfg['body_fat_pct'] is not None:
+        protein_g = float(cfg['protein_per_kg_ffm']) * w * (1 - float(cfg['body_fat_pct'])/100.0)
+    else:
+        protein_g = float(cfg['protein_per_kg_bw']) * w
+    return protein_g, float(cfg['fat_per_kg_bw']) * w
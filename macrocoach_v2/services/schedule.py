@@ -1,37 +1,131 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import List, Dict
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
 from datetime import date, timedelta
+import numpy as np
+import pandas as pd
 from ..domain.models import UserProfile
 from ..domain.calcs import calc_bmr
-from ..data.db import upsert_targets
-
-def schedule(profile: UserProfile, start: date, days: int, mode: str, deficit: float, pal: float, protein_g: float, fat_g: float) -> List[Dict[str, str]]:
-    out = []
-    bmr = calc_bmr(profile)
-    for i in range(days):
-        d = start + timedelta(days=i)
-        day_type = 'deficit'
-        if mode == 'continuous':
-            day_type = 'deficit'
-        elif mode == '5+2':
-            if (i % 7) >= 5:
-                day_type = 'maintain'
-        elif mode == 'matador_2+2':
-            if (i % 28) >= 14:
-                day_type = 'maintain'
-        tdee = bmr * pal
-        if day_type == 'deficit':
-            target_kcal = tdee * (1 - deficit); def_used = deficit
-        else:
-            target_kcal = tdee; def_used = 0.0
-        carb_kcal = max(0.0, target_kcal - (protein_g*4 + fat_g*9))
-        carb_g = carb_kcal / 4.0
-        upsert_targets(d.isoformat(), {
-            'target_kcal': round(target_kcal,0), 'protein_g': round(protein_g,0),
-            'fat_g': round(fat_g,0), 'carb_g': round(carb_g,0),
-            'bmr': round(bmr,1), 'pal': round(pal,2), 'tdee_used': round(tdee,0),
-            'deficit': round(def_used,3), 'ea': 0.0
-        }, notes=f'预生成({mode})', ea_guard_applied=0, day_type=day_type)
-        out.append({'date': d.isoformat(), 'day_type': day_type})
+from ..data.db import init_db, executemany, df_from_sql, journaled, COMPUTED_SOURCES
+from ..data.athletes import use_athlete
+from .batch_planner import _round
+
+# 预生成日目标：日类型按周期模式整段向量化（档案 × 天数 一次算完），每个档案一次批量写入。
+# 模式 = (缺口天数, 维持天数) 循环；diet break = 每 N 天后插入 M 天维持（N+M 天一轮），叠加在模式之上。
+SCHEDULE_MODES: Dict[str, Tuple[int, int]] = {
+    'continuous': (1, 0),
+    '5+2': (5, 2),
+    'matador_2+2': (14, 14),
+}
+MAX_SCHEDULE_DAYS = 366
+
+@dataclass
+class ScheduleJob:
+    name: str
+    profile: UserProfile
+    protein_g: float
+    fat_g: float
+    deficit: Optional[float] = None   # None → profile.deficit
+    pal: Optional[float] = None       # None → profile.baseline_pal
+
+def deficit_days(days: int, mode: str, cycle: Optional[Tuple[int, int]] = None,
+                 diet_break: Tuple[int, int] = (0, 0)) -> np.ndarray:
+    # 返回长度为 days 的布尔数组（True = 缺口日）；mode='custom' 时使用 cycle
+    on, off = cycle if mode == 'custom' and cycle else SCHEDULE_MODES[mode]
+    i = np.arange(int(days))
+    out = (i % max(1, on + off)) < on if off > 0 else np.full(len(i), on > 0)
+    every, length = diet_break
+    if every > 0 and length > 0:
+        out &= (i % (every + length)) < every
+    return out
+
+def plan_schedule(jobs: Sequence[ScheduleJob], start: date, days: int, mode: str,
+                  cycle: Optional[Tuple[int, int]] = None, diet_break: Tuple[int, int] = (0, 0)) -> pd.DataFrame:
+    # 长表：每个 (档案, 日期) 一行；数值与逐日版本一致（内置 round 口径）
+    days = min(int(days), MAX_SCHEDULE_DAYS)
+    if days <= 0 or len(jobs) == 0:
+        return pd.DataFrame(columns=['profile', 'date', 'day_type', 'target_kcal', 'protein_g', 'fat_g', 'carb_g',
+                                     'bmr', 'pal', 'tdee_used', 'deficit'])
+    on = deficit_days(days, mode, cycle, diet_break)[None, :]
+    bmr = np.array([calc_bmr(j.profile) for j in jobs])[:, None]
+    pal = np.array([j.profile.baseline_pal if j.pal is None else j.pal for j in jobs], dtype=float)[:, None]
+    deficit = np.array([j.profile.deficit if j.deficit is None else j.deficit for j in jobs], dtype=float)[:, None]
+    protein_g = np.array([j.protein_g for j in jobs], dtype=float)[:, None]
+    fat_g = np.array([j.fat_g for j in jobs], dtype=float)[:, None]
+    shape = (len(jobs), days)
+
+    tdee = bmr * pal
+    target_kcal = np.where(on, tdee * (1 - deficit), tdee)
+    def_used = np.where(on, deficit, 0.0)
+    carb_g = np.maximum(0.0, target_kcal - (protein_g*4 + fat_g*9)) / 4.0
+
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    return pd.DataFrame({
+        'profile': np.repeat([j.name for j in jobs], days),
+        'date': np.tile(dates, len(jobs)),
+        'day_type': np.where(np.broadcast_to(on, shape), 'deficit', 'maintain').ravel(),
+        'target_kcal': _round(target_kcal, 0).ravel(),
+        'protein_g': _round(np.broadcast_to(protein_g, shape).copy(), 0).ravel(),
+        'fat_g': _round(np.broadcast_to(fat_g, shape).copy(), 0).ravel(),
+        'carb_g': _round(carb_g, 0).ravel(),
+        'bmr': _round(np.broadcast_to(bmr, shape).copy(), 1).ravel(),
+        'pal': _round(np.broadcast_to(pal, shape).copy(), 2).ravel(),
+        'tdee_used': _round(np.broadcast_to(tdee, shape).copy(), 0).ravel(),
+        'deficit': _round(np.broadcast_to(def_used, shape).copy(), 3).ravel(),
+    })
+
+def write_schedule(frame: pd.DataFrame, mode: str, overwrite_computed: bool = False) -> int:
+    # 一个档案的行一次写入；默认保留 source 为 plan/backfill 的日期（已由 plan_day 按当日数据算过）。返回实际写入行数
+    rows = [(r[0], *[float(x) for x in r[1:9]], f'预生成({mode})', r[9])
+            for r in frame[['date', 'target_kcal', 'protein_g', 'fat_g', 'carb_g', 'bmr', 'pal', 'tdee_used', 'deficit',
+                            'day_type']].itertuples(index=False, name=None)]
+    keep = '' if overwrite_computed else \
+        f"WHERE daily_targets.source IS NULL OR daily_targets.source NOT IN ({', '.join(repr(s) for s in COMPUTED_SOURCES)})"
+    dates = [r[0] for r in rows]
+    with journaled('schedule', f'{dates[0]}~{dates[-1]}' if dates else '', keys={'daily_targets': dates}):
+        return executemany(f"""
+            INSERT INTO daily_targets
+            (date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,tdee_formula,deficit,ea,ea_guard_applied,notes,day_type,source)
+            VALUES(?1,?2,?3,?4,?5,?6,?7,?8,?8,?9,0.0,0,?10,?11,'schedule')
+            ON CONFLICT(date) DO UPDATE SET
+              target_kcal=excluded.target_kcal, protein_g=excluded.protein_g, fat_g=excluded.fat_g, carb_g=excluded.carb_g,
+              bmr=excluded.bmr, pal=excluded.pal, tdee_used=excluded.tdee_used, tdee_formula=excluded.tdee_formula,
+              deficit=excluded.deficit, ea=excluded.ea, ea_guard_applied=excluded.ea_guard_applied,
+              notes=excluded.notes, day_type=excluded.day_type, source=excluded.source
+            {keep}
+        """, rows)
+
+def schedule_many(jobs: Sequence[ScheduleJob], start: date, days: int, mode: str,
+                  cycle: Optional[Tuple[int, int]] = None, diet_break: Tuple[int, int] = (0, 0),
+                  overwrite_computed: bool = False,
+                  writer: Optional[Callable[[str, pd.DataFrame], int]] = None) -> Dict[str, int]:
+    # 计算一次，按档案分组写入；writer(档案名, 该档案的行) 决定写到哪个库，默认写当前库。返回每个档案实际写入的天数
+    frame = plan_schedule(jobs, start, days, mode, cycle, diet_break)
+    if writer is None:
+        writer = lambda name, grp: write_schedule(grp, mode, overwrite_computed)
+    return {name: writer(name, grp) for name, grp in frame.groupby('profile', sort=False)}
+
+def athlete_writer(mode: str, overwrite_computed: bool = False) -> Callable[[str, pd.DataFrame], int]:
+    # schedule_many 的 writer：档案名即运动员名，各自写入自己的库
+    def write(name: str, grp: pd.DataFrame) -> int:
+        with use_athlete(name):
+            init_db()
+            return write_schedule(grp, mode, overwrite_computed)
+    return write
+
+def schedule(profile: UserProfile, start: date, days: int, mode: str, deficit: float, pal: float, protein_g: float, fat_g: float,
+             cycle: Optional[Tuple[int, int]] = None, diet_break: Tuple[int, int] = (0, 0),
+             overwrite_computed: bool = False) -> List[Dict[str, str]]:
+    job = ScheduleJob('default', profile, protein_g, fat_g, deficit, pal)
+    frame = plan_schedule([job], start, days, mode, cycle, diet_break)
+    written = write_schedule(frame, mode, overwrite_computed)
+    out = frame[['date', 'day_type']].to_dict('records')
+    # 被保留的日期（已有 plan_day 计算结果）标为 skipped
+    kept = set()
+    if written < len(out):
+        kept = set(df_from_sql(f"SELECT date FROM daily_targets WHERE date >= ? AND date <= ? AND source IN ({', '.join('?' * len(COMPUTED_SOURCES))})",
+                               (out[0]['date'], out[-1]['date'], *COMPUTED_SOURCES))['date'])
+    for r in out:
+        r['skipped'] = r['date'] in kept
     return out
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import date, timedelta
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import numpy as np
+import pandas as pd
+from ..domain.models import UserProfile, ActivityBlock, PIDConfig, HistoryState
+from ..domain.calcs import calc_bmr, calc_daily_exercise_kcal
+from ..domain.history import push_day
+from ..domain.pid import PID
+from .planner import plan_day, KCAL_PER_KG_FAT
+
+# 闭环模拟：planner + PID 每天给出摄入目标，合成“真实”体重按能量平衡变化，
+# 观测体重 = 真实体重 + 水分波动(AR(1)) + 称重噪声；用于比较不同 PID 增益的收敛/振荡情况。
+
+# 默认一周训练安排（周一=0）
+DEFAULT_WEEK: Tuple[Tuple[ActivityBlock, ...], ...] = (
+    (ActivityBlock('strength', 60, 'moderate'),),
+    (ActivityBlock('badminton', 90, 'moderate'),),
+    (ActivityBlock('strength', 60, 'moderate'),),
+    (),
+    (ActivityBlock('strength', 60, 'high'),),
+    (ActivityBlock('badminton', 120, 'high'),),
+    (),
+)
+
+@dataclass
+class SimConfig:
+    profile: UserProfile
+    days: int = 112
+    loss_rate_pct: float = 0.7
+    steps: int = 8000
+    tdee_bias: float = 0.95          # 真实 TDEE / 公式 TDEE
+    adherence_sd: float = 0.05       # 实际摄入相对目标的随机偏差
+    water_sd: float = 0.5            # 水分波动(kg)
+    water_ar: float = 0.7
+    scale_sd: float = 0.15           # 称重噪声(kg)
+    persistent_pid: bool = True      # False 时与线上一致：每天新建 PID
+    week: Tuple[Tuple[ActivityBlock, ...], ...] = DEFAULT_WEEK
+    band: float = 0.2                # 收敛带：|实际-目标| ≤ band×目标
+    seeds: Sequence[int] = field(default_factory=lambda: (0, 1))
+
+def _noise(cfg: SimConfig, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    # 同一 seed 下所有增益组合看到相同的噪声序列（公共随机数），比较才公平
+    rng = np.random.default_rng(seed)
+    adherence = rng.normal(0.0, cfg.adherence_sd, cfg.days)
+    shocks = rng.normal(0.0, cfg.water_sd * np.sqrt(1 - cfg.water_ar**2), cfg.days)
+    water = np.zeros(cfg.days)
+    for t in range(1, cfg.days):
+        water[t] = cfg.water_ar * water[t-1] + shocks[t]
+    return adherence, water + rng.normal(0.0, cfg.scale_sd, cfg.days)
+
+def simulate(cfg: SimConfig, pid_cfg: PIDConfig, seed: int = 0) -> pd.DataFrame:
+    # 返回逐日轨迹：真实/观测体重、目标周下降、真实 7 日下降、赤字与目标热量
+    adherence, obs_noise = _noise(cfg, seed)
+    base = cfg.profile
+    w_true = float(base.weight_kg)
+    hist = HistoryState()
+    pid = PID(pid_cfg) if cfg.persistent_pid else None
+    start = date(2000, 1, 3)
+    out = np.zeros((cfg.days, 6))
+    for t in range(cfg.days):
+        acts = list(cfg.week[t % 7])
+        w_obs = w_true + obs_noise[t]
+        target = w_obs * cfg.loss_rate_pct / 100.0
+        res = plan_day(replace(base, weight_kg=w_obs), acts, cfg.steps, True, target, pid_cfg, 4, 7.5, 0.0, False,
+                       None, w_obs, hist_state=hist, pid=pid)
+        d = (start + timedelta(days=t)).isoformat()
+        push_day(hist, d, {'weight': w_obs, 'sleep_h': 7.5, 'fatigue': 4, 'perf_pct': 0.0, 'load_index': res['load_index']})
+        # 真实能量平衡：以真实体重计算的公式 TDEE × 偏差
+        truth = replace(base, weight_kg=w_true)
+        ex_kcal, _ = calc_daily_exercise_kcal(w_true, acts)
+        pal = float(base.baseline_pal) + max(0, (cfg.steps - 7000)) / 2000.0 * 0.05
+        tdee_true = cfg.tdee_bias * (calc_bmr(truth) * pal + ex_kcal)
+        intake = float(res['target_kcal']) * (1.0 + adherence[t])
+        out[t] = (w_true, w_obs, target, res['deficit'], res['target_kcal'], np.nan)
+        w_true += (intake - tdee_true) / KCAL_PER_KG_FAT
+    traj = pd.DataFrame(out, columns=['weight_true', 'weight_obs', 'target_loss', 'deficit', 'target_kcal', 'loss_true'])
+    traj['loss_true'] = traj['weight_true'].shift(7) - traj['weight_true']
+    return traj
+
+def score(traj: pd.DataFrame, band: float = 0.2, warmup: int = 14) -> Dict[str, float]:
+    # 收敛时间：此后真实周下降一直落在 ±band×目标 内的首日；超调：真实下降超出目标的最大比例；赤字方差：预热期后
+    loss = traj['loss_true'].to_numpy()
+    tgt = traj['target_loss'].to_numpy()
+    ok = np.abs(loss - tgt) <= band * np.abs(tgt)
+    ok[:7] = False
+    bad = np.flatnonzero(~ok)
+    settle = float(bad[-1] + 1) if len(bad) else 0.0
+    rel = (loss[7:] - tgt[7:]) / np.maximum(1e-6, np.abs(tgt[7:]))
+    deficit = traj['deficit'].to_numpy()[warmup:]
+    return {
+        'settling_days': settle if settle < len(traj) else np.nan,
+        'overshoot_pct': float(max(0.0, np.nanmax(rel)) * 100.0) if len(rel) else np.nan,
+        'deficit_var': float(np.var(deficit)) if len(deficit) else np.nan,
+        'deficit_mean': float(np.mean(deficit)) if len(deficit) else np.nan,
+        'loss_err_mae': float(np.nanmean(np.abs(loss[warmup:] - tgt[warmup:]))) if len(loss) > warmup else np.nan,
+    }
+
+def _run_chunk(args: Tuple[SimConfig, List[Tuple[float, float, float, float]]]) -> List[Dict[str, float]]:
+    cfg, gains = args
+    rows = []
+    for Kp, Ki, Kd, cap in gains:
+        pid_cfg = PIDConfig(Kp=Kp, Ki=Ki, Kd=Kd, integral_cap=cap)
+        scores = [score(simulate(cfg, pid_cfg, s), cfg.band) for s in cfg.seeds]
+        row = {'Kp': Kp, 'Ki': Ki, 'Kd': Kd, 'integral_cap': cap}
+        # 多个 seed 取平均；任一 seed 未收敛则收敛时间记为缺失
+        for k in scores[0]:
+            row[k] = float(np.mean([sc[k] for sc in scores]))
+        rows.append(row)
+    return rows
+
+def sweep_pid(cfg: SimConfig, Kp: Sequence[float], Ki: Sequence[float], Kd: Sequence[float] = (0.0,),
+              integral_cap: Sequence[float] = (0.15,), workers: Optional[int] = None, chunk: int = 16) -> pd.DataFrame:
+    # 网格 = 四个增益列表的笛卡尔积；按块分给进程池，返回每个组合一行
+    gains = [tuple(map(float, g)) for g in product(Kp, Ki, Kd, integral_cap)]
+    chunks = [(cfg, gains[i:i+chunk]) for i in range(0, len(gains), chunk)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        rows = [r for c in chunks for r in _run_chunk(c)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            rows = [r for part in ex.map(_run_chunk, chunks) for r in part]
+    df = pd.DataFrame(rows)
+    if len(df):
+        df = df.sort_values(['settling_days', 'deficit_var'], na_position='last').reset_index(drop=True)
+    return df
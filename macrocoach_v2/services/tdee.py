@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from ..settings import TDEE_WINDOW_DAYS
+from ..domain.models import TdeeState
+from ..domain.tdee import tdee_step
+from ..data.db import init_db, read_conn, transaction, executemany, df_from_sql, archive_watermark
+from ..data.archive import read_history
+
+# tdee_estimates 按天增量维护：每次只从表中最后一天的状态续算到昨天（今天的摄入尚未记完）；
+# 历史输入被修改时，触发器删掉受影响日期之后的结果，下次调用从更早的状态续算。
+
+def _dump_state(state: TdeeState) -> str:
+    return json.dumps({'t': state.trend, 'n': state.n_weighins, 'r': state.ratio_ema, 'k': state.n_obs})
+
+def _load_state(d: str, s: str) -> TdeeState:
+    v = json.loads(s)
+    return TdeeState(last_date=d, trend=v.get('t', []), n_weighins=int(v.get('n', 0)),
+                     ratio_ema=v.get('r'), n_obs=int(v.get('k', 0)))
+
+def _daily(rows, lo: str, hi: str) -> pd.Series:
+    s = pd.Series({str(d): (np.nan if v is None else float(v)) for d, v in rows}, dtype=float)
+    return s.reindex([d.date().isoformat() for d in pd.date_range(lo, hi, freq='D')])
+
+def _window_mean(s: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    # 以每天为终点的窗口均值（忽略缺失）与有效天数；每个窗口单独求和，结果与从哪天开始续算无关
+    win = np.lib.stride_tricks.sliding_window_view(s.to_numpy(float), TDEE_WINDOW_DAYS)
+    n = (~np.isnan(win)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(win, axis=1) / n, n
+
+def _nan_none(v) -> Optional[float]:
+    v = float(v)
+    return None if v != v else v
+
+def update_tdee_estimates(today: Optional[date] = None) -> int:
+    # 返回新增的天数；日常调用通常只追加 0–1 天
+    init_db()
+    end = ((today or date.today()) - timedelta(days=1)).isoformat()
+    # 已是最新时只做一次只读查询，不占写锁
+    with read_conn() as conn:
+        last = conn.execute('SELECT MAX(date) FROM tdee_estimates').fetchone()[0]
+    if last is not None and last >= end:
+        return 0
+    with transaction() as conn:
+        last = conn.execute('SELECT date, state FROM tdee_estimates ORDER BY date DESC LIMIT 1').fetchone()
+        if last is not None:
+            state = _load_state(last[0], last[1])
+            start = (date.fromisoformat(last[0]) + timedelta(days=1)).isoformat()
+        else:
+            state = TdeeState()
+            firsts = [conn.execute('SELECT MIN(date) FROM intake_daily WHERE n > 0').fetchone()[0],
+                      conn.execute('SELECT MIN(date) FROM daily_metrics WHERE weight IS NOT NULL').fetchone()[0]]
+            if archive_watermark(conn, 'daily_metrics'):
+                firsts.append(read_history('daily_metrics')['date'].min())
+            firsts = [str(f)[:10] for f in firsts if f]
+            if not firsts:
+                return 0
+            start = min(firsts)
+        if start > end:
+            return 0
+        lo = (date.fromisoformat(start) - timedelta(days=TDEE_WINDOW_DAYS - 1)).isoformat()
+        # 窗口统计：日均摄入（只算有记录的日子）与有记录天数、同窗口公式 TDEE 均值
+        intake = _daily(conn.execute('SELECT date, kcal FROM intake_daily WHERE n > 0 AND date >= ? AND date <= ?', (lo, end)), lo, end)
+        formula = _daily(conn.execute('SELECT date, COALESCE(tdee_formula, tdee_used) FROM daily_targets WHERE date >= ? AND date <= ?', (lo, end)), lo, end)
+        intake_mean, logged = _window_mean(intake)
+        formula_mean, _ = _window_mean(formula)
+        days = intake.index[TDEE_WINDOW_DAYS - 1:]
+        dm = read_history('daily_metrics', since=start)
+        weights = _daily(dm.loc[dm['date'] <= end, ['date', 'weight']].itertuples(index=False, name=None), start, end) if len(dm) else _daily([], start, end)
+
+        rows = []
+        for d, w, im, n, fm in zip(days, weights.to_numpy(), intake_mean, logged, formula_mean):
+            r = tdee_step(state, d, float(w), float(im), int(n), float(fm))
+            rows.append((d, _nan_none(w), _nan_none(im), int(n), _nan_none(fm),
+                         *[_nan_none(r[k]) for k in ('trend_level', 'trend_slope', 'observed_tdee', 'ratio', 'factor', 'adaptive_tdee')],
+                         _dump_state(state)))
+        executemany("""
+            INSERT OR REPLACE INTO tdee_estimates
+            (date,weight,intake_kcal,logged_days,formula_tdee,trend_level,trend_slope,observed_tdee,ratio,factor,adaptive_tdee,state)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+        """, rows)
+    return len(rows)
+
+def tdee_estimates(since: Optional[str] = None, today: Optional[date] = None) -> pd.DataFrame:
+    update_tdee_estimates(today)
+    cols = 'date, weight, intake_kcal, logged_days, formula_tdee, trend_level, trend_slope, observed_tdee, ratio, factor, adaptive_tdee'
+    if since:
+        return df_from_sql(f'SELECT {cols} FROM tdee_estimates WHERE date >= ? ORDER BY date', (since,))
+    return df_from_sql(f'SELECT {cols} FROM tdee_estimates ORDER BY date')
+
+def tdee_factor_for(d: str, today: Optional[date] = None) -> Optional[Dict[str, float]]:
+    # 日期 d 使用“前一天结束时”的估计；尚无有效观测时返回 None（planner 退回公式 TDEE）
+    update_tdee_estimates(today)
+    row = df_from_sql('SELECT date, factor, adaptive_tdee, formula_tdee, state FROM tdee_estimates WHERE date < ? ORDER BY date DESC LIMIT 1', (d,))
+    if len(row) == 0:
+        return None
+    r = row.iloc[0]
+    n_obs = int(json.loads(r['state']).get('k', 0))
+    if n_obs == 0:
+        return None
+    return {'date': str(r['date']), 'factor': float(r['factor']), 'adaptive_tdee': r['adaptive_tdee'],
+            'formula_tdee': r['formula_tdee'], 'n_obs': n_obs}
@@ -30,12 +30,49 @@ TRAINING_DAY_CARB_BUMP_G_PER_KG = 1.0
 
 PID_DEFAULT = {'Kp': 0.35, 'Ki': 0.05, 'Kd': 0.00, 'integral_cap': 0.15}
 
-DB_PATH = os.getenv('MACRO_COACH_DB_PATH', 'macrocoach.db')
+# 体重趋势（局部线性趋势 Kalman）：水平/斜率的日过程方差、称重观测方差（含水分波动），以及趋势接管 PID 所需的最少称重次数
+TREND_LEVEL_VAR = 0.0025
+TREND_SLOPE_VAR = 1e-5
+TREND_OBS_VAR = 0.36
+TREND_SLOPE0_VAR = 0.01
+TREND_MIN_WEIGHINS = 5
+
+# 自适应 TDEE：观测窗口（天）、窗口内至少记录摄入的天数、比值 EMA 的窗口、达到满置信所需的有效观测天数、校正系数上下限
+TDEE_WINDOW_DAYS = int(os.getenv('MACRO_COACH_TDEE_WINDOW_DAYS', '14'))
+TDEE_MIN_LOGGED_DAYS = int(os.getenv('MACRO_COACH_TDEE_MIN_LOGGED_DAYS', '10'))
+TDEE_EMA_DAYS = int(os.getenv('MACRO_COACH_TDEE_EMA_DAYS', '14'))
+TDEE_FULL_CONFIDENCE_DAYS = int(os.getenv('MACRO_COACH_TDEE_FULL_CONFIDENCE_DAYS', '28'))
+TDEE_FACTOR_MIN = float(os.getenv('MACRO_COACH_TDEE_FACTOR_MIN', '0.80'))
+TDEE_FACTOR_MAX = float(os.getenv('MACRO_COACH_TDEE_FACTOR_MAX', '1.20'))
 
-def configure_matplotlib_fonts() -> None:
-    import matplotlib
-    matplotlib.rcParams['font.sans-serif'] = [
-        'Microsoft YaHei', 'SimHei', 'Noto Sans CJK SC', 'WenQuanYi Zen Hei',
-        'Arial Unicode MS', 'DejaVu Sans'
-    ]
-    matplotlib.rcParams['axes.unicode_minus'] = False
+DB_PATH = os.getenv('MACRO_COACH_DB_PATH', 'macrocoach.db')
+DB_POOL_SIZE = int(os.getenv('MACRO_COACH_DB_POOL_SIZE', '4'))
+# 多运动员：每位运动员一个目录 <ATHLETES_DIR>/<名字>/（库、归档、备份各自独立）；留空 = 单库模式
+ATHLETES_DIR = os.getenv('MACRO_COACH_ATHLETES_DIR', '')
+DB_MAX_OPEN_SHARDS = int(os.getenv('MACRO_COACH_DB_MAX_OPEN_SHARDS', '16'))   # 同时保持打开连接的库文件数（LRU）
+DB_IDLE_CLOSE_S = float(os.getenv('MACRO_COACH_DB_IDLE_CLOSE_S', '300'))      # 库文件空闲超过此秒数即关闭其空闲连接
+DB_BUSY_TIMEOUT_MS = int(os.getenv('MACRO_COACH_DB_BUSY_TIMEOUT_MS', '5000'))
+QUERY_CACHE_MAX_MB = int(os.getenv('MACRO_COACH_QUERY_CACHE_MB', '64'))
+IMPORT_CHUNK_ROWS = int(os.getenv('MACRO_COACH_IMPORT_CHUNK_ROWS', '50000'))
+ARCHIVE_DIR = os.getenv('MACRO_COACH_ARCHIVE_DIR', os.path.join(os.path.dirname(DB_PATH) or '.', 'archive'))
+ARCHIVE_HORIZON_DAYS = int(os.getenv('MACRO_COACH_ARCHIVE_HORIZON_DAYS', '365'))
+EXPORT_CHUNK_ROWS = int(os.getenv('MACRO_COACH_EXPORT_CHUNK_ROWS', '50000'))
+BACKUP_DIR = os.getenv('MACRO_COACH_BACKUP_DIR', os.path.join(os.path.dirname(DB_PATH) or '.', 'backups'))
+BACKUP_INTERVAL_MIN = float(os.getenv('MACRO_COACH_BACKUP_INTERVAL_MIN', '360'))  # 0 = 不启动后台备份
+BACKUP_COMPRESS = os.getenv('MACRO_COACH_BACKUP_COMPRESS', 'gzip')  # gzip / none
+BACKUP_KEEP_DAILY = int(os.getenv('MACRO_COACH_BACKUP_KEEP_DAILY', '7'))
+BACKUP_KEEP_WEEKLY = int(os.getenv('MACRO_COACH_BACKUP_KEEP_WEEKLY', '4'))
+BACKUP_PAGES_PER_STEP = int(os.getenv('MACRO_COACH_BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP_MS = float(os.getenv('MACRO_COACH_BACKUP_STEP_SLEEP_MS', '5'))
+CHART_POINT_BUDGET = int(os.getenv('MACRO_COACH_CHART_POINT_BUDGET', '1200'))   # 每条曲线下发到浏览器的最多点数
+CHART_WEBGL_MIN_POINTS = int(os.getenv('MACRO_COACH_CHART_WEBGL_MIN_POINTS', '2000'))  # 原始点数超过此值改用 Scattergl
+# 摄入写后队列：首条入队后最多等待的毫秒数 / 每次组提交的最多行数
+INTAKE_QUEUE_MS = float(os.getenv('MACRO_COACH_INTAKE_QUEUE_MS', '5'))
+INTAKE_QUEUE_ROWS = int(os.getenv('MACRO_COACH_INTAKE_QUEUE_ROWS', '256'))
+# 撤销/重做日志（环形缓冲）保留的最多条数（每个运动员库各自计数；0 = 不记录）
+JOURNAL_MAX_ENTRIES = int(os.getenv('MACRO_COACH_JOURNAL_MAX_ENTRIES', '1000'))
+# 本地 HTTP API（python -m macrocoach_v2.api serve）：监听地址、阻塞 SQLite 读取的线程池大小（摄入写入走写后队列）
+API_HOST = os.getenv('MACRO_COACH_API_HOST', '127.0.0.1')
+API_PORT = int(os.getenv('MACRO_COACH_API_PORT', '8765'))
+API_WORKERS = int(os.getenv('MACRO_COACH_API_WORKERS', '8'))
+SHOW_TIMINGS = os.getenv('MACRO_COACH_SHOW_TIMINGS', '0') == '1'
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from ..settings import CHART_POINT_BUDGET, CHART_WEBGL_MIN_POINTS
+
+# 长历史曲线：服务端按 LTTB（Largest-Triangle-Three-Buckets）降采样到每条曲线的点数预算，
+# 原始点数多时改用 WebGL 轨迹；“放大”通过日期范围滑块完成——范围越窄，范围内保留的原始点越多，直到全分辨率。
+
+def lttb_index(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # 返回保留点的下标（升序，含首尾）；x 需升序、无 NaN
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    # 中间 n-2 个点均分到 n_out-2 个桶；每个桶的均值（作为下一桶的参照点）与选中顺序无关，可以一次算出
+    edges = (np.linspace(0, n - 2, n_out - 1)).astype(int) + 1
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n-1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n-1], edges[:-1] - 1) / counts
+    avg_x = np.append(avg_x[1:], x[-1]); avg_y = np.append(avg_y[1:], y[-1])
+    out = [0] * n_out
+    out[-1] = n - 1
+    a = 0
+    if n / n_out < 32:
+        # 桶很小（如多年的日数据）：纯 Python 逐点比纯 numpy 切片的调用开销更低
+        xs, ys, bx, by, ed = x.tolist(), y.tolist(), avg_x.tolist(), avg_y.tolist(), edges.tolist()
+        for i in range(n_out - 2):
+            ax, ay, cx, cy = xs[a], ys[a], bx[i], by[i]
+            best, a_next = -1.0, ed[i]
+            for j in range(ed[i], ed[i + 1]):
+                area = abs((ax - cx) * (ys[j] - ay) - (ax - xs[j]) * (cy - ay))
+                if area > best:
+                    best, a_next = area, j
+            a = a_next
+            out[i + 1] = a
+    else:
+        for i in range(n_out - 2):
+            lo, hi = edges[i], edges[i + 1]
+            ax, ay = x[a], y[a]
+            area = np.abs((ax - avg_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i] - ay))
+            a = lo + int(np.argmax(area))
+            out[i + 1] = a
+    return np.asarray(out, dtype=np.int64)
+
+def _xnum(x: pd.Series) -> np.ndarray:
+    return x.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float) if np.issubdtype(x.dtype, np.datetime64) else x.to_numpy(float)
+
+def thin_index(x: pd.Series, y: pd.Series, budget: int = CHART_POINT_BUDGET) -> np.ndarray:
+    # 去掉 NaN 后的 LTTB 下标（相对原序列的位置）
+    keep = np.flatnonzero(y.notna().to_numpy())
+    if len(keep) <= budget:
+        return keep
+    return keep[lttb_index(_xnum(x.iloc[keep]), y.to_numpy(float)[keep], budget)]
+
+def scatter_cls(n_points: int):
+    # 同一张图内的轨迹应使用同一类型（填充带 tonexty 依赖相邻轨迹）
+    import plotly.graph_objects as go
+    return go.Scattergl if n_points > CHART_WEBGL_MIN_POINTS else go.Scatter
+
+def add_line(fig, df: pd.DataFrame, xcol: str, ycol: str, name: str, budget: int = CHART_POINT_BUDGET,
+             cls=None, **kw) -> None:
+    idx = thin_index(df[xcol], df[ycol], budget)
+    cls = cls or scatter_cls(len(df))
+    fig.add_trace(cls(x=df[xcol].iloc[idx], y=df[ycol].iloc[idx], name=name, mode=kw.pop('mode', 'lines'), **kw))
+
+def add_band(fig, df: pd.DataFrame, xcol: str, mid: str, lo: str, hi: str, name: str,
+             budget: int = CHART_POINT_BUDGET, cls=None) -> None:
+    # 上下边界用中线的 LTTB 下标，保证两条边界的 x 一致、填充正确
+    idx = thin_index(df[xcol], df[mid], budget)
+    cls = cls or scatter_cls(len(df))
+    x = df[xcol].iloc[idx]
+    fig.add_trace(cls(x=x, y=df[hi].iloc[idx], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+    fig.add_trace(cls(x=x, y=df[lo].iloc[idx], mode='lines', line=dict(width=0), fill='tonexty', name=name, hoverinfo='skip'))
+
+def layout(fig, title: str, yaxis_title: str, **yaxis):
+    fig.update_layout(title=title, hovermode='x unified', legend_orientation='h', margin=dict(l=10,r=10,t=40,b=10))
+    fig.update_yaxes(title_text=yaxis_title, **yaxis)
+    return fig
+
+def ts_figure(df: pd.DataFrame, xcol: str, ycols: Sequence[str], title: str, yaxis_title: str,
+              budget: int = CHART_POINT_BUDGET):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    cls = scatter_cls(len(df))
+    for y in ycols:
+        if y in df.columns:
+            add_line(fig, df, xcol, y, y, budget, cls)
+    return layout(fig, title, yaxis_title)
+
+def in_window(df: pd.DataFrame, window: Optional[Tuple[pd.Timestamp, pd.Timestamp]], xcol: str = 'date') -> pd.DataFrame:
+    if window is None or len(df) == 0:
+        return df
+    x = df[xcol]
+    return df[(x >= window[0]) & (x <= window[1])]
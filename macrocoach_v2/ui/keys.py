@@ -1,3 +1,7 @@
 # -*- coding: utf-8 -*-
+from ..data.athletes import current_athlete
+
 def key(prefix: str, name: str) -> str:
-    return f"{prefix}_{name}"
+    # 控件状态按运动员隔离：切换运动员时表单/侧栏各自保留；默认运动员沿用原有键名
+    athlete = current_athlete()
+    return f"{athlete}:{prefix}_{name}" if athlete else f"{prefix}_{name}"
@@ -1,31 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import os
-import pandas as pd
+from datetime import date, timedelta
 import streamlit as st
-from ..data.db import df_from_sql, executemany, execute
-from ..utils.safe_cast import to_float, to_int
+from ..data.db import verify_intake_daily, rebuild_intake_daily, cache_stats, pool_stats
+from ..data.csv_import import import_csv
+from ..data.export import export_bundle
+from ..data.archive import archive_older_than, archive_stats, parquet_available
+from ..data.backup import backup_once, last_backup_status, list_backups, restore_backup, verify_backup
+from ..settings import ARCHIVE_HORIZON_DAYS, BACKUP_INTERVAL_MIN, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY
 from .keys import key
 
 def render_tab_import_export(db_path: str) -> None:
 
-    st.subheader('导出 CSV / 数据库', anchor=False)
-    if st.button('导出全部 CSV（metrics/targets/intake/volume）', key=key('t4','export_csv'), help='下载四张表的 CSV。'):
-        dm = df_from_sql('SELECT * FROM daily_metrics ORDER BY date ASC')
-        dt = df_from_sql('SELECT * FROM daily_targets ORDER BY date ASC')
-        il = df_from_sql('SELECT * FROM intake_logs ORDER BY ts ASC')
-        wl = df_from_sql('SELECT * FROM weekly_volume ORDER BY date ASC')
-        st.download_button('下载 daily_metrics.csv', dm.to_csv(index=False).encode('utf-8'), file_name='daily_metrics.csv')
-        st.download_button('下载 daily_targets.csv', dt.to_csv(index=False).encode('utf-8'), file_name='daily_targets.csv')
-        st.download_button('下载 intake_logs.csv', il.to_csv(index=False).encode('utf-8'), file_name='intake_logs.csv')
-        st.download_button('下载 weekly_volume.csv', wl.to_csv(index=False).encode('utf-8'), file_name='weekly_volume.csv')
-
-    try:
-        with open(db_path, 'rb') as f:
-            db_bytes = f.read()
-        st.download_button('下载数据库备份（.db）', db_bytes, file_name=os.path.basename(db_path))
-    except Exception:
-        st.caption('数据库尚未创建或无法访问备份。')
+    st.subheader('导出数据包（CSV / Parquet + 可选 .db 快照）', anchor=False)
+    st.caption('先用 SQLite 在线备份取一致快照，再逐表分块写入一个 zip；导出期间不阻塞记录写入。')
+    c1, c2, c3 = st.columns([1,2,1])
+    fmt_opts = ['CSV', 'Parquet'] if parquet_available() else ['CSV']
+    fmt = c1.radio('格式', fmt_opts, horizontal=True, key=key('t4','fmt'), help='Parquet 为列式压缩格式（需安装 pyarrow）。')
+    use_range = c2.toggle('按日期范围过滤', value=False, key=key('t4','use_range'))
+    rng = c2.date_input('日期范围', value=(date.today() - timedelta(days=90), date.today()), key=key('t4','range'), disabled=not use_range)
+    with_db = c3.checkbox('包含 .db 快照', value=False, key=key('t4','with_db'), help='快照为完整数据库，不受日期范围影响。')
+    if st.button('生成导出包', key=key('t4','export_zip'), help='生成一致快照并打包四张表。'):
+        start = end = None
+        if use_range and isinstance(rng, (tuple, list)) and len(rng) == 2:
+            start, end = rng[0].isoformat(), rng[1].isoformat()
+        try:
+            with st.spinner('正在导出…'):
+                path = export_bundle(fmt.lower(), start, end, include_db=with_db, db_name=os.path.basename(db_path))
+            with open(path, 'rb') as f:
+                st.download_button('下载导出包（.zip）', f, file_name=f'macrocoach_{date.today().isoformat()}.zip', mime='application/zip', key=key('t4','dl_zip'))
+        except Exception as e:
+            st.error(f'导出失败：{e}')
 
     st.write('---')
     st.subheader('导入 CSV（覆盖/补充到当前数据库）', anchor=False)
@@ -35,64 +41,90 @@ def render_tab_import_export(db_path: str) -> None:
     uploaded_wl = st.file_uploader('选择 weekly_volume.csv', type=['csv'], key=key('imp','wl'), help='导入训练量记录。')
     if st.button('开始导入', type='primary', key=key('imp','run'), help='将 CSV 数据写入数据库。'):
         imported = []
+        uploads = [('daily_metrics', uploaded_dm), ('daily_targets', uploaded_dt), ('intake_logs', uploaded_il), ('weekly_volume', uploaded_wl)]
         try:
-            if uploaded_dm is not None:
-                df = pd.read_csv(uploaded_dm)
-                req_cols = {'date','weight','steps','exercise_min','sleep_h','fatigue','perf_pct','avg_hr','max_hr','load_index'}
-                for m in (req_cols - set(df.columns)): df[m] = None
-                rows = [(
-                    str(row.get('date')), to_float(row.get('weight')), to_int(row.get('steps')), to_float(row.get('exercise_min')),
-                    to_float(row.get('sleep_h')), to_int(row.get('fatigue')), to_float(row.get('perf_pct')), to_float(row.get('avg_hr')),
-                    to_float(row.get('max_hr')), to_float(row.get('load_index'))
-                ) for _, row in df.iterrows()]
-                executemany(
-                    'INSERT OR REPLACE INTO daily_metrics(date,weight,steps,exercise_min,sleep_h,fatigue,perf_pct,avg_hr,max_hr,load_index) VALUES(?,?,?,?,?,?,?,?,?,?)',
-                    rows
-                )
-                imported.append(f'daily_metrics: {len(rows)} 行')
-            if uploaded_dt is not None:
-                df = pd.read_csv(uploaded_dt)
-                req_cols = {'date','target_kcal','protein_g','fat_g','carb_g','bmr','pal','tdee_used','deficit','ea','ea_guard_applied','notes','day_type'}
-                for m in (req_cols - set(df.columns)): df[m] = None
-                rows = [(
-                    str(row.get('date')), to_float(row.get('target_kcal')), to_float(row.get('protein_g')), to_float(row.get('fat_g')),
-                    to_float(row.get('carb_g')), to_float(row.get('bmr')), to_float(row.get('pal')), to_float(row.get('tdee_used')),
-                    to_float(row.get('deficit')), to_float(row.get('ea')), to_int(row.get('ea_guard_applied')), str(row.get('notes') or ''), str(row.get('day_type') or None)
-                ) for _, row in df.iterrows()]
-                executemany(
-                    'INSERT OR REPLACE INTO daily_targets(date,target_kcal,protein_g,fat_g,carb_g,bmr,pal,tdee_used,deficit,ea,ea_guard_applied,notes,day_type) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?)',
-                    rows
-                )
-                imported.append(f'daily_targets: {len(rows)} 行')
-            if uploaded_il is not None:
-                df = pd.read_csv(uploaded_il)
-                req_cols = {'ts','date','meal_tag','kcal','protein_g','fat_g','carb_g','note'}
-                for m in (req_cols - set(df.columns)): df[m] = None
-                rows = [(
-                    str(row.get('ts')), str(row.get('date')), str(row.get('meal_tag') or ''), to_float(row.get('kcal')),
-                    to_float(row.get('protein_g')), to_float(row.get('fat_g')), to_float(row.get('carb_g')), str(row.get('note') or '')
-                ) for _, row in df.iterrows()]
-                executemany(
-                    'INSERT INTO intake_logs(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note) VALUES(?,?,?,?,?,?,?,?)',
-                    rows
-                )
-                imported.append(f'intake_logs: {len(rows)} 行')
-            if uploaded_wl is not None:
-                df = pd.read_csv(uploaded_wl)
-                req_cols = {'date','muscle_group','sets'}
-                for m in (req_cols - set(df.columns)): df[m] = None
-                rows = [(
-                    str(row.get('date')), str(row.get('muscle_group') or ''), to_int(row.get('sets'))
-                ) for _, row in df.iterrows()]
-                executemany(
-                    'INSERT INTO weekly_volume(date,muscle_group,sets) VALUES(?,?,?)',
-                    rows
-                )
-                imported.append(f'weekly_volume: {len(rows)} 行')
+            for table, up in uploads:
+                if up is None:
+                    continue
+                bar = st.progress(0.0, text=f'{table}：导入中…')
+                def _progress(read: int, written: int, frac, table=table, bar=bar):
+                    bar.progress(frac if frac is not None else 0.0, text=f'{table}：已读取 {read} 行，写入 {written} 行')
+                read, written = import_csv(table, up, progress=_progress)
+                bar.progress(1.0, text=f'{table}：完成')
+                msg = f'{table}: {written} 行'
+                if read != written and table == 'intake_logs':
+                    msg += f'（跳过重复 {read - written} 行）'
+                imported.append(msg)
             if imported:
                 st.success('导入完成：' + '；'.join(imported))
             else:
                 st.info('没有选择任何文件。')
         except Exception as e:
-            st.error(f'导入失败：{e}')
+            st.error(f'导入失败：{e}（已完成的分块已写入，可修正后重新导入，摄入记录不会重复）')
+
+    st.write('---')
+    st.subheader('🧰 维护：摄入日汇总表', anchor=False)
+    st.caption('intake_daily 由触发器随每次添加/删除/撤销/导入自动更新；可在此校验或重建。')
+    c1, c2 = st.columns(2)
+    if c1.button('校验汇总表', key=key('maint','verify_daily'), help='将 intake_daily 与 intake_logs 重新聚合结果对比。'):
+        drift = verify_intake_daily()
+        if len(drift)==0:
+            st.success('汇总表与明细一致。')
+        else:
+            st.warning(f'发现 {len(drift)} 天不一致，可点击“重建汇总表”修复。')
+            st.dataframe(drift, width='stretch')
+    if c2.button('重建汇总表', key=key('maint','rebuild_daily'), help='清空并按 intake_logs 全量重算 intake_daily。'):
+        n = rebuild_intake_daily()
+        st.success(f'已重建 {n} 天的汇总。')
+
+    st.write('---')
+    st.subheader('🗄️ 归档：冷热分层', anchor=False)
+    st.caption('把较早的摄入记录与日指标按月写入压缩列式文件（Parquet），SQLite 只保留近期数据；报告与计划读取时自动合并冷热数据。')
+    if parquet_available():
+        horizon = st.number_input('保留最近天数（更早的归档）', 30, 3650, ARCHIVE_HORIZON_DAYS, 30, key=key('maint','horizon'), help='早于“今天-该天数”的行将被归档。')
+        if st.button('立即归档', key=key('maint','archive'), help='写入冷存储后从主库删除。'):
+            try:
+                moved = archive_older_than(int(horizon))
+                st.success('已归档：' + '；'.join(f'{t}: {n} 行' for t, n in moved.items()))
+            except Exception as e:
+                st.error(f'归档失败：{e}')
+        st.dataframe(archive_stats(), width='stretch')
+    else:
+        st.caption('需要安装 pyarrow 才能使用归档。')
+
+    st.write('---')
+    st.subheader('💾 自动备份', anchor=False)
+    every = f'每 {BACKUP_INTERVAL_MIN:g} 分钟' if BACKUP_INTERVAL_MIN > 0 else '已关闭'
+    st.caption(f'后台用 SQLite 在线备份 API 分页拷贝（{every}），步间让出锁，不阻塞记录写入；保留 {BACKUP_KEEP_DAILY} 天 / {BACKUP_KEEP_WEEKLY} 周。')
+    last = last_backup_status()
+    if last:
+        c1, c2, c3 = st.columns(3)
+        c1.metric('上次备份', str(last.get('at', '')).replace('T', ' '))
+        c2.metric('耗时', f"{last.get('duration_s', 0)} s")
+        c3.metric('大小', f"{last.get('size_mb', 0)} MB", help=f"数据库 {last.get('db_size_mb', 0)} MB")
+    else:
+        st.info('尚无备份。')
+    if st.button('立即备份', key=key('bak','now'), help='立即做一次在线备份并按保留策略轮换。'):
+        try:
+            with st.spinner('正在备份…'):
+                res = backup_once()
+            st.success(f"已备份：{os.path.basename(str(res['path']))}（{res['duration_s']} s，{res['size_mb']} MB）")
+        except Exception as e:
+            st.error(f'备份失败：{e}')
+    backups = list_backups()
+    if backups:
+        pick = st.selectbox('选择备份', backups, format_func=os.path.basename, key=key('bak','pick'))
+        c1, c2 = st.columns(2)
+        if c1.button('校验', key=key('bak','verify'), help='解压到临时文件并执行 PRAGMA integrity_check。'):
+            res = verify_backup(pick)
+            (st.success if res == 'ok' else st.error)(f'integrity_check：{res}')
+        confirm = c2.checkbox('确认用该备份覆盖当前数据库', key=key('bak','confirm'))
+        if c2.button('校验并恢复', key=key('bak','restore'), disabled=not confirm, help='校验通过后替换数据库；替换前自动保存一份 pre-restore 备份。'):
+            try:
+                restore_backup(pick)
+                st.success('已恢复。')
+            except Exception as e:
+                st.error(f'恢复失败：{e}')
 
+    with st.expander('运行状态（查询缓存 / 连接池）'):
+        st.json({'query_cache': cache_stats(), 'pools': pool_stats()})
@@ -4,9 +4,20 @@ from datetime import date, datetime
 import streamlit as st
 from ..domain.models import UserProfile
 from ..domain.calcs import calc_bmr, ffm_from_bf
-from ..data.db import df_from_sql, upsert_targets, intake_sums, fetch_intake_today, add_intake_row, delete_last_intake_today
+from ..data.db import df_from_sql, upsert_targets, intake_sums, fetch_intake_today, undo, redo, journal_peek
+from ..data.intake_queue import intake_queue
 from .keys import key
 
+# 撤销记录的动作代码 → 按钮提示中的名称
+_ACTIONS = {'intake': '添加摄入', 'metrics': '日指标', 'targets': '日目标', 'schedule': '预生成目标',
+            'backfill': '回算目标', 'import': '导入', 'volume': '周组数'}
+
+def _describe(entry) -> str:
+    if entry is None:
+        return ''
+    action, detail = entry
+    return '+'.join(_ACTIONS.get(a, a) for a in action.split('+')) + (f'（{detail}）' if detail else '')
+
 def render_tab_intake(side: dict) -> None:
     # === Calendar (start) [forced] ===
     import datetime as _dt
@@ -48,10 +59,12 @@ def render_tab_intake(side: dict) -> None:
             upsert_targets(today_str, {
                 'target_kcal': round(target_kcal,0), 'protein_g': round(protein_g,0), 'fat_g': round(fat_g,0), 'carb_g': round(carb_g,0),
                 'bmr': round(bmr,1), 'pal': round(float(side['baseline_pal']),2), 'tdee_used': round(tdee_no_ex,0), 'deficit': round(float(side['deficit']),3), 'ea': round(ea,1)
-            }, notes='基线目标（Intake页快速生成，未包含运动）', ea_guard_applied=0, day_type='deficit')
+            }, notes='基线目标（Intake页快速生成，未包含运动）', ea_guard_applied=0, day_type='deficit', source='baseline')
             st.success('已生成今日基线目标！回到“今日计划”用完整运动数据再次计算覆盖。')
             dt_today = df_from_sql('SELECT * FROM daily_targets WHERE date = ?', (today_str,))
 
+    # 写后队列中尚未提交的记录先落库，剩余宏量才准确
+    intake_queue().flush()
     totals = intake_sums(today_str)
     st.write('---')
     colA, colB, colC = st.columns(3)
@@ -83,6 +96,8 @@ def render_tab_intake(side: dict) -> None:
 
     st.write('---')
     st.subheader('添加一条摄入', anchor=False)
+    # 撤销/重做只作用于本会话自己的写入（含其它页面的保存），其它会话同时记录的餐次不受影响
+    nxt = journal_peek()
     with st.form(key('intake','form')):
         now_h = datetime.now().hour
         default_tag = '早餐' if now_h<11 else ('午餐' if now_h<16 else ('晚餐' if now_h<22 else '加餐'))
@@ -97,9 +112,10 @@ def render_tab_intake(side: dict) -> None:
         with c4:
             c_in = st.number_input('碳水(g)', 0.0, 500.0, 0.0, 1.0, key=key('intake','c'))
         note_in = st.text_input('备注(可选)', key=key('intake','note'), help='如“米饭+鸡胸+西兰花”。')
-        col_btn_add, col_btn_undo = st.columns(2)
+        col_btn_add, col_btn_undo, col_btn_redo = st.columns(3)
         add_ok = col_btn_add.form_submit_button('添加记录', type='primary', help='保存到数据库。')
-        undo_ok = col_btn_undo.form_submit_button('撤销上一条', help='删除今天最新一条。')
+        undo_ok = col_btn_undo.form_submit_button('↶ 撤销', help=f"撤销：{_describe(nxt['undo'])}" if nxt['undo'] else '本会话没有可撤销的操作。')
+        redo_ok = col_btn_redo.form_submit_button('↷ 重做', help=f"重做：{_describe(nxt['redo'])}" if nxt['redo'] else '没有可重做的操作。')
 
         if add_ok:
             kcal_final = float(kcal_in)
@@ -108,12 +124,20 @@ def render_tab_intake(side: dict) -> None:
                 kcal_final = kcal_from_macros
             if kcal_final>0 and kcal_from_macros>0 and abs(kcal_final - kcal_from_macros) > 80:
                 note_in = (note_in + ' | kcal与宏不一致(已按kcal记录)').strip()
-            add_intake_row(today_str, str(meal_tag), kcal_final, float(p_in), float(f_in), float(c_in), str(note_in))
+            intake_queue().put(today_str, str(meal_tag), kcal_final, float(p_in), float(f_in), float(c_in), str(note_in))
             st.success('已添加！')
-        if undo_ok:
-            ok = delete_last_intake_today(today_str)
-            st.success('已撤销上一条。' if ok else '今天还没有可撤销的记录。')
+        if undo_ok or redo_ok:
+            intake_queue().flush()
+            res = undo() if undo_ok else redo()
+            verb = '撤销' if undo_ok else '重做'
+            if res is None:
+                st.info(f'没有可{verb}的操作。')
+            elif res['conflict']:
+                st.warning(f"{_describe((res['action'], res['detail']))} 涉及的数据已被其它会话修改，已放弃这条记录。")
+            else:
+                st.success(f"已{verb}：{_describe((res['action'], res['detail']))}")
 
+    intake_queue().flush()
     logs = fetch_intake_today(today_str)
     if len(logs)>0:
         st.dataframe(logs, width='stretch')
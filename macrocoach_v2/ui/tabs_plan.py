@@ -5,7 +5,10 @@ from typing import List
 import streamlit as st
 from ..domain.models import UserProfile, ActivityBlock, PIDConfig
 from ..services.planner import plan_day, predict_next_day
-from ..data.db import df_from_sql, upsert_metrics, upsert_targets
+from ..data.db import upsert_metrics, upsert_targets, transaction, load_history_state, df_from_sql
+from ..domain.history import loss_obs, sleep_ema
+from ..services.batch_planner import plan_grid, activity_from_load
+from ..services.tdee import tdee_factor_for
 from .keys import key
 
 def render_tab_plan(side: dict) -> None:
@@ -66,7 +69,10 @@ def render_tab_plan(side: dict) -> None:
             st.success(f'已同步训练负荷到“手动录入”：{round(load_tmp,0)}')
 
         if submit_calc:
-            dm_hist = df_from_sql('SELECT * FROM daily_metrics ORDER BY date ASC')
+            hist_state = load_history_state()
+            tdee_est = tdee_factor_for(cur_date_str) if side['tdee_source']=='自适应' else None
+            if side['tdee_source']=='自适应' and tdee_est is None:
+                st.info('自适应 TDEE 数据不足（需要连续记录摄入与称重），本次使用公式 TDEE。')
             profile = UserProfile(
                 sex=str(side['sex']), age=int(side['age']), height_cm=float(side['height_cm']), weight_kg=float(side['weight_kg']),
                 body_fat_pct=float(side['body_fat_pct']) if side['body_fat_pct'] is not None else None, baseline_pal=float(side['baseline_pal']),
@@ -87,12 +93,14 @@ def render_tab_plan(side: dict) -> None:
                 bool(side['auto_mode']), float(target_loss_week_kg),
                 PIDConfig(Kp=float(side['Kp']), Ki=float(side['Ki']), Kd=float(side['Kd']), integral_cap=float(side['Icap'])),
                 int(fatigue), float(sleep_h), float(perf_pct),
-                bool(apply_sug), dm_hist, float(today_w) if today_w>0 else None,
+                bool(apply_sug), None, float(today_w) if today_w>0 else None,
                 protein_basis='FFM' if side['protein_basis']=='按FFM' else 'BW',
                 protein_per_kg_ffm=float(side['protein_per_kg_ffm']),
                 ea_min=float(side['ea_min']), ea_pref=float(side['ea_pref']),
                 training_day_carb_bump_g_per_kg=float(side['training_bump']),
-                training_load_threshold=float(side['training_threshold'])
+                training_load_threshold=float(side['training_threshold']),
+                hist_state=hist_state,
+                tdee_factor=tdee_est['factor'] if tdee_est else None
             )
 
             st.session_state['t2_load']    = res['load_index']
@@ -114,6 +122,8 @@ def render_tab_plan(side: dict) -> None:
                 st.write(f"BMR: {res['bmr']}  |  PAL: {res['pal']}")
                 st.write(f"运动消耗: {res['exercise_kcal']} kcal  |  训练负荷: {res['load_index']}")
                 st.write(f"TDEE: **{res['tdee_used']}**  |  赤字: **{res['deficit']}**")
+                if tdee_est:
+                    st.caption(f"自适应 TDEE：公式 {res['tdee_formula']} × {tdee_est['factor']:.3f}（截至 {tdee_est['date']}，{tdee_est['n_obs']} 天观测）")
                 st.caption(f"按赤字摄入(未应用EA)：{res['intended_kcal']} kcal | EA最低摄入：{res['ea_floor_kcal']} kcal | 最终目标：{res['target_kcal']} kcal（取两者较高≤TDEE）")
             with colC:
                 st.subheader('🛡️ 安全护栏')
@@ -132,19 +142,104 @@ def render_tab_plan(side: dict) -> None:
                     st.write('- ', s)
 
             today_str = cur_date_str
-            upsert_metrics(today_str, {
-                'weight': float(today_w) if today_w>0 else float(side['weight_kg']), 'steps': int(side['steps']), 'exercise_min': int(bad_min+lift_min+car_min),
-                'sleep_h': float(sleep_h), 'fatigue': int(fatigue), 'perf_pct': float(perf_pct),
-                'avg_hr': None, 'max_hr': None, 'load_index': float(res['load_index']),
-            })
-            upsert_targets(today_str, {
-                **{k:res[k] for k in ['target_kcal','protein_g','fat_g','carb_g','bmr','pal','tdee_used','deficit','ea']}
-            }, notes=('；'.join([str(x) for x in res['notes']]) if len(res['notes']) else ''), ea_guard_applied=1 if res['ea']<float(side['ea_min']) else 0, day_type=('deficit' if res['deficit']>0 else 'maintain'))
-
-            dm_hist2 = df_from_sql('SELECT * FROM daily_metrics ORDER BY date ASC')
-            if len(dm_hist2)>0:
-                pred = predict_next_day(dm_hist2)
+            with transaction():
+                upsert_metrics(today_str, {
+                    'weight': float(today_w) if today_w>0 else float(side['weight_kg']), 'steps': int(side['steps']), 'exercise_min': int(bad_min+lift_min+car_min),
+                    'sleep_h': float(sleep_h), 'fatigue': int(fatigue), 'perf_pct': float(perf_pct),
+                    'avg_hr': None, 'max_hr': None, 'load_index': float(res['load_index']),
+                })
+                upsert_targets(today_str, {
+                    **{k:res[k] for k in ['target_kcal','protein_g','fat_g','carb_g','bmr','pal','tdee_used','tdee_formula','deficit','ea']}
+                }, notes=('；'.join([str(x) for x in res['notes']]) if len(res['notes']) else ''), ea_guard_applied=1 if res['ea']<float(side['ea_min']) else 0, day_type=('deficit' if res['deficit']>0 else 'maintain'))
+
+            hist_state2 = load_history_state()
+            if len(hist_state2.recent)>0:
+                pred = predict_next_day(None, hist_state2)
                 st.subheader('🔮 明日预测')
                 st.write(f"训练建议：**{pred['train_band']}** 强度  |  赤字建议：**{pred['deficit_band']}** 档")
                 st.caption(pred['note'])
 
+    _render_what_if(side, cur_date_str)
+
+_SWEEP_LABELS = {
+    'min_deficit': '赤字下限', 'max_deficit': '赤字上限', 'loss_rate_pct': '每周下降%', 'protein_basis': '蛋白依据',
+    'protein_per_kg_ffm': '蛋白 g/kg FFM', 'ea_min': 'EA 下限', 'training_day_carb_bump_g_per_kg': '训练日加碳 g/kg',
+}
+
+def _opts(base: List[float], value: float) -> List[float]:
+    return sorted(set([float(x) for x in base] + [round(float(value), 2)]))
+
+@st.fragment
+def _render_what_if(side: dict, d: str) -> None:
+    # 只读：对所选日期按参数网格批量计算目标，不写数据库；片段内交互只重跑本区域
+    with st.expander('🔬 参数对比（What-if，不写入）'):
+        row = df_from_sql('SELECT weight, steps, sleep_h, fatigue, perf_pct, load_index FROM daily_metrics WHERE date = ?', (d,))
+        if len(row) > 0:
+            r = row.iloc[0].to_dict()
+            st.caption(f'使用 {d} 已保存的日指标。')
+        else:
+            r = {'weight': st.session_state.get('t2_w', side['weight_kg']), 'steps': st.session_state.get('t2_steps', side['steps']),
+                 'sleep_h': st.session_state.get('t2_sleep', 7.5), 'fatigue': st.session_state.get('t2_fatigue', 4),
+                 'perf_pct': st.session_state.get('t2_perf', 0.0), 'load_index': st.session_state.get('t2_load', 0.0)}
+            st.caption(f'{d} 尚无日指标：使用最近一次计算的表单值。')
+        c1, c2, c3, c4 = st.columns(4)
+        grid = {
+            'min_deficit': c1.multiselect(_SWEEP_LABELS['min_deficit'], _opts([0.05,0.08,0.10,0.12,0.15], side['min_def']), [round(float(side['min_def']),2)], key=key('whatif','min_def')),
+            'max_deficit': c2.multiselect(_SWEEP_LABELS['max_deficit'], _opts([0.20,0.25,0.30,0.35], side['max_def']), [round(float(side['max_def']),2)], key=key('whatif','max_def')),
+            'loss_rate_pct': c3.multiselect(_SWEEP_LABELS['loss_rate_pct'], _opts([0.3,0.5,0.7,0.9,1.0,1.2], side['loss_rate_pct']), [0.5, round(float(side['loss_rate_pct']),2)], key=key('whatif','loss')),
+            'protein_basis': c4.multiselect(_SWEEP_LABELS['protein_basis'], ['FFM','BW'], ['FFM' if side['protein_basis']=='按FFM' else 'BW'], key=key('whatif','basis')),
+        }
+        c5, c6, c7 = st.columns(3)
+        grid['protein_per_kg_ffm'] = c5.multiselect(_SWEEP_LABELS['protein_per_kg_ffm'], _opts([2.3,2.6,2.8,3.1], side['protein_per_kg_ffm']), [round(float(side['protein_per_kg_ffm']),2), 2.8], key=key('whatif','p_ffm'))
+        grid['ea_min'] = c6.multiselect(_SWEEP_LABELS['ea_min'], _opts([30,32,35,38,40], side['ea_min']), [round(float(side['ea_min']),2)], key=key('whatif','ea_min'))
+        grid['training_day_carb_bump_g_per_kg'] = c7.multiselect(_SWEEP_LABELS['training_day_carb_bump_g_per_kg'], _opts([0.0,0.5,1.0,1.5], side['training_bump']), [round(float(side['training_bump']),2)], key=key('whatif','bump'))
+        grid = {k: sorted(set(v)) for k, v in grid.items() if len(v) > 0}
+        n = 1
+        for v in grid.values():
+            n *= len(v)
+        st.caption(f'共 {n} 种组合。')
+        if n == 0 or n > 20000:
+            st.info('请减少组合数（≤ 20000）。')
+            return
+
+        # 公共输入（负荷还原的运动、历史趋势、睡眠 EMA）只准备一次
+        state = load_history_state()
+        lo, se = loss_obs(state), sleep_ema(state)
+        tdee_est = tdee_factor_for(d) if side['tdee_source']=='自适应' else None
+        act_minutes, act_met = activity_from_load(r.get('load_index') or 0.0)
+        weight = float(r['weight']) if r.get('weight') is not None and float(r['weight']) > 0 else None
+        steps = int(r['steps']) if r.get('steps') is not None and float(r['steps']) > 0 else None
+        profile = UserProfile(
+            sex=str(side['sex']), age=int(side['age']), height_cm=float(side['height_cm']), weight_kg=float(side['weight_kg']),
+            body_fat_pct=float(side['body_fat_pct']) if side['body_fat_pct'] is not None else None, baseline_pal=float(side['baseline_pal']),
+            protein_g_per_kg_bw=float(side['protein_per_kg_bw']), fat_g_per_kg_bw=float(side['fat_per_kg_bw']),
+            deficit=float(side['deficit']), min_deficit=float(side['min_def']), max_deficit=float(side['max_def']),
+            carb_periodization=True,
+        )
+        inputs = dict(
+            act_minutes=act_minutes, act_met=act_met, steps=steps, auto_mode=bool(side['auto_mode']),
+            target_loss_week_kg=(weight or float(side['weight_kg'])) * float(side['loss_rate_pct'])/100.0,
+            pid_cfg=PIDConfig(Kp=float(side['Kp']), Ki=float(side['Ki']), Kd=float(side['Kd']), integral_cap=float(side['Icap'])),
+            fatigue=int(r.get('fatigue') or 4), sleep_h=float(r.get('sleep_h') or 7.5), perf_change_pct=float(r.get('perf_pct') or 0.0),
+            apply_suggestions=False, loss_obs=lo, sleep_ema=se, today_weight=weight,
+            protein_basis='FFM' if side['protein_basis']=='按FFM' else 'BW', protein_per_kg_ffm=float(side['protein_per_kg_ffm']),
+            ea_min=float(side['ea_min']), ea_pref=float(side['ea_pref']),
+            training_day_carb_bump_g_per_kg=float(side['training_bump']), training_load_threshold=float(side['training_threshold']),
+            tdee_factor=tdee_est['factor'] if tdee_est else None,
+        )
+        res = plan_grid(profile, inputs, grid)
+        show = res[list(grid) + ['target_kcal', 'protein_g', 'fat_g', 'carb_g', 'deficit', 'ea', 'ea_guard_applied', 'tdee_used']]
+        show = show.rename(columns=_SWEEP_LABELS)
+        st.dataframe(show, width='stretch', height=320, hide_index=True)
+
+        axes = [k for k in grid if len(grid[k]) > 1]
+        if len(axes) >= 2:
+            import plotly.express as px
+            h1, h2, h3 = st.columns(3)
+            x = h1.selectbox('横轴', axes, index=0, format_func=_SWEEP_LABELS.get, key=key('whatif','hx'))
+            y = h2.selectbox('纵轴', [a for a in axes if a != x], index=0, format_func=_SWEEP_LABELS.get, key=key('whatif','hy'))
+            metric = h3.selectbox('指标', ['target_kcal', 'carb_g', 'protein_g', 'deficit', 'ea'], key=key('whatif','hm'))
+            pv = res.pivot_table(index=y, columns=x, values=metric, aggfunc='mean')
+            fig = px.imshow(pv, text_auto=True, aspect='auto', labels=dict(x=_SWEEP_LABELS[x], y=_SWEEP_LABELS[y], color=metric))
+            st.plotly_chart(fig, width='stretch', key=key('whatif','heat'))
+            st.caption('其余参数取各组合的平均值。')
@@ -3,141 +3,113 @@ from __future__ import annotations
 import streamlit as st
 from .keys import key
 import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from ..data.db import df_from_sql, intake_aggregate_by_day, volume_last_n_days
-from ..services.planner import weekly_loss_from_df
-from ..domain.calcs import ffm_from_bf
-from ..settings import EA_MIN_DEFAULT, EA_PREF_DEFAULT
-
-def _ts(df, xcol, ycols, title, yaxis_title):
-    fig = go.Figure()
-    for y in ycols:
-        if y in df.columns:
-            fig.add_trace(go.Scatter(x=pd.to_datetime(df[xcol]), y=df[y], name=y, mode='lines'))
-    fig.update_layout(title=title, hovermode='x unified', legend_orientation='h', margin=dict(l=10,r=10,t=40,b=10))
-    fig.update_xaxes(rangeslider_visible=True)
-    fig.update_yaxes(title_text=yaxis_title)
-    return fig
+from ..services.analytics import load_report_data, report_series
+from .charts import ts_figure, add_line, add_band, layout, scatter_cls, in_window
+from ..settings import EA_MIN_DEFAULT, EA_PREF_DEFAULT, TREND_MIN_WEIGHINS, TDEE_WINDOW_DAYS, TDEE_MIN_LOGGED_DAYS
 
 def render_tab_report(side: dict) -> None:
+    # plotly 只在报告页按需导入，其它页面与冷启动不承担其导入开销
+    import plotly.graph_objects as go
+    import plotly.express as px
 
     st.subheader('历史趋势（支持缩放/悬停/导出）', anchor=False)
-    st.caption('图表可拖动缩放、框选区域、悬停查看数值，并可从右上角菜单导出图像。')
+    st.caption('用下方日期范围放大：曲线在服务端按点数预算降采样，范围越窄越接近全分辨率。悬停查看数值，可从右上角菜单导出图像。')
 
-    dm = df_from_sql('SELECT * FROM daily_metrics ORDER BY date ASC')
-    dt = df_from_sql('SELECT * FROM daily_targets ORDER BY date ASC')
+    # 所有序列由 analytics 一次算好（基于完整历史），本页只按日期范围截取并画图
+    rep = report_series(load_report_data(), float(side['weight_kg']), side['body_fat_pct'])
 
-    if len(dm)==0 and len(dt)==0:
+    if len(rep['metrics'])==0 and len(rep['targets'])==0:
         st.info('暂无历史数据。先在“今日计划”或“手动录入”保存一些记录吧。')
         return
 
+    dates = pd.concat([rep['metrics']['date'], rep['targets']['date']])
+    d_lo, d_hi = dates.min().date(), dates.max().date()
+    window = None
+    if d_hi > d_lo:
+        lo, hi = st.slider('日期范围', min_value=d_lo, max_value=d_hi, value=(d_lo, d_hi), key=key('report','window'))
+        window = (pd.Timestamp(lo), pd.Timestamp(hi))
+    dm, dt = in_window(rep['metrics'], window), in_window(rep['targets'], window)
+
     if len(dm)>0:
         st.markdown('**体重/睡眠/负荷**')
-        cols = ['weight','sleep_h','load_index']
-        fig1 = _ts(dm, 'date', [c for c in cols if c in dm], '体重/睡眠/负荷', '值')
+        fig1 = ts_figure(dm, 'date', ['weight','sleep_h','load_index'], '体重/睡眠/负荷', '值')
         st.plotly_chart(fig1, width='stretch')
 
     if len(dt)>0:
         st.markdown('**TDEE 与目标热量**')
-        cols2 = ['tdee_used','target_kcal']
-        fig2 = _ts(dt, 'date', [c for c in cols2 if c in dt], 'TDEE & 目标热量', 'kcal')
+        fig2 = ts_figure(dt, 'date', ['tdee_used','target_kcal'], 'TDEE & 目标热量', 'kcal')
         st.plotly_chart(fig2, width='stretch')
 
+    st.subheader('TDEE：公式 vs 观测', help=f'观测 TDEE = 近 {TDEE_WINDOW_DAYS} 天日均摄入 − 体重趋势斜率 × 7700；自适应 TDEE = 公式 TDEE × 校正系数（随有效观测天数逐步生效）。')
+    te = rep['tdee']
+    if len(te) > 0 and te['observed_tdee'].notna().any():
+        tw = in_window(te, window)
+        fig_t = go.Figure(); S = scatter_cls(len(tw))
+        add_line(fig_t, tw, 'date', 'formula_tdee', f'公式 TDEE（{TDEE_WINDOW_DAYS}天均值）', cls=S)
+        add_line(fig_t, tw, 'date', 'observed_tdee', '观测 TDEE', cls=S, line=dict(dash='dot'))
+        add_line(fig_t, tw, 'date', 'adaptive_tdee', '自适应 TDEE', cls=S)
+        st.plotly_chart(layout(fig_t, 'TDEE：公式 vs 观测', 'kcal'), width='stretch')
+        last = te.iloc[-1]
+        day = last['date'].date().isoformat()
+        st.caption(f"截至 {day}：校正系数 {last['factor']:.3f}（观测/公式 {last['ratio']:.3f}，窗口内记录摄入 {int(last['logged_days'])} 天）"
+                   if pd.notna(last['ratio']) else f"截至 {day}：校正系数 {last['factor']:.3f}（最近窗口数据不足）")
+    else:
+        st.caption(f'需要记录摄入（{TDEE_WINDOW_DAYS} 天内≥{TDEE_MIN_LOGGED_DAYS} 天）、称重与当日计划后才能估计观测 TDEE。')
+
     st.write('---')
-    st.subheader('%BW/week 轨道图', help='后7 vs 前7 的滚动周降幅，建议落在 0.5–1.0%/周之间。')
-    if len(dm)>7 and 'weight' in dm:
-        dfw = dm[['date','weight']].dropna().copy()
-        dfw['date'] = pd.to_datetime(dfw['date']).sort_values()
-        dfw = dfw.sort_values('date')
-        x, y = [], []
-        for i in range(13, len(dfw)):
-            prev7 = dfw['weight'].iloc[i-13:i-6].mean()
-            last7 = dfw['weight'].iloc[i-6:i+1].mean()
-            loss_kg = max(0.0, prev7 - last7)
-            current_w = dfw['weight'].iloc[i]
-            x.append(dfw['date'].iloc[i]); y.append((loss_kg/max(1e-6,current_w))*100.0)
-        if y:
-            fig3 = go.Figure()
-            fig3.add_trace(go.Scatter(x=x, y=y, mode='lines', name='%BW/week'))
-            fig3.add_hline(y=0.5, line_dash='dash'); fig3.add_hline(y=1.0, line_dash='dash')
-            fig3.update_layout(title='每周下降速度（%体重/周）', hovermode='x unified', legend_orientation='h', margin=dict(l=10,r=10,t=40,b=10))
-            fig3.update_xaxes(rangeslider_visible=True); fig3.update_yaxes(title_text='%BW/week')
-            st.plotly_chart(fig3, width='stretch')
-        else:
-            st.caption('数据不足，无法绘制。')
+    st.subheader('%BW/week 轨道图', help='体重趋势滤波（局部线性趋势 Kalman）估计的每周降幅及 95% 区间，建议落在 0.5–1.0%/周之间。')
+    wt = rep['weight_trend']
+    if wt is not None:
+        tr, wd = in_window(wt['trend'], window), in_window(wt['weighins'], window)
+        fig_w = go.Figure(); S = scatter_cls(len(tr))
+        add_band(fig_w, tr, 'date', 'level', 'level_lo', 'level_hi', '95% 区间', cls=S)
+        add_line(fig_w, tr, 'date', 'level', '趋势体重', cls=S)
+        add_line(fig_w, wd, 'date', 'weight', '称重', cls=S, mode='markers', marker=dict(size=4))
+        st.plotly_chart(layout(fig_w, '体重趋势（滤波）', 'kg'), width='stretch')
+
+        ok = tr[tr['ok']]
+        fig3 = go.Figure(); S = scatter_cls(len(ok))
+        add_band(fig3, ok, 'date', 'pct', 'pct_lo', 'pct_hi', '95% 区间', cls=S)
+        add_line(fig3, ok, 'date', 'pct', '%BW/week', cls=S)
+        fig3.add_hline(y=0.5, line_dash='dash'); fig3.add_hline(y=1.0, line_dash='dash')
+        st.plotly_chart(layout(fig3, '每周下降速度（%体重/周）', '%BW/week'), width='stretch')
+        tr = wt['trend']
+        cur = tr.iloc[-1]
+        st.caption(f"当前：{cur['pct']:.2f} ± {cur['pct_hi'] - cur['pct']:.2f} %/周（趋势体重 {cur['level']:.1f} kg）")
     else:
-        st.caption('数据不足，无法计算 %BW/week。')
+        st.caption(f'称重少于 {TREND_MIN_WEIGHINS} 次，无法计算 %BW/week。')
 
     st.write('---')
     st.subheader('EA（日值与7天均值）', help='EA=(摄入-运动)/FFM；展示 7 天滚动均值和阈值线。')
-    ia = intake_aggregate_by_day()
-    if len(ia)>0 and len(dm)>0:
-        df_ea = pd.merge(dm[['date','weight','load_index']], ia, on='date', how='left')
-        df_ea['kcal'] = pd.to_numeric(df_ea['kcal'], errors='coerce')
-        df_ea['weight'] = pd.to_numeric(df_ea['weight'], errors='coerce')
-        df_ea['load_index'] = pd.to_numeric(df_ea['load_index'], errors='coerce')
-        df_ea = df_ea.fillna({'kcal':0.0}).copy()
-
-        def est_ea_row(r):
-            w = float(r.get('weight') or 0.0)
-            bf = float(side['body_fat_pct']) if side['body_fat_pct'] is not None else 24.0
-            ffm = ffm_from_bf(w if w>0 else float(side['weight_kg']), bf)
-            ex = 3.5 * (w if w>0 else float(side['weight_kg'])) * float(r.get('load_index') or 0.0) / 200.0
-            return (float(r.get('kcal') or 0.0) - ex) / max(ffm,1e-6)
-
-        df_ea['EA'] = df_ea.apply(est_ea_row, axis=1)
-        df_ea['EA_7d'] = df_ea['EA'].rolling(window=7, min_periods=1).mean()
-
-        fig4 = go.Figure()
-        fig4.add_trace(go.Scatter(x=pd.to_datetime(df_ea['date']), y=df_ea['EA'], name='EA 日值', mode='lines'))
-        fig4.add_trace(go.Scatter(x=pd.to_datetime(df_ea['date']), y=df_ea['EA_7d'], name='EA 7天均值', mode='lines'))
+    df_ea = in_window(rep['ea'], window)
+    if len(df_ea)>0:
+        fig4 = go.Figure(); S = scatter_cls(len(df_ea))
+        add_line(fig4, df_ea, 'date', 'EA', 'EA 日值', cls=S)
+        add_line(fig4, df_ea, 'date', 'EA_7d', 'EA 7天均值', cls=S)
         fig4.add_hline(y=float(side.get('ea_min', EA_MIN_DEFAULT)), line_dash='dash')
         fig4.add_hline(y=float(side.get('ea_pref', EA_PREF_DEFAULT)), line_dash='dot')
-        fig4.update_layout(title='能量可用性', hovermode='x unified', legend_orientation='h', margin=dict(l=10,r=10,t=40,b=10))
-        fig4.update_xaxes(rangeslider_visible=True); fig4.update_yaxes(title_text='EA (kcal/kg FFM)')
-        st.plotly_chart(fig4, width='stretch')
+        st.plotly_chart(layout(fig4, '能量可用性', 'EA (kcal/kg FFM)'), width='stretch')
     else:
         st.caption('EA 图缺少摄入或指标数据。')
 
     st.write('---')
     st.subheader('蛋白达成率（摄入/目标）', help='每日摄入蛋白 / 当日目标蛋白。')
-    if len(dt)>0:
-        protein_target = dt[['date','protein_g']].copy()
-        protein_target['protein_g'] = pd.to_numeric(protein_target['protein_g'], errors='coerce')
-
-        ia2 = intake_aggregate_by_day()[['date','protein_g']].rename(columns={'protein_g':'protein_intake'})
-        ia2['protein_intake'] = pd.to_numeric(ia2['protein_intake'], errors='coerce')
-
-        dfp = pd.merge(protein_target, ia2, on='date', how='left')
-        dfp['protein_intake'] = dfp['protein_intake'].fillna(0.0)
-
-        dfp['rate'] = (dfp['protein_intake'] / dfp['protein_g']).clip(upper=2.0) * 100.0
+    dfp = in_window(rep['protein'], window)
+    if len(dfp)>0:
         fig5 = go.Figure()
-        fig5.add_trace(go.Scatter(x=pd.to_datetime(dfp['date']), y=dfp['rate'], mode='lines', name='蛋白达成率(%)'))
+        add_line(fig5, dfp, 'date', 'rate', '蛋白达成率(%)')
         fig5.add_hline(y=100.0, line_dash='dash')
-        fig5.update_layout(title='蛋白达成率', hovermode='x unified', legend_orientation='h', margin=dict(l=10,r=10,t=40,b=10))
-        fig5.update_xaxes(rangeslider_visible=True); fig5.update_yaxes(title_text='%', range=[0, 200])
-        st.plotly_chart(fig5, width='stretch')
+        st.plotly_chart(layout(fig5, '蛋白达成率', '%', range=[0, 200]), width='stretch')
     else:
         st.caption('尚无目标，无法计算蛋白达成率。')
 
     st.write('---')
     st.subheader('近7天每肌群组数', help='用于监控训练量是否处于合理区间（10–20 组/周/肌群）。')
-    vol = volume_last_n_days(7)
-    if len(vol)>0:
-        dfv = vol.groupby('muscle_group', as_index=False)['sets'].sum()
-        fig6 = px.bar(dfv, x='muscle_group', y='sets', title='7天总组数', labels={'muscle_group':'肌群','sets':'组数'})
+    vol = rep['volume']
+    if len(vol['sets'])>0:
+        fig6 = px.bar(vol['sets'], x='muscle_group', y='sets', title='7天总组数', labels={'muscle_group':'肌群','sets':'组数'})
         st.plotly_chart(fig6, width='stretch')
-        tips = []
-        for _, r in dfv.iterrows():
-            if r['sets'] < 10:
-                tips.append(f"{r['muscle_group']} < 10 组/周：考虑增加。")
-            elif r['sets'] > 20:
-                tips.append(f"{r['muscle_group']} > 20 组/周：若疲劳高/睡眠差，考虑降量一周。")
-        if tips:
-            st.info('；'.join(tips))
+        if vol['tips']:
+            st.info('；'.join(vol['tips']))
     else:
         st.caption('尚无训练量记录。')
-
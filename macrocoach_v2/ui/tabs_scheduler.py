@@ -2,17 +2,28 @@
 from __future__ import annotations
 from datetime import date, timedelta
 import streamlit as st
-from ..services.schedule import schedule
-from ..domain.models import UserProfile
+from ..services.schedule import schedule, MAX_SCHEDULE_DAYS
+from ..services.backfill import replay_targets, diff_targets, write_targets
+from ..services.simulate import SimConfig, sweep_pid
+from ..domain.models import UserProfile, PIDConfig
 from ..data.db import df_from_sql
 from .keys import key
 
 def render_tab_scheduler(side: dict) -> None:
 
     st.subheader('📆 饮食周期化调度器（预生成未来 N 天）', anchor=False)
-    mode = st.selectbox('模式', ['continuous','5+2','matador_2+2'], index=1, key=key('sched','mode'), help='连续缺口/每周5缺口+2维持/MATADOR 2缺口+2维持。')
-    days = st.number_input('生成天数', 7, 56, 14, 1, key=key('sched','days'), help='建议 14 天为一轮。')
+    mode = st.selectbox('模式', ['continuous','5+2','matador_2+2','custom'], index=1, key=key('sched','mode'), help='连续缺口/每周5缺口+2维持/MATADOR 2周缺口+2周维持/自定义循环。')
+    cycle = None
+    if mode == 'custom':
+        cc1, cc2 = st.columns(2)
+        cycle = (int(cc1.number_input('每轮缺口天数', 1, 60, 10, 1, key=key('sched','cyc_on'))),
+                 int(cc2.number_input('每轮维持天数', 0, 60, 4, 1, key=key('sched','cyc_off'))))
+    days = st.number_input('生成天数', 7, MAX_SCHEDULE_DAYS, 28, 1, key=key('sched','days'), help='最长一年；建议 14–28 天为一轮。')
     start = st.date_input('开始日期', value=date.today(), key=key('sched','start'), help='从哪天开始生成。')
+    cb1, cb2, cb3 = st.columns(3)
+    brk_every = int(cb1.number_input('Diet break：每隔(天)', 0, 180, 0, 7, key=key('sched','brk_every'), help='0=不插入。例如 84 = 每 12 周后插入一次维持期。'))
+    brk_len = int(cb2.number_input('Diet break：维持(天)', 0, 28, 7, 1, key=key('sched','brk_len')))
+    overwrite = cb3.checkbox('覆盖已计算的日目标', value=False, key=key('sched','overwrite'), help='默认保留“今日计划”/回算已写入的日期，只填充其余日期。')
     st.caption('说明：按当前侧栏参数生成“日目标”（不含运动）。当天进入“今日计划”会用当日负荷/睡眠覆盖为更精准的值。')
     if st.button('生成未来计划并写入数据库', type='primary', key=key('sched','run'), help='写入 daily_targets（day_type 会标注缺口/维持）。'):
         profile = UserProfile(
@@ -27,11 +38,84 @@ def render_tab_scheduler(side: dict) -> None:
         else:
             protein_g = float(side['protein_per_kg_bw']) * float(side['weight_kg'])
         fat_g = float(side['fat_per_kg_bw']) * float(side['weight_kg'])
-        out = schedule(profile, start, int(days), str(mode), float(side['deficit']), float(side['baseline_pal']), float(protein_g), float(fat_g))
-        st.success(f'已写入 {len(out)} 天。下方显示预览。切到“📈 报告与曲线”可查看全局。')
+        out = schedule(profile, start, int(days), str(mode), float(side['deficit']), float(side['baseline_pal']), float(protein_g), float(fat_g),
+                       cycle=cycle, diet_break=(brk_every, brk_len), overwrite_computed=bool(overwrite))
+        n_skip = sum(r['skipped'] for r in out)
+        st.success(f'已写入 {len(out) - n_skip} 天' + (f'，保留已计算的 {n_skip} 天' if n_skip else '') + '。下方显示预览。切到“📈 报告与曲线”可查看全局。')
         # 预览区间
         end = start + timedelta(days=int(days)-1)
-        dfp = df_from_sql('SELECT date, target_kcal, protein_g, fat_g, carb_g, day_type FROM daily_targets WHERE date>=? AND date<=? ORDER BY date ASC', (start.isoformat(), end.isoformat()))
+        dfp = df_from_sql('SELECT date, target_kcal, protein_g, fat_g, carb_g, day_type, source FROM daily_targets WHERE date>=? AND date<=? ORDER BY date ASC', (start.isoformat(), end.isoformat()))
         if len(dfp)>0:
             st.dataframe(dfp, width='stretch', height=320)
 
+
+    st.write('---')
+    st.subheader('🔁 历史回算（按当前参数重算 daily_targets）', anchor=False)
+    st.caption('修改常量或侧栏参数后，按日期顺序重放“今日计划”：每天只使用当天之前的历史；运动按当日负荷还原。先预览差异，再批量写入。')
+    c1, c2 = st.columns(2)
+    bf_start = c1.date_input('回算开始', value=date.today() - timedelta(days=90), key=key('backfill','start'))
+    bf_end = c2.date_input('回算结束', value=date.today(), key=key('backfill','end'))
+    bf_apply = st.checkbox('回算时应用智能建议（加碳）', value=False, key=key('backfill','apply'), help='与“今日计划”中的一键应用建议相同。')
+    b1, b2 = st.columns(2)
+    preview = b1.button('预览差异（不写入）', key=key('backfill','dry'))
+    commit = b2.button('回算并写入', type='primary', key=key('backfill','run'))
+    if preview or commit:
+        profile = UserProfile(
+            sex=str(side['sex']), age=int(side['age']), height_cm=float(side['height_cm']), weight_kg=float(side['weight_kg']),
+            body_fat_pct=float(side['body_fat_pct']) if side['body_fat_pct'] is not None else None, baseline_pal=float(side['baseline_pal']),
+            protein_g_per_kg_bw=float(side['protein_per_kg_bw']), fat_g_per_kg_bw=float(side['fat_per_kg_bw']),
+            deficit=float(side['deficit']), min_deficit=float(side['min_def']), max_deficit=float(side['max_def']),
+            carb_periodization=True,
+        )
+        new = replay_targets(
+            profile, bf_start, bf_end, float(side['loss_rate_pct']), bool(side['auto_mode']),
+            PIDConfig(Kp=float(side['Kp']), Ki=float(side['Ki']), Kd=float(side['Kd']), integral_cap=float(side['Icap'])),
+            apply_suggestions=bool(bf_apply),
+            protein_basis='FFM' if side['protein_basis']=='按FFM' else 'BW',
+            protein_per_kg_ffm=float(side['protein_per_kg_ffm']),
+            ea_min=float(side['ea_min']), ea_pref=float(side['ea_pref']),
+            training_day_carb_bump_g_per_kg=float(side['training_bump']),
+            training_load_threshold=float(side['training_threshold']),
+            adaptive_tdee=side['tdee_source']=='自适应',
+        )
+        diff = diff_targets(new)
+        if len(new) == 0:
+            st.info('区间内没有日指标记录，无可回算的日期。')
+        elif commit:
+            n = write_targets(new)
+            st.success(f'已回算并写入 {n} 天（其中 {len(diff)} 天有变化）。')
+        else:
+            st.write(f'共 {len(new)} 天，{len(diff)} 天的目标会变化：')
+            if len(diff)>0:
+                st.dataframe(diff, width='stretch', height=320)
+
+    st.write('---')
+    with st.expander('🧪 PID 闭环模拟（增益网格扫描）'):
+        st.caption('用合成体重响应（能量平衡 + 水分波动 + 称重噪声）跑“计划→摄入→体重”闭环，比较不同增益的收敛时间、超调与赤字波动。不写数据库。')
+        c1, c2, c3, c4 = st.columns(4)
+        kp_s = c1.text_input('Kp 取值', '0.1,0.2,0.35,0.5', key=key('sim','kp'))
+        ki_s = c2.text_input('Ki 取值', '0,0.02,0.05,0.1', key=key('sim','ki'))
+        kd_s = c3.text_input('Kd 取值', '0,0.05', key=key('sim','kd'))
+        cap_s = c4.text_input('积分上限取值', '0.1,0.15,0.2', key=key('sim','cap'))
+        c5, c6, c7 = st.columns(3)
+        sim_days = c5.number_input('模拟天数', 28, 365, 112, 7, key=key('sim','days'))
+        bias = c6.slider('真实 TDEE / 公式', 0.8, 1.2, 0.95, 0.01, key=key('sim','bias'), help='<1 表示公式高估消耗。')
+        persistent = c7.checkbox('PID 跨天累积', value=True, key=key('sim','persist'), help='关闭时与当前线上行为一致：每天新建 PID。')
+        if st.button('运行模拟', key=key('sim','run')):
+            try:
+                grid = [[float(x) for x in v.split(',') if x.strip()] for v in (kp_s, ki_s, kd_s, cap_s)]
+            except ValueError:
+                st.error('增益取值需为逗号分隔的数字。')
+            else:
+                profile = UserProfile(
+                    sex=str(side['sex']), age=int(side['age']), height_cm=float(side['height_cm']), weight_kg=float(side['weight_kg']),
+                    body_fat_pct=float(side['body_fat_pct']) if side['body_fat_pct'] is not None else None, baseline_pal=float(side['baseline_pal']),
+                    protein_g_per_kg_bw=float(side['protein_per_kg_bw']), fat_g_per_kg_bw=float(side['fat_per_kg_bw']),
+                    deficit=float(side['deficit']), min_deficit=float(side['min_def']), max_deficit=float(side['max_def']),
+                    carb_periodization=True,
+                )
+                cfg = SimConfig(profile, days=int(sim_days), loss_rate_pct=float(side['loss_rate_pct']), steps=int(side['steps']),
+                                tdee_bias=float(bias), persistent_pid=bool(persistent))
+                with st.spinner(f'模拟 {len(grid[0])*len(grid[1])*len(grid[2])*len(grid[3])} 组增益…'):
+                    res = sweep_pid(cfg, *grid)
+                st.dataframe(res.round(3), width='stretch', height=360)
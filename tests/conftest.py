@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+import uuid
+import pytest
+
+# 设置必须在导入 macrocoach_v2 之前：所有库文件、备份、归档都放进一次性的临时目录
+_ROOT = tempfile.mkdtemp(prefix='macrocoach-tests-')
+os.environ['MACRO_COACH_DB_PATH'] = os.path.join(_ROOT, 'default.db')
+os.environ['MACRO_COACH_ATHLETES_DIR'] = os.path.join(_ROOT, 'athletes')
+os.environ['MACRO_COACH_BACKUP_INTERVAL_MIN'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def athlete():
+    # 每个用例一个新运动员（独立的库文件），用例内的 data 层读写都指向它
+    from macrocoach_v2.data.athletes import create_athlete, use_athlete
+    from macrocoach_v2.data.db import init_db
+    name = f't{uuid.uuid4().hex[:10]}'
+    create_athlete(name)
+    with use_athlete(name):
+        init_db()
+        yield name
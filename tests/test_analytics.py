@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+from macrocoach_v2.services.analytics import _num, energy_availability, protein_adherence, report_series
+
+def _metrics(rows):
+    return _num(pd.DataFrame(rows, columns=['date', 'weight', 'sleep_h', 'load_index']), ['weight', 'sleep_h', 'load_index'])
+
+def _intake(rows):
+    return _num(pd.DataFrame(rows, columns=['date', 'kcal', 'protein_g']), ['kcal', 'protein_g'])
+
+def _targets(rows):
+    return _num(pd.DataFrame(rows, columns=['date', 'protein_g']), ['protein_g'])
+
+def test_ea_uses_sidebar_weight_when_weigh_in_missing():
+    m = _metrics([('2026-03-01', 80.0, 7.0, 0.0), ('2026-03-02', None, 7.0, 0.0), ('2026-03-03', 0.0, 7.0, 0.0)])
+    ea = energy_availability(m, _intake([('2026-03-01', 2400.0, 150.0), ('2026-03-02', 2400.0, 150.0),
+                                         ('2026-03-03', 2400.0, 150.0)]), 60.0, 20.0)
+    assert ea['EA'].tolist() == pytest.approx([2400 / 64.0, 2400 / 48.0, 2400 / 48.0])
+
+def test_ea_nan_load_counts_as_no_exercise():
+    m = _metrics([('2026-03-01', 80.0, 7.0, 1000.0), ('2026-03-02', 80.0, 7.0, None)])
+    ea = energy_availability(m, _intake([('2026-03-01', 2400.0, 150.0), ('2026-03-02', 2400.0, 150.0)]), 80.0, None)
+    ffm = 80.0 * 0.76
+    assert ea['EA'].tolist() == pytest.approx([(2400 - 3.5 * 80 * 1000 / 200) / ffm, 2400 / ffm])
+    assert not ea['EA_7d'].isna().any()
+
+def test_ea_days_without_intake_count_as_zero_and_rolling_mean():
+    m = _metrics([(f'2026-03-{d:02d}', 70.0, 7.0, 0.0) for d in range(1, 10)])
+    ea = energy_availability(m, _intake([('2026-03-01', 2100.0, 140.0)]), 70.0, 0.0)
+    assert ea['EA'].tolist() == pytest.approx([30.0] + [0.0] * 8)
+    assert ea['EA_7d'].tolist() == pytest.approx([30.0, 15.0, 10.0, 7.5, 6.0, 5.0, 30 / 7, 0.0, 0.0])
+
+def test_ea_empty_inputs():
+    m = _metrics([('2026-03-01', 70.0, 7.0, 0.0)])
+    for metrics, intake in ((m, _intake([])), (_metrics([]), _intake([('2026-03-01', 2000.0, 100.0)]))):
+        ea = energy_availability(metrics, intake, 70.0, None)
+        assert len(ea) == 0 and list(ea.columns) == ['date', 'EA', 'EA_7d']
+
+def test_protein_adherence_rates():
+    t = _targets([('2026-03-01', 150.0), ('2026-03-02', 150.0), ('2026-03-03', 100.0)])
+    p = protein_adherence(t, _intake([('2026-03-01', 2000.0, 120.0), ('2026-03-03', 2000.0, 250.0), ('2026-03-04', 2000.0, 90.0)]))
+    # 缺摄入的日子为 0；超过 200% 封顶；没有目标的日期不出现
+    assert p['rate'].tolist() == pytest.approx([80.0, 0.0, 200.0])
+    assert p['date'].tolist() == list(pd.to_datetime(['2026-03-01', '2026-03-02', '2026-03-03']))
+
+def test_protein_adherence_empty_inputs():
+    t = _targets([('2026-03-01', 150.0), ('2026-03-02', 150.0)])
+    assert protein_adherence(t, _intake([]))['rate'].tolist() == [0.0, 0.0]
+    assert len(protein_adherence(_targets([]), _intake([('2026-03-01', 2000.0, 120.0)]))) == 0
+
+def test_report_series_parses_string_columns():
+    # 读库得到的是字符串日期与可能混入的文本/None：report_series 统一解析后再计算
+    data = {
+        'metrics': pd.DataFrame({'date': ['2026-03-01', '2026-03-02'], 'weight': [80.0, None], 'sleep_h': [7.0, 7.0],
+                                 'load_index': ['500', None]}),
+        'targets': pd.DataFrame({'date': ['2026-03-01'], 'tdee_used': [2500.0], 'target_kcal': [2000.0], 'protein_g': [160.0]}),
+        'intake': pd.DataFrame({'date': ['2026-03-02'], 'kcal': [1900.0], 'protein_g': [170.0]}),
+        'volume': pd.DataFrame(columns=['muscle_group', 'sets']),
+        'tdee': pd.DataFrame(),
+    }
+    rep = report_series(data, 75.0, 25.0)
+    assert rep['weight_trend'] is None
+    assert rep['ea']['EA'].tolist() == pytest.approx([-3.5 * 80 * 500 / 200 / 60.0, 1900 / 56.25])
+    assert rep['protein']['rate'].tolist() == [0.0]
+    assert np.issubdtype(rep['ea']['date'].dtype, np.datetime64)
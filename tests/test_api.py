@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+from macrocoach_v2.api import ApiServer, _MAX_BODY
+
+def _exchange(head: bytes, body: bytes = b''):
+    # 起一个只监听本机随机端口的服务，发一条原始请求，返回 (状态码, JSON, 连接是否被关闭)
+    async def run():
+        api = ApiServer(workers=2, batch_ms=0)
+        server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(head + body)
+            await writer.drain()
+            lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            n = next(int(l.partition(':')[2]) for l in lines if l.lower().startswith('content-length'))
+            payload = json.loads(await reader.readexactly(n))
+            try:
+                closed = await asyncio.wait_for(reader.read(1), 0.5) == b''
+            except asyncio.TimeoutError:
+                closed = False
+            writer.close()
+            await writer.wait_closed()
+            return int(lines[0].split(' ')[1]), payload, closed
+        finally:
+            server.close()
+            await server.wait_closed()
+            api.queue.close()
+            api.pool.shutdown(wait=True)
+    return asyncio.run(run())
+
+def _post(path: str, length: str, body: bytes = b''):
+    return _exchange(f'POST {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n'.encode('latin-1'), body)
+
+def test_content_length_not_a_number(athlete):
+    status, payload, closed = _post(f'/plan?athlete={athlete}', 'abc')
+    assert status == 400 and 'error' in payload and closed
+
+def test_content_length_negative(athlete):
+    status, payload, closed = _post(f'/plan?athlete={athlete}', '-5')
+    assert status == 400 and 'error' in payload and closed
+
+def test_content_length_over_cap(athlete):
+    status, payload, closed = _post(f'/plan?athlete={athlete}', str(_MAX_BODY + 1))
+    assert status == 413 and 'error' in payload and closed
+
+def _post_json(path: str, obj):
+    data = json.dumps(obj).encode('utf-8')
+    return _post(path, str(len(data)), data)
+
+def test_plan_rejects_malformed_activities(athlete):
+    for acts in ({'name': 'cardio'}, ['cardio'], [None], [{'name': 'cardio', 'minutes': 30, 'intensity': 'high'}, 3]):
+        status, payload, _ = _post_json(f'/plan?athlete={athlete}', {'activities': acts})
+        assert status == 400 and 'activities' in payload['error']
+    status, payload, _ = _post_json(f'/plan?athlete={athlete}', {'profile': [1, 2]})
+    assert status == 400 and 'profile' in payload['error']
+
+def test_plan_accepts_activity_list(athlete):
+    status, payload, _ = _post_json(f'/plan?athlete={athlete}', {'activities': [{'name': 'cardio', 'minutes': 30, 'intensity': 'high'}]})
+    assert status == 200 and payload['target_kcal'] > 0
+
+def test_unknown_athlete_is_404_and_not_created():
+    from macrocoach_v2.data.athletes import list_athletes
+    before = list_athletes()
+    status, payload, _ = _exchange(b'GET /intake/sums?athlete=nobody-here HTTP/1.1\r\nHost: x\r\n\r\n')
+    assert status == 404 and 'nobody-here' in payload['error']
+    assert list_athletes() == before
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import io
+import zipfile
+from datetime import date
+import pandas as pd
+import pytest
+from macrocoach_v2.data import archive
+from macrocoach_v2.data.archive import archive_older_than, iter_archive, read_history
+from macrocoach_v2.data.athletes import archive_dir
+from macrocoach_v2.data.db import upsert_metrics
+from macrocoach_v2.data.export import export_bundle
+
+pytest.importorskip('pyarrow')
+
+_ROW = {'steps': 8000, 'exercise_min': 0.0, 'sleep_h': 7.0, 'fatigue': 3, 'perf_pct': 0.0,
+        'avg_hr': None, 'max_hr': None, 'load_index': 0.0}
+
+def _seed():
+    for d in range(1, 11):
+        upsert_metrics(f'2025-01-{d:02d}', {**_ROW, 'weight': 80.0})
+    assert archive_older_than(30, today=date(2025, 2, 15))['daily_metrics'] == 10
+    # 归档后再改写一个已归档的日期：热表里的新值应覆盖冷存储里的旧值
+    upsert_metrics('2025-01-05', {**_ROW, 'weight': 79.0})
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_prefers_hot_rows_over_archived(athlete, fmt):
+    _seed()
+    with zipfile.ZipFile(export_bundle(fmt)) as zf:
+        raw = io.BytesIO(zf.read(f'daily_metrics.{fmt}'))
+    df = pd.read_csv(raw) if fmt == 'csv' else pd.read_parquet(raw)
+    hist = read_history('daily_metrics')
+    assert len(df) == len(hist) == 10
+    assert df.set_index('date')['weight'].to_dict() == hist.set_index('date')['weight'].to_dict()
+    assert df.loc[df['date'] == '2025-01-05', 'weight'].tolist() == [79.0]
+
+def test_failed_archive_leaves_no_partitions(athlete, monkeypatch):
+    import glob, os
+    for d in range(1, 11):
+        upsert_metrics(f'2025-01-{d:02d}', {**_ROW, 'weight': 80.0})
+    def boom(conn, table):
+        raise RuntimeError('boom')
+    # 分区已写出之后、提交之前失败
+    monkeypatch.setattr(archive, 'archive_watermark', boom)
+    with pytest.raises(RuntimeError):
+        archive_older_than(30, today=date(2025, 2, 15))
+    assert glob.glob(os.path.join(archive_dir(), '**', '*.parquet*'), recursive=True) == []
+    assert len(read_history('daily_metrics')) == 10
+    monkeypatch.undo()
+    # 重跑：每行只归档一次
+    assert archive_older_than(30, today=date(2025, 2, 15))['daily_metrics'] == 10
+    assert sum(len(c) for c in iter_archive('daily_metrics')) == 10
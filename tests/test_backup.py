@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from macrocoach_v2.data import backup
+from macrocoach_v2.data.db import execute, transaction
+
+def _fill(n: int = 400) -> None:
+    with transaction():
+        for i in range(n):
+            execute('INSERT INTO intake_logs(ts,date,meal_tag,kcal,protein_g,fat_g,carb_g,note) VALUES(?,?,?,?,?,?,?,?)',
+                    (f'2026-03-01T08:{i % 60:02d}:00', '2026-03-01', '早餐', 500.0, 30.0, 10.0, 60.0, 'x' * 200))
+
+def test_backup_pauses_between_every_step(athlete, monkeypatch):
+    _fill()
+    pauses = []
+    monkeypatch.setattr(backup, 'BACKUP_PAGES_PER_STEP', 4)
+    monkeypatch.setattr(backup, 'BACKUP_STEP_SLEEP_MS', 7.0)
+    monkeypatch.setattr(backup.time, 'sleep', pauses.append)
+    status = backup.backup_once(compress='none')
+    assert backup.verify_backup(status['path']) == 'ok'
+    # 每步 4 页：除最后一步外每步之后让步一次
+    assert len(pauses) >= 10 and set(pauses) == {0.007}
+
+def test_restore_keeps_checked_out_connections_valid(athlete):
+    # 恢复时被其它线程借出的写连接：之后的写入必须落在恢复后的库里，而不是已被替换掉的旧文件
+    import threading
+    from macrocoach_v2.data.athletes import use_athlete
+    from macrocoach_v2.data.db import df_from_sql, upsert_metrics, write_conn
+    row = {'weight': 80.0, 'steps': 8000, 'exercise_min': 0.0, 'sleep_h': 7.0, 'fatigue': 3, 'perf_pct': 0.0,
+           'avg_hr': None, 'max_hr': None, 'load_index': 0.0}
+    upsert_metrics('2026-03-01', row)
+    saved = backup.backup_once(compress='gzip')['path']
+    upsert_metrics('2026-03-01', {**row, 'weight': 70.0})
+    assert df_from_sql('SELECT weight FROM daily_metrics')['weight'].tolist() == [70.0]
+
+    ready, go = threading.Event(), threading.Event()
+    def writer():
+        with use_athlete(athlete), write_conn() as conn:
+            ready.set(); go.wait(10)
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("INSERT INTO weekly_volume(date, muscle_group, sets) VALUES('2026-03-02', 'back', 12)")
+            conn.execute('COMMIT')
+    t = threading.Thread(target=writer); t.start()
+    ready.wait(10)
+    assert backup.restore_backup(saved) == 'ok'
+    go.set(); t.join(10)
+
+    assert df_from_sql('SELECT weight FROM daily_metrics')['weight'].tolist() == [80.0]
+    assert df_from_sql('SELECT muscle_group, sets FROM weekly_volume').values.tolist() == [['back', 12]]
+    assert any('-pre-restore' in p for p in backup.list_backups())
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+from dataclasses import fields, replace
+import numpy as np
+import pytest
+from macrocoach_v2.domain.history import loss_obs, sleep_ema, state_from_rows
+from macrocoach_v2.domain.models import ActivityBlock, PIDConfig, UserProfile
+from macrocoach_v2.services.batch_planner import PLAN_COLUMNS, activity_arrays, plan_days, plan_frame_to_dicts
+from macrocoach_v2.services.planner import plan_day
+
+_NAN = float('nan')
+
+def _maybe(rng: random.Random, p: float, v):
+    return None if rng.random() < p else v
+
+def _history(rng: random.Random):
+    # 0–30 天：体重随机缺测（含 NaN），睡眠偶尔缺失；覆盖 <8 个体重、7 对 7 均值、趋势滤波三种情况
+    rows, w = [], rng.uniform(55, 110)
+    for i in range(rng.randint(0, 30)):
+        w -= rng.uniform(-0.3, 0.5)
+        rows.append({'date': f'2026-01-{i + 1:02d}', 'weight': _NAN if rng.random() < 0.35 else round(w, 1),
+                     'sleep_h': None if rng.random() < 0.2 else rng.uniform(4.5, 9.5),
+                     'fatigue': rng.randint(1, 10), 'load_index': rng.uniform(0, 2500), 'perf_pct': rng.uniform(-10, 10)})
+    return state_from_rows(rows)
+
+def _case(rng: random.Random):
+    prof = UserProfile(
+        sex=rng.choice(['male', 'female']), age=rng.randint(16, 70), height_cm=rng.uniform(150, 200),
+        weight_kg=rng.uniform(45, 120), body_fat_pct=_maybe(rng, 0.4, rng.uniform(8, 35)),
+        baseline_pal=rng.uniform(1.2, 1.7), protein_g_per_kg_bw=rng.uniform(1.6, 2.6), fat_g_per_kg_bw=rng.uniform(0.5, 1.0),
+        deficit=rng.uniform(0.05, 0.3), min_deficit=rng.uniform(0.0, 0.12), max_deficit=rng.uniform(0.15, 0.35),
+        carb_periodization=rng.random() < 0.5)
+    acts = [ActivityBlock(rng.choice(['badminton', 'strength', 'cardio']), rng.choice([0, rng.uniform(5, 120)]),
+                          rng.choice(['low', 'moderate', 'high'])) for _ in range(rng.randint(0, 3))]
+    return dict(
+        profile=prof, acts=acts, steps=_maybe(rng, 0.3, rng.randint(0, 25000)), auto_mode=rng.random() < 0.7,
+        target_loss_week_kg=rng.uniform(0, 1.2), pid_cfg=PIDConfig(rng.uniform(0, 0.3), rng.uniform(0, 0.1), rng.uniform(0, 0.1)),
+        fatigue=rng.randint(1, 10), sleep_h=rng.uniform(4, 10), perf_change_pct=rng.uniform(-15, 10),
+        apply_suggestions=rng.random() < 0.5, today_weight=_maybe(rng, 0.4, rng.choice([0.0, rng.uniform(45, 120)])),
+        protein_basis=rng.choice(['FFM', 'BW']), protein_per_kg_ffm=rng.uniform(2.0, 3.0), ea_min=rng.uniform(25, 35),
+        training_day_carb_bump_g_per_kg=rng.choice([0.0, rng.uniform(0.2, 1.5)]), training_load_threshold=rng.uniform(300, 1500),
+        tdee_factor=_maybe(rng, 0.5, rng.uniform(0.85, 1.15)), hist_state=_history(rng))
+
+def _scalar(c):
+    # plan_day 会改写 profile.weight_kg：每次传副本
+    kw = {k: v for k, v in c.items() if k not in ('profile', 'acts', 'steps', 'auto_mode', 'target_loss_week_kg', 'pid_cfg',
+                                                  'fatigue', 'sleep_h', 'perf_change_pct', 'apply_suggestions', 'today_weight')}
+    return plan_day(replace(c['profile']), c['acts'], c['steps'], c['auto_mode'], c['target_loss_week_kg'], c['pid_cfg'],
+                    c['fatigue'], c['sleep_h'], c['perf_change_pct'], c['apply_suggestions'], None, c['today_weight'], **kw)
+
+def _batch(cases):
+    # 所有用例（含资料、PID 参数）按列堆成一次 plan_days 调用
+    col = lambda k, f=lambda v: v: np.array([f(c[k]) for c in cases])
+    nan = lambda v: _NAN if v is None else v
+    prof = UserProfile(**{f.name: np.array([nan(getattr(c['profile'], f.name)) for c in cases]) for f in fields(UserProfile)})
+    pid = PIDConfig(*[np.array([getattr(c['pid_cfg'], f.name) for c in cases]) for f in fields(PIDConfig)])
+    minutes, mets = activity_arrays([c['acts'] for c in cases])
+    return plan_frame_to_dicts(plan_days(
+        prof, minutes, mets, col('steps', nan), col('auto_mode'), col('target_loss_week_kg'), pid,
+        col('fatigue'), col('sleep_h'), col('perf_change_pct'), col('apply_suggestions'),
+        col('hist_state', lambda s: nan(loss_obs(s))), col('hist_state', lambda s: nan(sleep_ema(s))), col('today_weight', nan),
+        protein_basis=col('protein_basis'), protein_per_kg_ffm=col('protein_per_kg_ffm'), ea_min=col('ea_min'),
+        training_day_carb_bump_g_per_kg=col('training_day_carb_bump_g_per_kg'),
+        training_load_threshold=col('training_load_threshold'), tdee_factor=col('tdee_factor', nan)))
+
+def _same(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b
+
+@pytest.mark.parametrize('seed', range(5))
+def test_plan_days_matches_plan_day(seed):
+    rng = random.Random(seed)
+    cases = [_case(rng) for _ in range(200)]
+    batch = _batch(cases)
+    keys = [k for k in PLAN_COLUMNS if k != 'weight_kg']
+    for i, c in enumerate(cases):
+        one = _scalar(c)
+        diff = {k: (one[k], batch[i][k]) for k in keys if not _same(one[k], batch[i][k])}
+        assert not diff, f'case {i}: {diff}'
+
+def test_cases_cover_missing_history():
+    # 随机用例确实覆盖了：无趋势（None）、有趋势、无睡眠 EMA、当日无称重
+    rng = random.Random(0)
+    cases = [_case(rng) for _ in range(200)]
+    assert any(loss_obs(c['hist_state']) is None for c in cases) and any(loss_obs(c['hist_state']) is not None for c in cases)
+    assert any(sleep_ema(c['hist_state']) is None for c in cases)
+    assert any(not c['today_weight'] for c in cases) and any(c['profile'].body_fat_pct is None for c in cases)
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import pytest
+from macrocoach_v2.cli import main
+from macrocoach_v2.data.athletes import list_athletes
+
+def test_unknown_athlete_is_refused(capsys):
+    before = list_athletes()
+    with pytest.raises(SystemExit) as e:
+        main(['rollups', '--athlete', 'nobody-here'])
+    assert e.value.code == 2 and 'nobody-here' in capsys.readouterr().err
+    assert list_athletes() == before
+
+def test_existing_athlete_runs(athlete, capsys):
+    assert main(['rollups', '--athlete', athlete]) == 0
+    assert f'"athlete": "{athlete}"' in capsys.readouterr().out
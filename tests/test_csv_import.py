@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import io
+import uuid
+import zipfile
+import pandas as pd
+from macrocoach_v2.data.athletes import create_athlete, use_athlete
+from macrocoach_v2.data.csv_import import import_csv
+from macrocoach_v2.data.db import df_from_sql, init_db, upsert_targets
+from macrocoach_v2.data.export import export_bundle
+from macrocoach_v2.services.schedule import write_schedule
+
+_RES = {'target_kcal': 2100.0, 'protein_g': 160.0, 'fat_g': 60.0, 'carb_g': 230.0, 'bmr': 1700.0, 'pal': 1.45,
+        'tdee_used': 2550.0, 'tdee_formula': 2480.0, 'deficit': 450.0, 'ea': 38.0}
+_TARGETS = 'SELECT * FROM daily_targets ORDER BY date'
+
+def _round_trip(edit=None) -> str:
+    # 导出当前运动员的 daily_targets.csv → 导入到一个新运动员，返回新运动员名
+    with zipfile.ZipFile(export_bundle('csv')) as zf:
+        raw = zf.read('daily_targets.csv').decode('utf-8')
+    if edit is not None:
+        raw = pd.read_csv(io.StringIO(raw)).pipe(edit).to_csv(index=False)
+    other = f't{uuid.uuid4().hex[:10]}'
+    create_athlete(other)
+    with use_athlete(other):
+        init_db()
+        import_csv('daily_targets', io.StringIO(raw))
+    return other
+
+def test_targets_round_trip_keeps_tdee_formula(athlete):
+    upsert_targets('2026-03-01', _RES, notes='n', ea_guard_applied=0, day_type='deficit')
+    upsert_targets('2026-03-02', {**_RES, 'tdee_formula': 2400.0}, notes='', ea_guard_applied=1, day_type='maintain')
+    before = df_from_sql(_TARGETS)
+    with use_athlete(_round_trip()):
+        after = df_from_sql(_TARGETS)
+    pd.testing.assert_frame_equal(after, before, check_dtype=False)
+    assert after['tdee_formula'].tolist() == [2480.0, 2400.0]
+
+def test_old_export_without_new_columns(athlete):
+    # 旧版导出没有 tdee_formula / source：按迁移的做法补齐
+    upsert_targets('2026-03-01', _RES, notes='', ea_guard_applied=0, source='plan')
+    upsert_targets('2026-03-02', _RES, notes='回算', ea_guard_applied=0, source='backfill')
+    upsert_targets('2026-03-03', _RES, notes='预生成(cycle)', ea_guard_applied=0, source='schedule')
+    with use_athlete(_round_trip(lambda df: df.drop(columns=['tdee_formula', 'source']))):
+        after = df_from_sql(_TARGETS)
+    assert after['tdee_formula'].tolist() == [2550.0] * 3
+    assert after['source'].tolist() == ['plan', 'backfill', 'schedule']
+
+def test_imported_plan_rows_stay_protected_from_schedule(athlete):
+    upsert_targets('2026-03-01', _RES, notes='', ea_guard_applied=0, source='plan')
+    upsert_targets('2026-03-02', _RES, notes='', ea_guard_applied=0, source='backfill')
+    upsert_targets('2026-03-03', _RES, notes='', ea_guard_applied=0, source='schedule')
+    frame = pd.DataFrame({'date': ['2026-03-01', '2026-03-02', '2026-03-03'], 'target_kcal': 1800.0, 'protein_g': 150.0,
+                          'fat_g': 55.0, 'carb_g': 180.0, 'bmr': 1700.0, 'pal': 1.4, 'tdee_used': 2400.0, 'deficit': 600.0,
+                          'day_type': 'deficit'})
+    with use_athlete(_round_trip()):
+        assert df_from_sql(_TARGETS)['source'].tolist() == ['plan', 'backfill', 'schedule']
+        assert write_schedule(frame, 'cycle') == 1
+        after = df_from_sql(_TARGETS)
+    assert after['target_kcal'].tolist() == [2100.0, 2100.0, 1800.0]
+    assert after['source'].tolist() == ['plan', 'backfill', 'schedule']
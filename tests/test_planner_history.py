@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+import pandas as pd
+import pytest
+from macrocoach_v2.domain.history import loss_obs, sleep_ema, state_from_rows, trend_loss
+from macrocoach_v2.domain.models import PIDConfig, UserProfile
+from macrocoach_v2.services.batch_planner import hist_inputs
+from macrocoach_v2.services.planner import history_state_from_df, plan_day
+from macrocoach_v2.settings import TREND_MIN_WEIGHINS
+
+# plan_day(hist_state=…)、plan_day(dm_hist=…)、hist_inputs(dm_hist) 与库中的 metrics_state 用同一个趋势估计
+
+def _frame(rng: random.Random, n: int) -> pd.DataFrame:
+    w = rng.uniform(60, 100)
+    rows = []
+    for i in range(n):
+        w -= rng.uniform(-0.2, 0.4)
+        rows.append({'date': f'2026-02-{i + 1:02d}', 'weight': None if rng.random() < 0.3 else round(w, 1),
+                     'sleep_h': None if rng.random() < 0.2 else round(rng.uniform(5, 9), 1),
+                     'fatigue': rng.randint(1, 9), 'load_index': rng.uniform(0, 2000), 'perf_pct': 0.0})
+    return pd.DataFrame(rows).sample(frac=1.0, random_state=rng.randint(0, 1000))  # 乱序：两条路径都按日期排序
+
+def _plan(**hist):
+    prof = UserProfile('male', 30, 180.0, 80.0, 15.0)
+    return plan_day(prof, [], 8000, True, 0.6, PIDConfig(0.2, 0.05, 0.0), 4, 7.5, 0.0, False,
+                    hist.pop('dm_hist', None), None, **hist)
+
+@pytest.mark.parametrize('seed', range(20))
+def test_dataframe_and_state_paths_agree(seed):
+    rng = random.Random(seed)
+    df = _frame(rng, rng.randint(0, 28))
+    state = state_from_rows(df.sort_values('date').to_dict('records'))
+    lo, se = hist_inputs(df)
+    assert (math.isnan(lo) and loss_obs(state) is None) or lo == loss_obs(state)
+    assert (math.isnan(se) and sleep_ema(state) is None) or se == sleep_ema(state)
+    assert _plan(dm_hist=df) == _plan(hist_state=state)
+
+def test_dataframe_path_uses_trend_after_min_weighins():
+    # 称重次数够 TREND_MIN_WEIGHINS 但不足 8 次：7 对 7 均值无法计算，两条路径都用趋势斜率
+    df = pd.DataFrame({'date': [f'2026-02-{i + 1:02d}' for i in range(TREND_MIN_WEIGHINS)],
+                       'weight': [80.0 - 0.1 * i for i in range(TREND_MIN_WEIGHINS)]})
+    state = history_state_from_df(df)
+    assert TREND_MIN_WEIGHINS < 8 and trend_loss(state) is not None
+    assert hist_inputs(df)[0] == loss_obs(state) == max(0.0, trend_loss(state))
+    assert _plan(dm_hist=df)['weekly_loss_pct'] is not None
+
+def test_no_history():
+    assert history_state_from_df(None).n_weighins == 0
+    assert all(math.isnan(v) for v in hist_inputs(None))
+    assert all(math.isnan(v) for v in hist_inputs(pd.DataFrame(columns=['date', 'weight'])))
+    assert _plan(dm_hist=None) == _plan(dm_hist=pd.DataFrame(columns=['date', 'weight']))
+
+def test_stored_state_matches_dataframe(athlete):
+    # 逐日写入后库里增量维护的 metrics_state，与对同一张表现算的状态给出相同的趋势与睡眠护栏
+    from macrocoach_v2.data.db import df_from_sql, load_history_state, upsert_metrics
+    df = _frame(random.Random(7), 25).sort_values('date')
+    for r in df.to_dict('records'):
+        upsert_metrics(r['date'], {**r, 'steps': 8000, 'exercise_min': 0.0, 'avg_hr': None, 'max_hr': None})
+    stored = load_history_state()
+    fresh = history_state_from_df(df_from_sql('SELECT * FROM daily_metrics'))
+    assert loss_obs(stored) == pytest.approx(loss_obs(fresh), rel=0, abs=1e-12)
+    assert sleep_ema(stored) == sleep_ema(fresh)
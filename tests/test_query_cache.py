@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from macrocoach_v2.data.athletes import db_path
+from macrocoach_v2.data.db import df_from_sql, add_intake_row, cache_stats, upsert_targets
+
+_TARGETS = {'target_kcal': 2000.0, 'protein_g': 150.0, 'fat_g': 60.0, 'carb_g': 200.0, 'bmr': 1700.0,
+            'pal': 1.4, 'tdee_used': 2400.0, 'deficit': 0.2, 'ea': 35.0}
+
+def _count() -> int:
+    return int(df_from_sql('SELECT COUNT(*) AS n FROM daily_targets')['n'].iloc[0])
+
+def test_write_from_another_connection_invalidates_cache(athlete):
+    assert _count() == 0
+    assert _count() == 0  # 已缓存
+    ext = sqlite3.connect(db_path())
+    with ext:
+        ext.execute("INSERT INTO daily_targets(date, target_kcal) VALUES('2026-01-01', 1800)")
+    ext.close()
+    assert _count() == 1
+
+def test_own_writes_keep_unrelated_queries_cached(athlete):
+    upsert_targets('2026-01-01', _TARGETS, '', 0)
+    assert _count() == 1
+    hits = cache_stats()['hits']
+    add_intake_row('2026-01-01', '午餐', 500, 30, 10, 60)
+    assert _count() == 1
+    assert cache_stats()['hits'] == hits + 1
+
+def test_own_write_then_external_write(athlete):
+    upsert_targets('2026-01-01', _TARGETS, '', 0)
+    assert _count() == 1
+    ext = sqlite3.connect(db_path())
+    with ext:
+        ext.execute("DELETE FROM daily_targets")
+    ext.close()
+    assert _count() == 0